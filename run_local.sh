@@ -10,7 +10,7 @@ usage() {
     echo
     echo "  * Services  : internal_api | data_report | financial_data_reader"
     echo "  * Utilities : shell | mongosh | static_analysis | format | add_user | remove_user | bump_version [version_number] | setup_git_hooks"
-    echo "  * Tests     : test_unit | test_integration | test_functional"
+    echo "  * Tests     : test_unit | test_integration | test_functional | benchmark [benchmark_args] | benchmark_storage [benchmark_args]"
     echo "  * Reports   : make_slides"
     echo
     echo "For example : '${0} static_analysis'"
@@ -100,6 +100,14 @@ make_slides)
     pandoc -t revealjs -s -o docs/presentation/index.html -V revealjs-url=https://unpkg.com/reveal.js/ --include-in-header=docs/presentation/slides.css -V theme=serif --slide-level=2 docs/presentation/slides.md
     ;;
 
+benchmark)
+    pdm run python -m tests.benchmarks.ingestion "$@"
+    ;;
+
+benchmark_storage)
+    pdm run python -m tests.benchmarks.storage_layouts "$@"
+    ;;
+
 test_unit)
     pdm run pytest tests/unit
     ;;
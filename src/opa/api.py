@@ -1,11 +1,19 @@
+from datetime import datetime
 from typing import Annotated, Optional
 
 from loguru import logger
-from fastapi import FastAPI, Query, Depends, HTTPException
+from fastapi import FastAPI, Query, Depends, HTTPException, Response
+from fastapi.responses import ORJSONResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 
-from opa.core.financial_data import StockValue, StockValueKind, CompanyInfo
-from opa.storage import opa_storage
+from opa.core.financial_data import (
+    StockValue,
+    StockValueKind,
+    StockValueResolution,
+    CompanyInfo,
+)
+from opa.core.storage import page_cursor
+from opa.storage import get_opa_storage
 from opa.auth import opa_auth
 
 
@@ -24,14 +32,14 @@ def check_user(credentials: HTTPBasicCredentials):
 @app.get("/tickers")
 async def all_tickers(credentials: CredentialsType) -> list[str]:
     check_user(credentials)
-    return opa_storage.get_all_tickers()
+    return get_opa_storage().get_all_tickers()
 
 
 @app.get("/company_infos/{ticker}")
 async def get_company_info(ticker: str, credentials: CredentialsType) -> CompanyInfo:
     """Get information from one specific company"""
     check_user(credentials)
-    return opa_storage.get_company_infos([ticker])[ticker]
+    return get_opa_storage().get_company_infos([ticker])[ticker]
 
 
 @app.get("/company_infos")
@@ -40,7 +48,7 @@ async def get_company_infos(
 ) -> dict[str, CompanyInfo]:
     """Get information from a list of companies"""
     check_user(credentials)
-    return opa_storage.get_company_infos(tickers)
+    return get_opa_storage().get_company_infos(tickers)
 
 
 @app.get("/{ticker}")
@@ -48,12 +56,65 @@ async def get_stock_values(
     ticker: str,
     kind: StockValueKind,
     credentials: CredentialsType,
+    response: Response,
     limit: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    resolution: Optional[StockValueResolution] = None,
 ) -> list[StockValue]:
+    """Get the latest values of a ticker between `start` and `end`, most recent first,
+    or the bars of the values over each period of a `resolution`.
+
+    When there may be more values, the `X-Next-Cursor` header of the response holds the
+    `cursor` to get the next page of values with."""
     check_user(credentials)
 
-    kwargs: dict[str, int] = {}
-    if limit is not None:
-        kwargs |= dict(limit=limit)
+    kwargs = values_kwargs(limit, start, end, cursor, resolution)
+    try:
+        values = get_opa_storage().get_values(ticker, kind, **kwargs)
+    except ValueError as err:
+        raise HTTPException(400, str(err))
+
+    if values and len(values) == kwargs.get("limit", 500):
+        response.headers["X-Next-Cursor"] = page_cursor(values[-1])
+
+    return values
+
+
+@app.get("/{ticker}/columns", response_class=ORJSONResponse)
+async def get_stock_values_columns(
+    ticker: str,
+    kind: StockValueKind,
+    credentials: CredentialsType,
+    limit: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    resolution: Optional[StockValueResolution] = None,
+) -> ORJSONResponse:
+    """Same values as `/{ticker}`, as lists of the values of each field (with dates
+    as numbers of milliseconds since the epoch), most recent first"""
+    check_user(credentials)
 
-    return opa_storage.get_values(ticker, kind, **kwargs)
+    kwargs = values_kwargs(limit, start, end, cursor, resolution)
+    try:
+        columns = get_opa_storage().get_values_columnar(ticker, kind, **kwargs)
+    except ValueError as err:
+        raise HTTPException(400, str(err))
+
+    return ORJSONResponse(columns.as_dict())
+
+
+def values_kwargs(
+    limit: Optional[int],
+    start: Optional[datetime],
+    end: Optional[datetime],
+    cursor: Optional[str],
+    resolution: Optional[StockValueResolution],
+) -> dict:
+    """Arguments of `Storage.get_values` that were given, others keep their default"""
+    kwargs = dict(
+        limit=limit, start=start, end=end, cursor=cursor, resolution=resolution
+    )
+    return {k: v for (k, v) in kwargs.items() if v is not None}
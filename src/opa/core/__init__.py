@@ -5,7 +5,12 @@ from .financial_data import (
     StockCollectionStats,
     StockValueKind,
     StockValueSerieGranularity,
+    ImportCheckpoint,
+    InsertResult,
+    StockValueColumns,
+    StockValueResolution,
+    StockValueRollup,
 )
-from .providers import StockMarketProvider
-from .storage import Storage
+from .providers import StockMarketProvider, AsyncStockMarketProvider
+from .storage import Storage, page_cursor
 from .financial_data_reader import FinancialDataReader
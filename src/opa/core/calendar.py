@@ -0,0 +1,137 @@
+"""
+Calendar of the US stock exchanges (NYSE, NASDAQ), on which all the tickers handled
+by this project are traded.
+
+Only the regular holidays are known, exceptional closures (e.g. national days of
+mourning) are not.
+"""
+
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Iterator
+from zoneinfo import ZoneInfo
+
+
+market_timezone = ZoneInfo("America/New_York")
+market_open_time = time(9, 30)
+market_close_time = time(16)
+early_close_time = time(13)
+
+
+def _easter(year: int) -> date:
+    # "Anonymous Gregorian algorithm", see https://en.wikipedia.org/wiki/Date_of_Easter
+    a = year % 19
+    b, c = divmod(year, 100)
+    d, e = divmod(b, 4)
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return date(year, month, day + 1)
+
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> date:
+    """The `n`-th `weekday` (0 is Monday) of a month, or the last one if `n` is -1"""
+    if n > 0:
+        first = date(year, month, 1)
+        return first + timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    else:
+        next_month = date(year + month // 12, month % 12 + 1, 1)
+        last = next_month - timedelta(days=1)
+        return last - timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day: date) -> date:
+    # Holidays falling on a Saturday are observed on the Friday before, and those
+    # falling on a Sunday are observed on the Monday after.
+    match day.weekday():
+        case 5:
+            return day - timedelta(days=1)
+        case 6:
+            return day + timedelta(days=1)
+        case _:
+            return day
+
+
+@lru_cache
+def market_holidays(year: int) -> frozenset[date]:
+    holidays = {
+        _nth_weekday(year, 1, 0, 3),  # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),  # Washington's Birthday
+        _easter(year) - timedelta(days=2),  # Good Friday
+        _nth_weekday(year, 5, 0, -1),  # Memorial Day
+        _observed(date(year, 7, 4)),  # Independence Day
+        _nth_weekday(year, 9, 0, 1),  # Labor Day
+        _nth_weekday(year, 11, 3, 4),  # Thanksgiving Day
+        _observed(date(year, 12, 25)),  # Christmas
+    }
+
+    # New Year's Day is not observed on the Friday before if it falls on a Saturday
+    new_year = _observed(date(year, 1, 1))
+    if new_year.year == year:
+        holidays.add(new_year)
+
+    if year >= 2022:
+        holidays.add(_observed(date(year, 6, 19)))  # Juneteenth
+
+    return frozenset(holidays)
+
+
+@lru_cache
+def early_closes(year: int) -> frozenset[date]:
+    """Days on which markets close at 13:00"""
+    candidates = {
+        date(year, 7, 3),  # Day before Independence Day
+        _nth_weekday(year, 11, 3, 4) + timedelta(days=1),  # Day after Thanksgiving
+        date(year, 12, 24),  # Christmas Eve
+    }
+
+    return frozenset(d for d in candidates if is_trading_day(d))
+
+
+def market_hours(day: date) -> tuple[datetime, datetime]:
+    """Opening and closing times of the market on a trading day"""
+    close = early_close_time if day in early_closes(day.year) else market_close_time
+    return (
+        datetime.combine(day, market_open_time, market_timezone),
+        datetime.combine(day, close, market_timezone),
+    )
+
+
+def next_market_close(now: datetime) -> datetime:
+    """First closing of the market strictly after `now` (a timezone-aware datetime)"""
+    day = now.astimezone(market_timezone).date()
+    while True:
+        if is_trading_day(day) and (close := market_hours(day)[1]) > now:
+            return close
+        day += timedelta(days=1)
+
+
+def next_daily_publication(now: datetime, delay: timedelta) -> datetime:
+    """First time strictly after `now` at which the daily values of a trading day are
+    published, assuming they are `delay` after the market closes"""
+    return next_market_close(now - delay) + delay
+
+
+def is_trading_day(day: date) -> bool:
+    return day.weekday() < 5 and day not in market_holidays(day.year)
+
+
+def next_trading_day(day: date) -> date:
+    """The first trading day strictly after `day`"""
+    day += timedelta(days=1)
+    while not is_trading_day(day):
+        day += timedelta(days=1)
+
+    return day
+
+
+def trading_days(start: date, end: date) -> Iterator[date]:
+    """All the trading days between `start` and `end` (both inclusive)"""
+    day = start if is_trading_day(start) else next_trading_day(start)
+    while day <= end:
+        yield day
+        day = next_trading_day(day)
@@ -0,0 +1,55 @@
+from bisect import bisect_right
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Iterable
+
+from opa.core.calendar import next_trading_day, trading_days
+
+
+DayRange = tuple[date, date]
+
+
+@dataclass
+class SeriesCoverage:
+    """The days for which a serie of values is stored, as a sorted list of
+    non-overlapping ranges of consecutive trading days (both bounds inclusive).
+
+    A day is covered as soon as one value is stored for it."""
+
+    ranges: list[DayRange] = field(default_factory=list)
+
+    @staticmethod
+    def from_dates(dates: Iterable[datetime | date]) -> "SeriesCoverage":
+        days = sorted({d.date() if isinstance(d, datetime) else d for d in dates})
+
+        ranges: list[DayRange] = []
+        for day in days:
+            if ranges and day <= next_trading_day(ranges[-1][1]):
+                ranges[-1] = (ranges[-1][0], day)
+            else:
+                ranges.append((day, day))
+
+        return SeriesCoverage(ranges)
+
+    def covers(self, day: date) -> bool:
+        idx = bisect_right(self.ranges, (day, date.max)) - 1
+        return idx >= 0 and self.ranges[idx][0] <= day <= self.ranges[idx][1]
+
+    def missing(self, start: date, end: date) -> list[DayRange]:
+        """The ranges of trading days between `start` and `end` (both inclusive) that
+        are not covered"""
+        ret: list[DayRange] = []
+        gap: DayRange | None = None
+
+        for day in trading_days(start, end):
+            if self.covers(day):
+                if gap is not None:
+                    ret.append(gap)
+                    gap = None
+            else:
+                gap = (gap[0] if gap is not None else day, day)
+
+        if gap is not None:
+            ret.append(gap)
+
+        return ret
@@ -1,15 +1,26 @@
 from abc import abstractmethod
-from datetime import datetime
+from array import array
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 from enum import Enum
 
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 
 class StockValueSerieGranularity(Enum):
     FINE = "fine"
     COARSE = "coarse"
 
+    @property
+    def interval(self) -> int:
+        """Interval of the values of the series of that granularity, in seconds"""
+        match self:
+            case StockValueSerieGranularity.FINE:
+                return 15 * 60
+            case StockValueSerieGranularity.COARSE:
+                return 24 * 60 * 60
+
 
 class StockValueKind(Enum):
     SIMPLE = "simple"
@@ -26,6 +37,200 @@ class StockValue(BaseModel):
     high: float | None = None
     volume: int | None = None
 
+    @property
+    def kind(self) -> StockValueKind:
+        return StockValueKind.SIMPLE if self.open is None else StockValueKind.OHLC
+
+
+# Dates without a timezone are in UTC, as MongoDB returns them
+_EPOCH = datetime(1970, 1, 1)
+
+
+def naive_utc(date: datetime) -> datetime:
+    """The `date` in UTC without time zone, as the dates of the values stored"""
+    if date.tzinfo is not None:
+        date = date.astimezone(timezone.utc).replace(tzinfo=None)
+    return date
+
+
+def epoch_milliseconds(date: datetime) -> int:
+    return (naive_utc(date) - _EPOCH) // timedelta(milliseconds=1)
+
+
+def from_epoch_milliseconds(milliseconds: int) -> datetime:
+    return _EPOCH + timedelta(milliseconds=milliseconds)
+
+
+@dataclass
+class StockValueColumns:
+    """Stock values of a ticker as typed columns, most recent first, which are cheaper
+    to build and to serialize than as many `StockValue`s.
+
+    Dates are numbers of milliseconds since the epoch. The OHLC columns are only filled
+    in for OHLC values."""
+
+    ticker: str
+    kind: StockValueKind
+    date: array = field(default_factory=lambda: array("q"))
+    interval: array = field(default_factory=lambda: array("q"))
+    close: array = field(default_factory=lambda: array("d"))
+    open: array = field(default_factory=lambda: array("d"))
+    low: array = field(default_factory=lambda: array("d"))
+    high: array = field(default_factory=lambda: array("d"))
+    volume: array = field(default_factory=lambda: array("q"))
+
+    @property
+    def fields(self) -> list[str]:
+        """Names of the columns of values of that kind"""
+        simple = ["date", "interval", "close"]
+        if self.kind == StockValueKind.OHLC:
+            return simple + ["open", "low", "high", "volume"]
+        return simple
+
+    @classmethod
+    def from_values(
+        cls, ticker: str, kind: StockValueKind, values: list[StockValue]
+    ) -> "StockValueColumns":
+        columns = cls(ticker, kind)
+        columns.date.extend(epoch_milliseconds(v.date) for v in values)
+        for name in columns.fields[1:]:
+            getattr(columns, name).extend(getattr(v, name) for v in values)
+
+        return columns
+
+    def as_dict(self) -> dict[str, list]:
+        return {name: getattr(self, name).tolist() for name in self.fields}
+
+    def __len__(self) -> int:
+        return len(self.date)
+
+
+class StockValueResolution(Enum):
+    """Durations of the periods over which stock values are rolled up"""
+
+    HOUR = "1h"
+    DAY = "1d"
+    WEEK = "1w"
+    MONTH = "1mo"
+
+    @property
+    def interval(self) -> int:
+        """Duration of the periods in seconds, 30 days for months"""
+        match self:
+            case StockValueResolution.HOUR:
+                return 60 * 60
+            case StockValueResolution.DAY:
+                return 24 * 60 * 60
+            case StockValueResolution.WEEK:
+                return 7 * 24 * 60 * 60
+            case StockValueResolution.MONTH:
+                return 30 * 24 * 60 * 60
+
+    def period_start(self, date: datetime) -> datetime:
+        """Start of the period that holds `date`, weeks starting on Mondays"""
+        hour = date.replace(minute=0, second=0, microsecond=0)
+        match self:
+            case StockValueResolution.HOUR:
+                return hour
+            case StockValueResolution.DAY:
+                return hour.replace(hour=0)
+            case StockValueResolution.WEEK:
+                return hour.replace(hour=0) - timedelta(days=date.weekday())
+            case StockValueResolution.MONTH:
+                return hour.replace(day=1, hour=0)
+
+
+class StockValueRollup(BaseModel):
+    """Stock values of a ticker over a period of a resolution, rolled up into a single
+    bar dated at the start of the period.
+
+    Each rollup is made of values of a single `interval`, as values of different
+    intervals overlap (e.g. a daily value and the 15 minutes values of the same day).
+    The dates of the first and last values are kept, so that rollups of values of the
+    same period and interval can be merged in any order."""
+
+    ticker: str
+    kind: StockValueKind
+    resolution: StockValueResolution
+    date: datetime
+    # Interval of the values rolled up
+    interval: int
+    first_date: datetime
+    last_date: datetime
+    close: float
+    open: float | None = None
+    low: float | None = None
+    high: float | None = None
+    volume: int | None = None
+
+    @classmethod
+    def of_values(
+        cls, values: list[StockValue], resolution: StockValueResolution
+    ) -> list["StockValueRollup"]:
+        """Rollups of the values whose interval is not longer than the periods, one per
+        period and interval of the values"""
+        periods: dict[tuple[str, StockValueKind, int, datetime], list[StockValue]] = {}
+        for v in values:
+            if v.interval <= resolution.interval:
+                key = (v.ticker, v.kind, v.interval, resolution.period_start(v.date))
+                periods.setdefault(key, []).append(v)
+
+        ret = []
+        for (ticker, kind, interval, start), period_values in periods.items():
+            first = min(period_values, key=lambda v: v.date)
+            last = max(period_values, key=lambda v: v.date)
+            rollup = cls(
+                ticker=ticker,
+                kind=kind,
+                resolution=resolution,
+                date=start,
+                interval=interval,
+                first_date=first.date,
+                last_date=last.date,
+                close=last.close,
+            )
+            if kind == StockValueKind.OHLC:
+                rollup.open = first.open
+                rollup.low = min(v.low for v in period_values)  # type: ignore
+                rollup.high = max(v.high for v in period_values)  # type: ignore
+                rollup.volume = sum(v.volume for v in period_values)  # type: ignore
+
+            ret.append(rollup)
+
+        return ret
+
+    def merge(self, other: "StockValueRollup") -> "StockValueRollup":
+        """Rollup of the values of both rollups, which are of the same period and
+        interval"""
+        first = min(self, other, key=lambda r: r.first_date)
+        last = max(self, other, key=lambda r: r.last_date)
+        update: dict = {
+            "first_date": first.first_date,
+            "last_date": last.last_date,
+            "close": last.close,
+        }
+        if self.kind == StockValueKind.OHLC:
+            update |= {
+                "open": first.open,
+                "low": min(self.low, other.low),  # type: ignore
+                "high": max(self.high, other.high),  # type: ignore
+                "volume": self.volume + other.volume,  # type: ignore
+            }
+
+        return self.model_copy(update=update)
+
+    def as_stock_value(self) -> StockValue:
+        return StockValue(
+            ticker=self.ticker,
+            date=self.date,
+            close=self.close,
+            interval=self.resolution.interval,
+            open=self.open,
+            low=self.low,
+            high=self.high,
+            volume=self.volume,
+        )
+
 
 class StockValueMixin:
     @abstractmethod
@@ -57,3 +262,24 @@ class StockCollectionStats(BaseModel):
     latest: datetime
     oldest: datetime
     count: int
+
+
+class InsertResult(BaseModel):
+    """Outcome of the insertion of stock values"""
+
+    inserted: int
+    # Values that were already stored
+    skipped: int
+    # Values that the storage rejected
+    invalid: int
+
+
+class ImportCheckpoint(BaseModel):
+    """Marks that all the values of a serie of a ticker were imported during a run"""
+
+    model_config = ConfigDict(frozen=True)
+
+    run_id: str
+    ticker: str
+    kind: StockValueKind
+    granularity: StockValueSerieGranularity
@@ -1,40 +1,91 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
+from datetime import date, datetime, time
+from itertools import islice
+from queue import Full, Queue
+from threading import Event
+from typing import Iterable, Iterator
 
 from loguru import logger
 
 from opa.core.financial_data import (
+    ImportCheckpoint,
     StockValue,
     StockValueSerieGranularity,
     StockValueKind,
 )
-from opa.core.providers import StockMarketProvider
+from opa.core.coverage import SeriesCoverage
+from opa.core.providers import StockMarketProvider, AsyncStockMarketProvider
 from opa.core.storage import Storage
 
 
+Serie = tuple[StockValueKind, StockValueSerieGranularity]
+# Values of a ticker
+Batch = tuple[str, list[StockValue]]
+# A serie of a ticker
+Unit = tuple[str, StockValueKind, StockValueSerieGranularity]
+
+
+@dataclass
+class _EndOfChunk:
+    """Marks the end of the values fetched for one chunk of tickers in a `_fetch_series`
+    queue. The values of the chunk were all fetched if `completed`."""
+
+    tickers: list[str]
+    completed: bool
+
+
 @dataclass
 class FinancialDataReader:
+    """Imports data from a provider into a storage.
+
+    Values flow from the provider to the storage through a pipeline : each ticker's values
+    are sent in batches of at most `batch_size` values to a bounded queue, from which
+    they are filtered and inserted while other values are still being fetched. Fetching
+    is put on hold as long as `max_pending_batches` batches of a serie wait to be inserted,
+    so that memory use does not depend on the number of tickers or on history depth."""
+
     provider: StockMarketProvider
     storage: Storage
+    # Maximum number of requests made concurrently to the provider
+    max_workers: int = 1
+    # Fetch values from within an event loop instead of a pool of threads. This
+    # requires the provider to also be an `AsyncStockMarketProvider`.
+    use_async: bool = False
+    batch_size: int = 10_000
+    max_pending_batches: int = 8
+
+    def run(self, tickers: list[str], run_id: str | None = None):
+        """Import the company info and all the series of the `tickers`.
+
+        With a `run_id`, each serie of a ticker whose values are all stored is recorded
+        in the storage, so that a run started again with the same id (e.g. after a
+        crash) skips those series and only imports the others. These checkpoints are
+        deleted once the run is over."""
+        done = self._get_checkpoints(run_id)
+        if done:
+            logger.info(
+                "Resuming run {run_id}, {nb} series of tickers were already imported",
+                run_id=run_id,
+                nb=len(done),
+            )
 
-    def run(self, tickers):
         self.import_company_info(tickers)
-        self.import_stock_values(
-            tickers,
-            StockValueKind.SIMPLE,
-            StockValueSerieGranularity.COARSE,
-        )
-        self.import_stock_values(
-            tickers,
-            StockValueKind.OHLC,
-            StockValueSerieGranularity.FINE,
-        )
-        # Coarse-grained values are imported AFTER fine-grained values so that
-        # fine-grained values are always stored in priority.
-        self.import_stock_values(
-            tickers,
-            StockValueKind.OHLC,
-            StockValueSerieGranularity.COARSE,
-        )
+
+        series = [
+            (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE),
+            (StockValueKind.OHLC, StockValueSerieGranularity.FINE),
+            # Coarse-grained values are imported AFTER fine-grained values so that
+            # fine-grained values are always stored in priority.
+            (StockValueKind.OHLC, StockValueSerieGranularity.COARSE),
+        ]
+
+        for (kind, granularity), batches in self._fetch_series(tickers, series, done):
+            self._store_new_values(batches, kind, granularity, run_id)
+
+        if run_id is not None:
+            self.storage.delete_checkpoints(run_id)
 
     def import_company_info(self, tickers: list[str]):
         infos = self.provider.get_company_info(tickers)
@@ -45,42 +96,362 @@ class FinancialDataReader:
         tickers: list[str],
         kind: StockValueKind,
         granularity: StockValueSerieGranularity,
+    ) -> int:
+        """Import the values of one serie, and return the number of values inserted"""
+        nb_inserted = 0
+        for _, batches in self._fetch_series(tickers, [(kind, granularity)]):
+            nb_inserted += self._store_new_values(batches, kind, granularity)
+
+        return nb_inserted
+
+    def backfill(
+        self,
+        tickers: list[str],
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: date,
+        end: date | None = None,
     ) -> list[StockValue]:
-        # TODO: `storage.get_stats` should evolve to not make stats on data that has granularity
-        # difference (ie take "interval" into account).
-        stats = self.storage.get_stats(kind)
+        """Import the values of all the trading days between `start` and `end` (both
+        inclusive, `end` defaults to today) for which no value of that serie is stored,
+        e.g. because of failed runs.
 
-        api_values = {
-            ticker: self.provider.get_stock_values(ticker, kind, granularity)
+        Only the missing ranges of days are requested to the provider."""
+        end = end or date.today()
+        gaps = {
+            ticker: SeriesCoverage.from_dates(
+                self.storage.get_dates(ticker, kind, granularity.interval)
+            ).missing(start, end)
             for ticker in tickers
         }
 
-        # Filter out all the values that are within the same time range as those
-        # already stored
-        new_values = {
-            ticker: [
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            fetches = [
+                (
+                    gap,
+                    executor.submit(
+                        self.provider.get_stock_values,
+                        ticker,
+                        kind,
+                        granularity,
+                        start=datetime.combine(gap[0], time.min),
+                        end=datetime.combine(gap[1], time.max),
+                    ),
+                )
+                for (ticker, ticker_gaps) in gaps.items()
+                for gap in ticker_gaps
+            ]
+
+            # Providers may return more values than those requested
+            new_values = [
                 v
-                for v in v_list
+                for ((first, last), f) in fetches
+                for v in f.result()
+                if first <= v.date.date() <= last
+            ]
+
+        logger.info(
+            "Backfilling {nb_gaps} gaps in '{kind}' values of {nb_tickers} tickers with {nb} values",
+            nb_gaps=len(fetches),
+            kind=kind.value,
+            nb_tickers=len(tickers),
+            nb=len(new_values),
+        )
+        if new_values:
+            self.storage.insert_values(new_values)
+
+        return new_values
+
+    def _fetch_series(
+        self, tickers: list[str], series: list[Serie], done: set[Unit] | None = None
+    ) -> Iterator[tuple[Serie, Iterator[Batch | _EndOfChunk]]]:
+        """Fetch the values of all the `series` for all the `tickers` concurrently,
+        and yield them serie by serie, in the order of `series`, as batches of values
+        of one ticker, followed by the end of their chunk of tickers.
+
+        The batches of a serie must all be consumed before getting the next serie.
+
+        Only the values that are more recent than those already stored are requested,
+        and the series of tickers that are `done` are not requested at all."""
+        starts = self._get_fetch_starts(series)
+        done = done or set()
+        remaining = {
+            serie: [t for t in tickers if (t, *serie) not in done] for serie in series
+        }
+        chunks = {
+            serie: self._chunks(remaining[serie], serie, starts[serie])
+            for serie in series
+        }
+        queues = {serie: Queue(maxsize=self.max_pending_batches) for serie in series}
+        # Set when the consumer stopped, so that producers do not wait for it forever
+        stop = Event()
+
+        executor = ThreadPoolExecutor(
+            max_workers=1 if self.use_async else self.max_workers
+        )
+        try:
+            if self.use_async:
+                producers = [
+                    executor.submit(
+                        asyncio.run,
+                        self._produce_async(remaining, starts, queues, stop),
+                    )
+                ]
+            else:
+                producers = [
+                    executor.submit(
+                        self._produce,
+                        queues[serie],
+                        stop,
+                        chunk,
+                        *serie,
+                        start=self._chunk_start(chunk, starts[serie]),
+                    )
+                    for serie in series
+                    for chunk in chunks[serie]
+                ]
+
+            for serie in series:
+                yield serie, self._consume(queues[serie], len(chunks[serie]))
+
+            # Any error that occurred while fetching is raised here
+            for p in producers:
+                p.result()
+
+        finally:
+            stop.set()
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _chunks(
+        self, tickers: list[str], serie: Serie, starts: dict[str, datetime]
+    ) -> list[list[str]]:
+        """Split the tickers into groups whose values are fetched with a single request.
+
+        As the values of a group are all requested from the same date, tickers are
+        grouped with those whose values are requested from close dates."""
+        size = 1 if self.use_async else self.provider.max_tickers_per_request(*serie)
+        ordered = sorted(tickers, key=lambda t: starts.get(t, datetime.min))
+        return [ordered[idx : idx + size] for idx in range(0, len(ordered), size)]
+
+    @staticmethod
+    def _chunk_start(chunk: list[str], starts: dict[str, datetime]) -> datetime | None:
+        if any(ticker not in starts for ticker in chunk):
+            return None
+        return min(starts[ticker] for ticker in chunk)
+
+    def _produce(
+        self,
+        queue: Queue,
+        stop: Event,
+        tickers: list[str],
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None,
+    ) -> None:
+        completed = False
+        try:
+            # The values of a single ticker are streamed value by value, while those of
+            # several tickers come from a single response, ticker by ticker.
+            if len(tickers) == 1:
+                [ticker] = tickers
+                values = self.provider.iter_stock_values(
+                    ticker, kind, granularity, start=start
+                )
+                while batch := list(islice(values, self.batch_size)):
+                    if not self._put(queue, (ticker, batch), stop):
+                        return
+            else:
+                all_values = self.provider.iter_stock_values_batch(
+                    tickers, kind, granularity, start=start
+                )
+                for ticker, values in all_values:
+                    for idx in range(0, len(values), self.batch_size):
+                        batch = (ticker, values[idx : idx + self.batch_size])
+                        if not self._put(queue, batch, stop):
+                            return
+
+            completed = True
+        finally:
+            self._put(queue, _EndOfChunk(tickers, completed), stop)
+
+    async def _produce_async(
+        self,
+        tickers: dict[Serie, list[str]],
+        starts: dict[Serie, dict[str, datetime]],
+        queues: dict[Serie, Queue],
+        stop: Event,
+    ) -> None:
+        provider = self.provider
+        if not isinstance(provider, AsyncStockMarketProvider):
+            for serie, serie_tickers in tickers.items():
+                for ticker in serie_tickers:
+                    self._put(queues[serie], _EndOfChunk([ticker], False), stop)
+
+            raise TypeError(f"{type(provider).__name__} cannot be used asynchronously")
+
+        in_flight = asyncio.Semaphore(self.max_workers)
+
+        async def fetch(ticker: str, serie: Serie) -> None:
+            queue = queues[serie]
+            completed = False
+            try:
+                async with in_flight:
+                    values = await provider.get_stock_values_async(
+                        ticker, *serie, start=starts[serie].get(ticker)
+                    )
+
+                for idx in range(0, len(values), self.batch_size):
+                    batch = (ticker, values[idx : idx + self.batch_size])
+                    if not await asyncio.to_thread(self._put, queue, batch, stop):
+                        return
+
+                completed = True
+            finally:
+                end = _EndOfChunk([ticker], completed)
+                await asyncio.to_thread(self._put, queue, end, stop)
+
+        # Series are fetched one after the other, so that waiting for the values of
+        # a serie to be inserted never prevents those of the previous series from
+        # being fetched.
+        errors = []
+        try:
+            for serie, serie_tickers in tickers.items():
+                results = await asyncio.gather(
+                    *(fetch(ticker, serie) for ticker in serie_tickers),
+                    return_exceptions=True,
+                )
+                errors += [r for r in results if isinstance(r, BaseException)]
+        finally:
+            await provider.close_async()
+
+        if errors:
+            raise errors[0]
+
+    @staticmethod
+    def _put(queue: Queue, item, stop: Event) -> bool:
+        """Put an item in a bounded queue, waiting for room in the queue as long as the
+        consumer is running. Return whether the item was put."""
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                ...
+
+        return False
+
+    @staticmethod
+    def _consume(queue: Queue, nb_chunks: int) -> Iterator[Batch | _EndOfChunk]:
+        remaining = nb_chunks
+        while remaining:
+            item = queue.get()
+            if isinstance(item, _EndOfChunk):
+                remaining -= 1
+            yield item
+
+    def _get_checkpoints(self, run_id: str | None) -> set[Unit]:
+        if run_id is None:
+            return set()
+
+        return {
+            (c.ticker, c.kind, c.granularity)
+            for c in self.storage.get_checkpoints(run_id)
+        }
+
+    def _get_fetch_starts(
+        self, series: list[Serie]
+    ) -> dict[Serie, dict[str, datetime]]:
+        """Get the date from which the values of each serie must be fetched for each
+        ticker, i.e. the date of the latest value of the serie stored (which is fetched
+        again so that values from a day that was not over on the previous run are
+        completed)"""
+        return {
+            (kind, granularity): {
+                ticker: stats.latest
+                for (ticker, stats) in self.storage.get_stats(
+                    kind, granularity.interval
+                ).items()
+            }
+            for (kind, granularity) in series
+        }
+
+    def _store_new_values(
+        self,
+        batches: Iterable[Batch | _EndOfChunk],
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        run_id: str | None = None,
+    ) -> int:
+        stats = self.storage.get_stats(kind, granularity.interval)
+
+        nb_fetched = 0
+        nb_inserted = 0
+        new_values: list[StockValue] = []
+        # Tickers whose values were all fetched, and are all stored once the pending
+        # new values are
+        fetched: list[str] = []
+
+        for item in batches:
+            if isinstance(item, _EndOfChunk):
+                if item.completed:
+                    fetched += item.tickers
+                continue
+
+            ticker, batch = item
+            nb_fetched += len(batch)
+
+            # Filter out all the values that are within the same time range as those
+            # already stored
+            new_values += [
+                v
+                for v in batch
                 if ticker not in stats.keys()
                 or v.date > stats[ticker].latest
                 or v.date < stats[ticker].oldest
             ]
-            for (ticker, v_list) in api_values.items()
-        }
 
-        # Flatten all the values
-        all_new_values = [v for v_list in new_values.values() for v in v_list]
-        if all_new_values:
-            self.storage.insert_values(all_new_values)
-        else:
+            if len(new_values) >= self.batch_size:
+                self.storage.insert_values(new_values)
+                nb_inserted += len(new_values)
+                new_values = []
+
+                self._save_checkpoints(run_id, fetched, kind, granularity)
+                fetched = []
+
+        if new_values:
+            self.storage.insert_values(new_values)
+            nb_inserted += len(new_values)
+
+        self._save_checkpoints(run_id, fetched, kind, granularity)
+
+        if not nb_inserted:
             logger.info(
                 (
                     "{nb} '{kind}' {granularity}-grained values fetched by the reader were discarded because "
                     "they cover a timespan already present in the storage"
                 ),
-                nb=len([v for v_list in api_values.values() for v in v_list]),
+                nb=nb_fetched,
                 kind=kind.value,
                 granularity=granularity.value,
             )
 
-        return all_new_values
+        return nb_inserted
+
+    def _save_checkpoints(
+        self,
+        run_id: str | None,
+        tickers: list[str],
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+    ):
+        if run_id is None or not tickers:
+            return
+
+        self.storage.insert_checkpoints(
+            [
+                ImportCheckpoint(
+                    run_id=run_id, ticker=t, kind=kind, granularity=granularity
+                )
+                for t in tickers
+            ]
+        )
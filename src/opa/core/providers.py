@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import Iterator
 
 from opa.core import (
     StockValue,
@@ -9,23 +11,118 @@ from opa.core import (
 
 
 class StockMarketProvider(ABC):
+    """Providers of stock values.
+
+    `start` and `end` are optional bounds (both inclusive) on the dates of the values to
+    get, which let providers download only part of a serie. Providers must return at least
+    all the values within those bounds, but may return more."""
+
+    # Time after the close of the market at which the daily values of a trading day
+    # are published by the provider
+    daily_publication_delay = timedelta(0)
+
+    def provides(
+        self, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> bool:
+        """Whether this provider can provide the values of that kind and granularity"""
+        return True
+
     @abstractmethod
     def get_stock_values(
         self,
         ticker: str,
         kind: StockValueKind,
         granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
     ) -> list[StockValue]:
         ...
 
+    def iter_stock_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> Iterator[StockValue]:
+        """Same as `get_stock_values`, but providers may yield values as soon as
+        they are received instead of holding the whole serie in memory"""
+        yield from self.get_stock_values(
+            ticker, kind, granularity, start=start, end=end
+        )
+
+    def max_tickers_per_request(
+        self, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> int:
+        """Number of tickers whose values can be fetched with a single request"""
+        return 1
+
+    def get_stock_values_batch(
+        self,
+        tickers: list[str],
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> dict[str, list[StockValue]]:
+        """Same as `get_stock_values` for several tickers at once, which providers may
+        fetch with fewer requests (see `max_tickers_per_request`)"""
+        return {
+            ticker: self.get_stock_values(
+                ticker, kind, granularity, start=start, end=end
+            )
+            for ticker in tickers
+        }
+
+    def iter_stock_values_batch(
+        self,
+        tickers: list[str],
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> Iterator[tuple[str, list[StockValue]]]:
+        """Same as `get_stock_values_batch`, but providers may yield the values of each
+        ticker as soon as they are received instead of holding those of all the tickers
+        in memory"""
+        yield from self.get_stock_values_batch(
+            tickers, kind, granularity, start=start, end=end
+        ).items()
+
     def get_raw_stock_values(
         self,
         ticker: str,
         kind: StockValueKind,
         granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
     ) -> dict:
         raise NotImplementedError()
 
     @abstractmethod
     def get_company_info(self, tickers: list[str]) -> list[CompanyInfo]:
         ...
+
+
+class AsyncStockMarketProvider(ABC):
+    """Counterpart of `StockMarketProvider` for providers that can be queried from
+    within an asyncio event loop, so that many requests can be in flight at once."""
+
+    @abstractmethod
+    async def get_stock_values_async(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[StockValue]:
+        ...
+
+    @abstractmethod
+    async def get_company_info_async(self, tickers: list[str]) -> list[CompanyInfo]:
+        ...
+
+    async def close_async(self) -> None:
+        """Release the resources (e.g. connections) bound to the running event loop"""
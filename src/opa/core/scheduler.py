@@ -0,0 +1,102 @@
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from enum import Enum
+from typing import Callable
+
+from loguru import logger
+
+from opa.core.calendar import is_trading_day, market_hours, market_timezone
+from opa.core.financial_data import StockValueKind, StockValueSerieGranularity
+from opa.core.financial_data_reader import FinancialDataReader
+
+
+class ScheduledImport(Enum):
+    # Fine-grained values published during the trading session
+    INTRADAY = "intraday"
+    # All the series, once the market has closed
+    END_OF_DAY = "end_of_day"
+
+
+def _market_now() -> datetime:
+    return datetime.now(market_timezone)
+
+
+@dataclass
+class IngestionScheduler:
+    """Keeps the storage up to date by running imports according to market hours.
+
+    During the trading session, fine-grained values are imported each time a bar has
+    elapsed. Once the daily values are published after the market has closed, all the
+    series are imported. Nothing is done on days the market is closed.
+
+    The same reader (hence the same provider and storage, with their HTTP session and
+    database connection) is used for all the imports."""
+
+    reader: FinancialDataReader
+    tickers: list[str]
+    # Duration of the fine-grained values
+    bar_interval: timedelta = timedelta(minutes=15)
+    # Time left to the provider to publish a value once its bar has elapsed
+    publication_delay: timedelta = timedelta(minutes=1)
+    # Time after the close at which the provider publishes the daily values, which
+    # is the reader's provider's one by default
+    daily_publication_delay: timedelta | None = None
+    clock: Callable[[], datetime] = field(default=_market_now)
+    sleep: Callable[[float], None] = field(default=time.sleep)
+
+    def __post_init__(self):
+        if self.daily_publication_delay is None:
+            self.daily_publication_delay = self.reader.provider.daily_publication_delay
+
+    def next_import(self, now: datetime) -> tuple[datetime, ScheduledImport]:
+        """Time and type of the first import scheduled strictly after `now`"""
+        day = now.astimezone(market_timezone).date()
+
+        while True:
+            if is_trading_day(day):
+                open_at, close_at = market_hours(day)
+
+                bar_end = open_at + self.bar_interval
+                while bar_end < close_at:
+                    if (at := bar_end + self.publication_delay) > now:
+                        return at, ScheduledImport.INTRADAY
+                    bar_end += self.bar_interval
+
+                # The last bar of the session is imported along with the other series,
+                # as the daily values would never be requested again if they were
+                # imported before being published
+                at = close_at + max(
+                    self.publication_delay, self.daily_publication_delay
+                )
+                if at > now:
+                    return at, ScheduledImport.END_OF_DAY
+
+            day += timedelta(days=1)
+
+    def run(self, nb_imports: int | None = None):
+        """Run the scheduled imports, forever unless `nb_imports` is given"""
+        done = 0
+        while nb_imports is None or done < nb_imports:
+            at, scheduled = self.next_import(self.clock())
+            logger.info("Next {} import scheduled at {}", scheduled.value, at)
+
+            if (delay := (at - self.clock()).total_seconds()) > 0:
+                self.sleep(delay)
+
+            try:
+                self._import(scheduled)
+            except Exception:
+                # The next import will fetch the values missed by this one.
+                logger.exception("{} import failed", scheduled.value)
+
+            done += 1
+
+    def _import(self, scheduled: ScheduledImport):
+        match scheduled:
+            case ScheduledImport.INTRADAY:
+                self.reader.import_stock_values(
+                    self.tickers, StockValueKind.OHLC, StockValueSerieGranularity.FINE
+                )
+            case ScheduledImport.END_OF_DAY:
+                self.reader.run(self.tickers)
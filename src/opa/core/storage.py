@@ -1,22 +1,152 @@
+import base64
+import json
 from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Iterable, Iterator, TypeVar
 
 from opa.core.financial_data import (
     StockValue,
     StockValueKind,
     CompanyInfo,
     StockCollectionStats,
+    ImportCheckpoint,
+    InsertResult,
+    StockValueColumns,
+    StockValueResolution,
+    naive_utc,
 )
 
 
+def page_cursor(value: StockValue) -> str:
+    """Opaque token of the position of a value among the values of a ticker, to get
+    the values that follow it with `Storage.get_values`"""
+    position = [value.date.isoformat(), value.interval]
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+def parse_page_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        date, interval = json.loads(base64.urlsafe_b64decode(cursor))
+        return datetime.fromisoformat(date), int(interval)
+    except (ValueError, TypeError) as err:
+        raise ValueError(f"Invalid cursor : {cursor}") from err
+
+
+T = TypeVar("T")
+
+
+def coarsest_rollups(
+    rollups: Iterable[T], period: Callable[[T], datetime]
+) -> Iterator[T]:
+    """The first rollup of each period, out of rollups ordered by decreasing period
+    and then by decreasing interval of their values.
+
+    Those are the rollups of the coarsest values stored over each period, e.g. of the
+    daily values rather than of the 15 minutes ones, which only span the latest days :
+    the finer values only make up the periods that have no coarser values yet."""
+    last = None
+    for rollup in rollups:
+        if (start := period(rollup)) != last:
+            last = start
+            yield rollup
+
+
+@dataclass(frozen=True)
+class DateBounds:
+    """Range of the dates of the values of one interval to get, as naive UTC dates
+    whatever the time zone of the given ones"""
+
+    start: datetime | None = None
+    end: datetime | None = None
+    end_included: bool = True
+
+    def __post_init__(self):
+        for name in ["start", "end"]:
+            if (date := getattr(self, name)) is not None:
+                object.__setattr__(self, name, naive_utc(date))
+
+    @classmethod
+    def of_page(
+        cls,
+        interval: int,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+    ) -> "DateBounds":
+        """Dates of the values of `interval` that may be in a page of values (see
+        `Storage.get_values`)"""
+        bounds = cls(start, end)
+        if cursor is None:
+            return bounds
+
+        # Values at the same date as the cursor's value follow it if their interval is
+        # smaller
+        after, after_interval = parse_page_cursor(cursor)
+        after, end = naive_utc(after), bounds.end
+        included = interval < after_interval
+        if end is None or after < end or (after == end and not included):
+            bounds = cls(start, after, included)
+
+        return bounds
+
+    def __contains__(self, date: datetime) -> bool:
+        if self.start is not None and date < self.start:
+            return False
+        if self.end is not None:
+            return date <= self.end if self.end_included else date < self.end
+        return True
+
+
 class Storage(ABC):
     @abstractmethod
-    def insert_values(self, values: list[StockValue]):
+    def insert_values(self, values: list[StockValue]) -> InsertResult:
+        """Insert the values that are not stored yet (i.e. no value of the same ticker,
+        kind and interval is stored at the same date)"""
         ...
 
     @abstractmethod
     def get_values(
-        self, ticker: str, kind: StockValueKind, limit: int = 500
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
     ) -> list[StockValue]:
+        """Get the `limit` latest values (all of them if 0) of a ticker between `start`
+        and `end` (both included), most recent first, and by decreasing interval at the
+        same date.
+
+        The values that follow a page of values are got with the `page_cursor` of the
+        last value of the page. Getting a page only reads the values in it.
+
+        With a `resolution`, the values are rollups of the values stored over each
+        period of that resolution (see `StockValueRollup`), which are kept up-to-date
+        on every insertion so that reading them only reads as many bars."""
+        ...
+
+    def get_values_columnar(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
+    ) -> StockValueColumns:
+        """Same values as `get_values`, as columns"""
+        values = self.get_values(ticker, kind, limit, start, end, cursor, resolution)
+        return StockValueColumns.from_values(ticker, kind, values)
+
+    @abstractmethod
+    def get_dates(
+        self, ticker: str, kind: StockValueKind, interval: int | None = None
+    ) -> list[datetime]:
+        """Get the dates of all the values stored for a ticker, in no particular order"""
         ...
 
     @abstractmethod
@@ -32,5 +162,21 @@ class Storage(ABC):
         ...
 
     @abstractmethod
-    def get_stats(self, kind: StockValueKind) -> dict[str, StockCollectionStats]:
+    def get_stats(
+        self, kind: StockValueKind, interval: int | None = None
+    ) -> dict[str, StockCollectionStats]:
+        """Get stats on the values stored for each ticker, either on all of their
+        intervals or on the `interval` given"""
+        ...
+
+    @abstractmethod
+    def insert_checkpoints(self, checkpoints: list[ImportCheckpoint]):
+        ...
+
+    @abstractmethod
+    def get_checkpoints(self, run_id: str) -> list[ImportCheckpoint]:
+        ...
+
+    @abstractmethod
+    def delete_checkpoints(self, run_id: str):
         ...
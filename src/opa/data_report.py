@@ -45,6 +45,15 @@ class Api:
 
         return self._do_request(ticker, params)
 
+    def get_stock_values_columns(
+        self, ticker: str, kind: StockValueKind, limit: int | None = None
+    ) -> dict[str, list]:
+        params = dict(kind=kind.value)
+        if limit is not None:
+            params |= dict(limit=str(limit))
+
+        return self._do_request(f"{ticker}/columns", params)
+
     def all_tickers(self) -> list[str]:
         return self._do_request("tickers")
 
@@ -72,8 +81,13 @@ api = Api(
 def get_dataframe(
     ticker: str, kind: StockValueKind, nb_points: int
 ) -> pd.DataFrame | None:
-    data = api.get_stock_values(ticker, kind, nb_points)
-    return pd.DataFrame(data) if data else None
+    columns = api.get_stock_values_columns(ticker, kind, nb_points)
+    if not columns["date"]:
+        return None
+
+    df = pd.DataFrame(columns)
+    df["date"] = pd.to_datetime(df["date"], unit="ms")
+    return df
 
 
 def add_range_selectors(figure, display_slider, enable_range_breaks, hour_break=False):
@@ -1,15 +1,76 @@
+from argparse import ArgumentParser
+from datetime import date
+
 from loguru import logger
 
-from opa.core import FinancialDataReader
-from opa.providers import opa_provider
-from opa.storage import opa_storage
+from opa.core import FinancialDataReader, StockValueKind, StockValueSerieGranularity
+from opa.core.scheduler import IngestionScheduler
+from opa.providers import opa_provider, synthetic_tickers
+from opa.storage import get_opa_storage
 from opa.config import settings
 
 
 if __name__ == "__main__":
+    parser = ArgumentParser(description="Import financial data into the storage")
+    commands = parser.add_subparsers(dest="command")
+
+    backfill = commands.add_parser(
+        "backfill", help="Import the values missing from the storage"
+    )
+    backfill.add_argument("start", type=date.fromisoformat)
+    backfill.add_argument("end", type=date.fromisoformat, nargs="?")
+    backfill.add_argument(
+        "--kind", type=StockValueKind, default=StockValueKind.OHLC.value
+    )
+    backfill.add_argument(
+        "--granularity",
+        type=StockValueSerieGranularity,
+        default=StockValueSerieGranularity.COARSE.value,
+    )
+
+    parser.add_argument(
+        "--run-id",
+        default=settings.reader_run_id or None,
+        help="Id of the run, to resume a run with the same id that did not complete",
+    )
+
+    commands.add_parser(
+        "daemon", help="Keep importing the new values according to market hours"
+    )
+
+    args = parser.parse_args()
+
     logger.info("Reader app starting up...")
 
-    reader = FinancialDataReader(opa_provider, opa_storage)
-    reader.run(settings.tickers_list)
+    tickers = (
+        synthetic_tickers(settings.offline_nb_tickers)
+        if settings.offline_nb_tickers
+        else settings.tickers_list
+    )
+
+    reader = FinancialDataReader(
+        opa_provider,
+        get_opa_storage(),
+        max_workers=settings.reader_max_workers,
+        use_async=settings.reader_use_async,
+        batch_size=settings.reader_batch_size,
+        max_pending_batches=settings.reader_max_pending_batches,
+    )
+
+    match args.command:
+        case "backfill":
+            reader.backfill(
+                tickers,
+                args.kind,
+                args.granularity,
+                args.start,
+                args.end,
+            )
+
+        case "daemon":
+            IngestionScheduler(reader, tickers).run()
+
+        case _:
+            reader.run(tickers, run_id=args.run_id)
 
     logger.info("Reader app done")
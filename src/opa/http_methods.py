@@ -1,6 +1,17 @@
-from datetime import timedelta
+import asyncio
+import random
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+from urllib.parse import urlparse
+from weakref import WeakKeyDictionary
 
+import orjson
 from loguru import logger
 
 from opa import settings
@@ -12,18 +23,42 @@ def get_session():
         from requests_cache.models.response import CachedResponse
         from requests_cache.backends.sqlite import SQLiteCache
 
-        return requests_cache.CachedSession(
+        session = requests_cache.CachedSession(
             "opa",
-            backend=SQLiteCache(db_path=Path(settings.http_cache_dir) / "opa"),
-            # This should certainly be set by request, but within the limited scope of this
-            # project, new data is fetched every day, and the API rate is limited anyway.
-            # Hardcoding the value is good enough.
+            backend=SQLiteCache(
+                db_path=Path(settings.http_cache_dir) / "opa",
+                # Several readers may share the cache : with Write-Ahead Logging,
+                # readers never block writers, and writers wait for one another.
+                wal=True,
+                busy_timeout=30_000,
+            ),
+            # Fallback for the requests made without any expiration (see `_get`)
             expire_after=timedelta(hours=12.0),
+            # Expired responses are kept : they are revalidated with a conditional
+            # request when they come with an ETag or Last-Modified header, and used
+            # if the request fails.
+            stale_if_error=True,
+            # So that the API key is not stored in the cache
+            ignored_parameters=["apikey"],
         )
     else:
         import requests
 
-        return requests.Session()
+        session = requests.Session()
+
+    # The default pool only keeps 10 connections alive, which is less than what
+    # the reader may need when it fetches values concurrently.
+    from requests.adapters import HTTPAdapter
+
+    adapter = HTTPAdapter(pool_maxsize=settings.reader_max_workers)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def is_caching(session) -> bool:
+    return hasattr(session, "cache")
 
 
 def is_cached(request):
@@ -36,9 +71,152 @@ def is_cached(request):
 session = get_session()
 
 
+@dataclass
+class TokenBucket:
+    """A rate limiter that lets through `rate` requests per second on average,
+    and up to `capacity` requests at once.
+
+    It is meant to be shared between threads/coroutines : every request reserves
+    one token and gets the delay it must wait for before being sent."""
+
+    rate: float
+    capacity: float
+    clock: Callable[[], float] = time.monotonic
+    tokens: float = field(init=False)
+    # Time at which `tokens` were counted, it lies in the future while the bucket
+    # is paused.
+    updated_at: float = field(init=False)
+    _lock: threading.Lock = field(init=False, default_factory=threading.Lock)
+
+    def __post_init__(self):
+        self.tokens = self.capacity
+        self.updated_at = self.clock()
+
+    def reserve(self) -> float:
+        with self._lock:
+            now = self._refill()
+            self.tokens -= 1
+            return (self.updated_at - now) + max(0.0, -self.tokens / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        """Prevent any request from being sent within the next `seconds`"""
+        with self._lock:
+            now = self._refill()
+            self.tokens = min(self.tokens, 0.0)
+            self.updated_at = max(self.updated_at, now + seconds)
+
+    def _refill(self) -> float:
+        now = self.clock()
+        if now > self.updated_at:
+            elapsed = now - self.updated_at
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+        return now
+
+
+rate_limiters = {
+    limit.host: TokenBucket(limit.requests_per_second, limit.burst)
+    for limit in settings.get("rate_limits", [])
+}
+
+
+def get_rate_limiter(url: str) -> TokenBucket | None:
+    return rate_limiters.get(urlparse(url).hostname)
+
+
+# Responses that are worth retrying after some time
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+def retry_delay(attempt: int, retry_after: str | None = None) -> float:
+    """Delay (in seconds) to wait before retrying a request that failed `attempt` times,
+    as a "full jitter" exponential backoff unless the server told us how long to wait
+    via a `Retry-After` header."""
+    if retry_after:
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            ...
+
+        try:
+            until = parsedate_to_datetime(retry_after)
+            return max(0.0, (until - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            ...
+
+    max_delay = settings.http_backoff_base * 2 ** (attempt - 1)
+    return random.uniform(0, min(settings.http_backoff_max, max_delay))
+
+
+def _should_retry(url: str, status: int, attempt: int, headers) -> float | None:
+    if status not in RETRYABLE_STATUSES or attempt > settings.http_max_retries:
+        return None
+
+    delay = retry_delay(attempt, headers.get("Retry-After"))
+    logger.warning(
+        "Got response code={status} from {url}, retrying in {delay:.1f}s (attempt {attempt})",
+        status=status,
+        url=url,
+        delay=delay,
+        attempt=attempt,
+    )
+
+    # A 429 means that we are going too fast for the server, whatever the request,
+    # so all the requests to the same host are delayed.
+    limiter = get_rate_limiter(url)
+    if status == 429 and limiter is not None:
+        limiter.pause(delay)
+
+    return delay
+
+
 def get_json_data(url: str, **kwargs):
-    http = session.get(url, **kwargs)
-    status = http.status_code
+    """Get the JSON body of a response.
+
+    `expire_after` (a duration or a datetime) sets the expiration of the response in
+    the HTTP cache, if enabled."""
+    http = _get(url, **kwargs)
+    return http.json()
+
+
+def get_text_data(url: str, **kwargs) -> str:
+    http = _get(url, **kwargs)
+    return http.text
+
+
+def iter_json_data(url: str, path: tuple[str, ...] = (), **kwargs) -> Iterator[Any]:
+    """Get the items of the array at `path` of a JSON response one by one, as the
+    response is being received, so that the whole body is never held in memory."""
+    http = _get(url, stream=True, **kwargs)
+
+    try:
+        yield from iter_json_array_items(http.iter_content(chunk_size=64 * 1024), path)
+    finally:
+        http.close()
+
+
+def _get(url: str, expire_after: timedelta | datetime | None = None, **kwargs):
+    if expire_after is not None and is_caching(session):
+        kwargs["expire_after"] = expire_after
+
+    limiter = get_rate_limiter(url)
+    attempt = 0
+
+    while True:
+        attempt += 1
+        if limiter is not None:
+            time.sleep(limiter.reserve())
+
+        http = session.get(url, **kwargs)
+        status = http.status_code
+
+        delay = _should_retry(url, status, attempt, http.headers)
+        if delay is None:
+            break
+
+        http.close()
+        time.sleep(delay)
 
     if status >= 300:
         raise RuntimeError(f"Got unhandled response code={status} : {http.json()}")
@@ -49,4 +227,166 @@ def get_json_data(url: str, **kwargs):
         url=http.url,
     )
 
+    return http
+
+
+# All the characters that matter to find the keys of objects and the boundaries of the
+# items of an array
+_json_delimiters = re.compile(rb'[\[\]{}:"\\]')
+
+
+def iter_json_array_items(
+    chunks: Iterable[bytes], path: tuple[str, ...] = ()
+) -> Iterator[Any]:
+    """Decode the objects that are items of an array of a JSON document that is
+    received chunk by chunk.
+
+    The array is found at `path`, the keys of the objects leading to it, e.g.
+    `("historical",)` for the items of `historical` in `{"symbol": .., "historical": [{..}, ..]}`,
+    or `()` for the items of a document that is an array. Only those items are decoded
+    (along with all of their content), everything else is skipped, and only the item
+    being received is kept in memory.
+
+    Raise a `ValueError` if there is no array at `path`, e.g. because the document is
+    an error message."""
+    buffer = b""
+    # Offset in `buffer` from which the next chunk must be scanned
+    pos = 0
+    # Containers ("[" or "{") opened so far, with their path
+    containers: list[tuple[bytes, tuple[str, ...]]] = []
+    # Last string received outside of an item, which is a key if followed by ":",
+    # and offset in `buffer` of the one being received
+    last_string = b""
+    string_start: int | None = None
+    key = ""
+    found = False
+    # Offset in `buffer` of the item being received, and number of its containers
+    # that are open
+    item_start: int | None = None
+    item_depth = 0
+    in_string = False
+    # Offset of the character that is escaped by a backslash
+    escaped = -1
+
+    for chunk in chunks:
+        buffer += chunk
+
+        for match in _json_delimiters.finditer(buffer, pos):
+            i = match.start()
+            char = buffer[i : i + 1]
+
+            if in_string:
+                if i == escaped:
+                    continue
+                elif char == b"\\":
+                    escaped = i + 1
+                elif char == b'"':
+                    in_string = False
+                    if string_start is not None:
+                        last_string = buffer[string_start : i + 1]
+                        string_start = None
+
+            elif char == b'"':
+                in_string = True
+                if item_start is None:
+                    string_start = i
+
+            elif item_start is not None:
+                # Within an item, only its end matters
+                if char in b"[{":
+                    item_depth += 1
+                elif char in b"]}":
+                    item_depth -= 1
+                    if not item_depth:
+                        yield orjson.loads(buffer[item_start : i + 1])
+                        item_start = None
+
+            elif char == b":":
+                key = orjson.loads(last_string)
+
+            elif char in b"[{":
+                parent, parent_path = containers[-1] if containers else (b"", ())
+                if parent == b"[" and parent_path == path and char == b"{":
+                    item_start = i
+                    item_depth = 1
+                    continue
+
+                container_path = parent_path + (key,) if parent == b"{" else parent_path
+                containers.append((char, container_path))
+                found |= char == b"[" and container_path == path
+
+            else:
+                containers.pop()
+
+        # Drop everything that was scanned and is not part of an item or a string
+        # being received
+        drop = next(
+            (o for o in [item_start, string_start] if o is not None), len(buffer)
+        )
+        buffer = buffer[drop:]
+        pos = len(buffer)
+        escaped -= drop
+        if item_start is not None:
+            item_start = 0
+        if string_start is not None:
+            string_start = 0
+
+    if not found:
+        raise ValueError(
+            f"The JSON document has no array at {'.'.join(path) or 'its root'}"
+        )
+
+
+# Clients of `httpx` hold connections that are bound to the event loop they were
+# created in, hence one client per event loop.
+_async_clients: WeakKeyDictionary = WeakKeyDictionary()
+
+
+def get_async_client():
+    import httpx
+
+    loop = asyncio.get_running_loop()
+    try:
+        return _async_clients[loop]
+    except KeyError:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.reader_max_workers,
+                max_keepalive_connections=settings.reader_max_workers,
+            ),
+            timeout=30.0,
+        )
+        _async_clients[loop] = client
+        return client
+
+
+async def close_async_client():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+async def get_json_data_async(url: str, **kwargs):
+    limiter = get_rate_limiter(url)
+    attempt = 0
+
+    while True:
+        attempt += 1
+        if limiter is not None:
+            await asyncio.sleep(limiter.reserve())
+
+        http = await get_async_client().get(url, **kwargs)
+        status = http.status_code
+
+        delay = _should_retry(url, status, attempt, http.headers)
+        if delay is None:
+            break
+
+        await asyncio.sleep(delay)
+
+    if status >= 300:
+        raise RuntimeError(f"Got unhandled response code={status} : {http.json()}")
+
+    logger.debug("Got successful HTTP response from {url}", url=http.url)
+
     return http.json()
@@ -1,4 +1,44 @@
+from opa import settings
+from opa.core.providers import StockMarketProvider
+
 from .fmp_cloud import FmpCloud
 from .alphavantage import Alphavantage
+from .composite import CompositeProvider, LatencyTracker
+from .offline import ReplayProvider, SyntheticProvider, synthetic_tickers
+
+
+def get_provider(name: str) -> StockMarketProvider:
+    match name:
+        case "fmp_cloud":
+            return FmpCloud()
+        case "alphavantage":
+            return Alphavantage()
+        case "replay":
+            return ReplayProvider(
+                latency=settings.offline_latency,
+                error_rate=settings.offline_error_rate,
+                seed=settings.offline_seed,
+            )
+        case "synthetic":
+            return SyntheticProvider(
+                nb_years=settings.synthetic_nb_years,
+                latency=settings.offline_latency,
+                error_rate=settings.offline_error_rate,
+                seed=settings.offline_seed,
+            )
+        case _:
+            raise ValueError(f"Unknown provider : {name}")
+
+
+def get_opa_provider() -> StockMarketProvider:
+    match settings.providers:
+        case [name]:
+            return get_provider(name)
+        case names:
+            return CompositeProvider(
+                {name: get_provider(name) for name in names},
+                hedge_percentile=settings.provider_hedge_percentile or None,
+            )
+
 
-opa_provider = FmpCloud()
+opa_provider = get_opa_provider()
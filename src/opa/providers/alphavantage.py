@@ -1,46 +1,133 @@
+import csv
+from datetime import date, datetime, time, timedelta
+
+from loguru import logger
+from pydantic import BaseModel, Field
+
 from opa import settings
 from opa.core import CompanyInfo
-from opa.http_methods import get_json_data
+from opa.http_methods import get_json_data, get_text_data
 from opa.core.financial_data import (
     StockValue,
+    CompanyInfoMixin,
     StockValueSerieGranularity,
     StockValueKind,
 )
+from opa.core.calendar import market_timezone, next_daily_publication
 from opa.core.providers import StockMarketProvider
+from opa.providers.fmp_cloud import into_datetime
+
+
+class AlphavantageValue(BaseModel):
+    open: float = Field(alias="1. open")
+    high: float = Field(alias="2. high")
+    low: float = Field(alias="3. low")
+    close: float = Field(alias="4. close")
+    volume: int = Field(alias="5. volume")
+
+
+class AlphavantageDailyData(BaseModel):
+    historical: dict[date, AlphavantageValue] = Field(alias="Time Series (Daily)")
+
+
+class AlphavantageIntradayData(BaseModel):
+    historical: dict[datetime, AlphavantageValue] = Field(alias="Time Series (15min)")
+
+
+class AlphavantageCompanyInfo(BaseModel, CompanyInfoMixin):
+    symbol: str = Field(alias="Symbol")
+    name: str = Field(alias="Name")
+    currency: str = Field(alias="Currency")
+    website: str = Field(alias="OfficialSite", default="")
+    description: str = Field(alias="Description")
+    sector: str = Field(alias="Sector")
+    country: str = Field(alias="Country")
+    address: str = Field(alias="Address")
+    # Not part of the overview, but of the listing of all the tickers
+    ipo_date: date = Field(alias="IpoDate")
+
+    def as_company_info(self, **kwargs) -> CompanyInfo:
+        # e.g. "ONE APPLE PARK WAY, CUPERTINO, CA, US"
+        parts = self.address.split(", ")
+        city = parts[-3] if len(parts) >= 3 else ""
+
+        return CompanyInfo(
+            symbol=self.symbol,
+            name=self.name,
+            currency=self.currency,
+            website=self.website,
+            description=self.description,
+            sector=self.sector,
+            country=self.country,
+            # Alpha Vantage does not provide logos
+            image="",
+            ipo_date=datetime.combine(self.ipo_date, time.min),
+            address=self.address,
+            city=city,
+        )
 
 
 class Alphavantage(StockMarketProvider):
-    """
-    Validation functions are not implemented for this module because this provider
-    will remain unused.
-    """
+    base_url = "https://www.alphavantage.co/query"
+
+    # Number of most recent values returned by a "compact" request : the full serie is
+    # requested only when values older than that are needed.
+    compact_size = 100
+
+    # Expiration of the responses in the HTTP cache, by API function. Daily values
+    # expire when those of the current day are published.
+    expiries = {
+        "OVERVIEW": timedelta(days=7),
+        "LISTING_STATUS": timedelta(days=1),
+        "TIME_SERIES_INTRADAY": timedelta(minutes=5),
+    }
+    daily_publication_delay = timedelta(hours=1)
 
     def __init__(self):
         self.access_key = settings.secrets.alphavantage_api_key
 
+    def provides(
+        self, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> bool:
+        return (kind, granularity) != (
+            StockValueKind.SIMPLE,
+            StockValueSerieGranularity.FINE,
+        )
+
     def get_stock_values(
         self,
         ticker: str,
         kind: StockValueKind,
         granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
     ) -> list[StockValue]:
-        raise NotImplementedError()
+        json = self.get_raw_stock_values(ticker, kind, granularity, start, end)
+        ret = self._as_stock_values(json, ticker, kind, granularity)
 
-    def get_company_info(self, tickers: list[str]) -> list[CompanyInfo]:
-        raise NotImplementedError()
+        logger.info(
+            "Fetched {count} {kind} {granularity}-grained stock values",
+            count=len(ret),
+            kind=kind.value,
+            granularity=granularity.value,
+        )
+        return ret
 
     def get_raw_stock_values(
         self,
         ticker: str,
         kind: StockValueKind,
         granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
     ) -> dict:
         match (kind, granularity):
-            case (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE):
-                # Documentation available here: https://www.alphavantage.co/documentation/#dailyadj
+            case (_, StockValueSerieGranularity.COARSE):
+                # Documentation available here: https://www.alphavantage.co/documentation/#daily
                 return self._get_json_data(
-                    function="TIME_SERIES_DAILY_ADJUSTED",
+                    function="TIME_SERIES_DAILY",
                     symbol=ticker,
+                    outputsize=self._output_size(start, timedelta(days=1)),
                 )
 
             case (StockValueKind.OHLC, StockValueSerieGranularity.FINE):
@@ -49,6 +136,8 @@ class Alphavantage(StockMarketProvider):
                     function="TIME_SERIES_INTRADAY",
                     symbol=ticker,
                     interval="15min",
+                    extended_hours="false",
+                    outputsize=self._output_size(start, timedelta(minutes=15)),
                 )
 
             case _:
@@ -56,6 +145,108 @@ class Alphavantage(StockMarketProvider):
                     f"This provider cannot provide ({kind, granularity}) stock values"
                 )
 
+    def _output_size(self, start: datetime | None, interval: timedelta) -> str:
+        # The trading hours are a fraction of the elapsed time, hence a compact serie
+        # always spans at least `compact_size * interval`.
+        if start is not None and datetime.now() - start < self.compact_size * interval:
+            return "compact"
+        return "full"
+
+    @staticmethod
+    def _as_stock_values(
+        json,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+    ) -> list[StockValue]:
+        """Stock values with the same dates and intervals as the ones of `FmpCloud`,
+        so that the values of both providers can replace one another in the storage"""
+        match (kind, granularity):
+            case (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE):
+                data = AlphavantageDailyData.model_validate(json)
+                return [
+                    StockValue(
+                        ticker=ticker,
+                        date=into_datetime(d),
+                        close=v.close,
+                        interval=24 * 60 * 60,
+                    )
+                    for d, v in data.historical.items()
+                ]
+
+            case (StockValueKind.OHLC, StockValueSerieGranularity.COARSE):
+                data = AlphavantageDailyData.model_validate(json)
+                dates = {d: datetime.combine(d, time.min) for d in data.historical}
+
+            case (StockValueKind.OHLC, StockValueSerieGranularity.FINE):
+                data = AlphavantageIntradayData.model_validate(json)
+                dates = {d: d for d in data.historical}
+
+            case _:
+                raise TypeError(f"cannot validate ({kind, granularity}) stock values")
+
+        return [
+            StockValue(
+                ticker=ticker,
+                date=dates[d],
+                close=v.close,
+                open=v.open,
+                low=v.low,
+                high=v.high,
+                volume=v.volume,
+                interval=granularity.interval,
+            )
+            for d, v in data.historical.items()
+        ]
+
+    def get_company_info(self, tickers: list[str]) -> list[CompanyInfo]:
+        ipo_dates = self._get_ipo_dates()
+
+        ret = []
+        for ticker in sorted(tickers):
+            # Documentation available here: https://www.alphavantage.co/documentation/#company-overview
+            data = self._get_json_data(function="OVERVIEW", symbol=ticker)
+            # Tickers missing from the listing (e.g. delisted ones) have no IPO date,
+            # and fail validation as they do with FmpCloud
+            info = AlphavantageCompanyInfo.model_validate(
+                data | {"IpoDate": ipo_dates.get(ticker)}
+            )
+            ret.append(info.as_company_info())
+
+        logger.info("Fetched company info for {} companies", len(ret))
+        return ret
+
+    def _get_ipo_dates(self) -> dict[str, date]:
+        # Documentation available here: https://www.alphavantage.co/documentation/#listing-status
+        text = get_text_data(
+            self.base_url,
+            params={"function": "LISTING_STATUS", "apikey": self.access_key},
+            expire_after=self._expire_after("LISTING_STATUS"),
+        )
+        return {
+            row["symbol"]: date.fromisoformat(row["ipoDate"])
+            for row in csv.DictReader(text.splitlines())
+        }
+
+    def _expire_after(self, function: str) -> timedelta | datetime:
+        try:
+            return self.expiries[function]
+        except KeyError:
+            return next_daily_publication(
+                datetime.now(market_timezone), self.daily_publication_delay
+            )
+
     def _get_json_data(self, **params):
         params = params | {"apikey": self.access_key}
-        return get_json_data("https://www.alphavantage.co/query", params=params)
+        json = get_json_data(
+            self.base_url,
+            params=params,
+            expire_after=self._expire_after(params["function"]),
+        )
+
+        # Errors (including exceeded quotas) come with a successful response code
+        for key in ["Error Message", "Note", "Information"]:
+            if key in json:
+                raise RuntimeError(f"Got error response from Alpha Vantage : {json}")
+
+        return json
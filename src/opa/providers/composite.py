@@ -0,0 +1,263 @@
+import math
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from itertools import chain, islice
+from threading import Lock
+from typing import Callable, Iterator
+
+from loguru import logger
+
+from opa.core import CompanyInfo
+from opa.core.financial_data import (
+    StockValue,
+    StockValueSerieGranularity,
+    StockValueKind,
+)
+from opa.core.providers import StockMarketProvider
+
+
+@dataclass
+class LatencyTracker:
+    """Durations of the latest requests made to each provider.
+
+    Failed requests count as infinitely long ones, so that a provider that keeps
+    failing ends up behind the others."""
+
+    # Number of requests kept per provider
+    window: int = 100
+    _samples: dict[str, deque[float]] = field(default_factory=dict)
+    _lock: Lock = field(default_factory=Lock)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.window)
+            self._samples[name].append(seconds)
+
+    def record_failure(self, name: str):
+        self.record(name, math.inf)
+
+    def percentile(self, name: str, percent: float) -> float | None:
+        """Duration under which `percent`% of the requests completed, if any was made"""
+        with self._lock:
+            samples = sorted(self._samples.get(name, []))
+
+        if not samples:
+            return None
+
+        rank = math.ceil(percent / 100 * len(samples)) - 1
+        return samples[max(rank, 0)]
+
+
+class CompositeProvider(StockMarketProvider):
+    """Provider that gets values from the first of several providers to succeed.
+
+    Providers are queried in order of median latency (providers without any request
+    yet come last, in the given order). When one of them fails, the next one that
+    provides the requested serie is queried.
+
+    If `hedge_percentile` is set, a request that has been running for longer than
+    this percentile of the provider's latencies is "hedged" : the same request is sent
+    to the next provider, and the first response received is used.
+
+    Values that are streamed by the providers are streamed as well, and a provider
+    is failed over if it fails before the first values are received. Failures that
+    occur later on are raised, as those values were already used."""
+
+    def __init__(
+        self,
+        providers: dict[str, StockMarketProvider],
+        hedge_percentile: float | None = None,
+        latencies: LatencyTracker | None = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.providers = providers
+        self.hedge_percentile = hedge_percentile
+        self.latencies = latencies or LatencyTracker()
+        self.clock = clock
+
+        # Hedged requests are run in the background until they complete, even when
+        # the other request completed first.
+        self._executor = (
+            ThreadPoolExecutor(thread_name_prefix="hedging")
+            if hedge_percentile is not None
+            else None
+        )
+
+    @property
+    def daily_publication_delay(self) -> timedelta:  # type: ignore[override]
+        # Daily values may be fetched from any of the providers
+        return max(p.daily_publication_delay for p in self.providers.values())
+
+    def provides(
+        self, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> bool:
+        return any(p.provides(kind, granularity) for p in self.providers.values())
+
+    def get_stock_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[StockValue]:
+        return self._first_success(
+            self._candidates(kind, granularity),
+            lambda p: p.get_stock_values(
+                ticker, kind, granularity, start=start, end=end
+            ),
+        )
+
+    def iter_stock_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> Iterator[StockValue]:
+        return self._first_stream(
+            self._candidates(kind, granularity),
+            lambda p: p.iter_stock_values(
+                ticker, kind, granularity, start=start, end=end
+            ),
+        )
+
+    def max_tickers_per_request(
+        self, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> int:
+        # Providers that fetch fewer tickers at once split the batches they are given
+        return max(
+            self.providers[name].max_tickers_per_request(kind, granularity)
+            for name in self._candidates(kind, granularity)
+        )
+
+    def get_stock_values_batch(
+        self,
+        tickers: list[str],
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> dict[str, list[StockValue]]:
+        return self._first_success(
+            self._candidates(kind, granularity),
+            lambda p: p.get_stock_values_batch(
+                tickers, kind, granularity, start=start, end=end
+            ),
+        )
+
+    def iter_stock_values_batch(
+        self,
+        tickers: list[str],
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> Iterator[tuple[str, list[StockValue]]]:
+        return self._first_stream(
+            self._candidates(kind, granularity),
+            lambda p: p.iter_stock_values_batch(
+                tickers, kind, granularity, start=start, end=end
+            ),
+        )
+
+    def get_company_info(self, tickers: list[str]) -> list[CompanyInfo]:
+        return self._first_success(
+            list(self.providers), lambda p: p.get_company_info(tickers)
+        )
+
+    def _candidates(
+        self, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> list[str]:
+        candidates = [
+            name for name, p in self.providers.items() if p.provides(kind, granularity)
+        ]
+        if not candidates:
+            raise TypeError(
+                f"No provider can provide ({kind, granularity}) stock values"
+            )
+
+        return candidates
+
+    def ranked(self, names: list[str]) -> list[str]:
+        def median(name):
+            latency = self.latencies.percentile(name, 50)
+            return math.inf if latency is None else latency
+
+        # Sorting is stable : the given order is kept among equal latencies
+        return sorted(names, key=median)
+
+    def _first_success(self, names: list[str], call: Callable):
+        remaining = self.ranked(names)
+        pending: dict[Future, str] = {}
+        errors = []
+
+        while remaining or pending:
+            if not pending:
+                name = remaining.pop(0)
+                pending[self._submit(name, call)] = name
+
+            timeout = None
+            if self.hedge_percentile is not None and remaining and len(pending) == 1:
+                latency = self.latencies.percentile(
+                    next(iter(pending.values())), self.hedge_percentile
+                )
+                if latency is not None and latency < math.inf:
+                    timeout = latency
+
+            done, _ = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+
+            if not done:
+                name = remaining.pop(0)
+                logger.info("Request is slow, hedging with provider {}", name)
+                pending[self._submit(name, call)] = name
+                continue
+
+            for future in done:
+                name = pending.pop(future)
+                try:
+                    return future.result()
+                except Exception as e:
+                    logger.warning("Provider {} failed : {!r}", name, e)
+                    errors.append(e)
+
+        raise errors[-1]
+
+    def _first_stream(self, names: list[str], call: Callable) -> Iterator:
+        """Same as `_first_success` for calls that return iterators, which succeed
+        once their first item is received (as the request is only made then)"""
+
+        def first_item(provider: StockMarketProvider):
+            items = iter(call(provider))
+            return list(islice(items, 1)), items
+
+        head, rest = self._first_success(names, first_item)
+        return chain(head, rest)
+
+    def _submit(self, name: str, call: Callable) -> Future:
+        if self._executor is not None:
+            return self._executor.submit(self._timed, name, call)
+
+        # Without hedging, requests are simply made one after the other
+        future = Future()
+        try:
+            future.set_result(self._timed(name, call))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+    def _timed(self, name: str, call: Callable):
+        started = self.clock()
+        try:
+            ret = call(self.providers[name])
+        except Exception:
+            self.latencies.record_failure(name)
+            raise
+
+        self.latencies.record(name, self.clock() - started)
+        return ret
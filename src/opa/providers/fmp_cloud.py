@@ -1,12 +1,21 @@
-from datetime import date, datetime, time
+from datetime import date, datetime, time, timedelta
+from itertools import islice
 from pathlib import Path
+from typing import Iterator
 
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter
+from typing_extensions import TypedDict
 from loguru import logger
 
 from opa import settings
-from opa.http_methods import get_json_data
-from opa.core.providers import StockMarketProvider
+from opa.http_methods import (
+    get_json_data,
+    iter_json_data,
+    get_json_data_async,
+    close_async_client,
+)
+from opa.core.calendar import market_timezone, next_daily_publication
+from opa.core.providers import StockMarketProvider, AsyncStockMarketProvider
 from opa.core.financial_data import (
     StockValue,
     StockValueMixin,
@@ -51,6 +60,8 @@ class FmpCloudOhlcValue(BaseModel, StockValueMixin):
 
     def as_stock_value(self, **kwargs) -> StockValue:
         ticker = kwargs.pop("ticker")
+        # Daily and intraday values have the same schema
+        interval = kwargs.pop("interval")
 
         if isinstance(self.date, datetime):
             date_ = self.date
@@ -67,7 +78,7 @@ class FmpCloudOhlcValue(BaseModel, StockValueMixin):
             low=self.low,
             high=self.high,
             volume=self.volume,
-            interval=15 * 60,
+            interval=interval,
         )
 
 
@@ -76,6 +87,39 @@ class FmpCloudOhlcCoarseData(BaseModel):
     historical: list[FmpCloudOhlcValue]
 
 
+# Schemas of the same values as above, used to validate a whole batch of values
+# at once instead of creating one model per value (see `FmpCloud.batch_validation`).
+class FmpCloudSimpleRow(TypedDict):
+    date: date
+    close: float
+
+
+class FmpCloudSimpleCoarseRows(TypedDict):
+    symbol: str
+    historical: list[FmpCloudSimpleRow]
+
+
+class FmpCloudOhlcRow(TypedDict):
+    date: datetime | date
+    open: float
+    close: float
+    low: float
+    high: float
+    volume: int
+
+
+class FmpCloudOhlcCoarseRows(TypedDict):
+    symbol: str
+    historical: list[FmpCloudOhlcRow]
+
+
+simple_rows_adapter = TypeAdapter(list[FmpCloudSimpleRow])
+simple_coarse_rows_adapter = TypeAdapter(FmpCloudSimpleCoarseRows)
+ohlc_rows_adapter = TypeAdapter(list[FmpCloudOhlcRow])
+ohlc_coarse_rows_adapter = TypeAdapter(FmpCloudOhlcCoarseRows)
+stock_values_adapter = TypeAdapter(list[StockValue])
+
+
 class FmpCloudCompanyInfo(BaseModel, CompanyInfoMixin):
     symbol: str
     companyName: str
@@ -105,54 +149,230 @@ class FmpCloudCompanyInfo(BaseModel, CompanyInfoMixin):
         )
 
 
-class FmpCloud(StockMarketProvider):
+class FmpCloud(StockMarketProvider, AsyncStockMarketProvider):
+    base_url = "https://fmpcloud.io/api/v3"
+
+    # Number of values validated at once when values are streamed
+    batch_size = 1000
+
+    # Maximum number of tickers in a request for daily values
+    max_tickers = 5
+
+    # Expiration of the responses in the HTTP cache. Daily values expire when those
+    # of the current day are published.
+    profile_expiry = timedelta(days=7)
+    intraday_expiry = timedelta(minutes=5)
+    daily_publication_delay = timedelta(hours=1)
+
     def __init__(self):
         self.access_key = settings.secrets.fmp_cloud_api_key
+        self.batch_validation = settings.fmp_cloud_batch_validation
+
+    def provides(
+        self, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> bool:
+        return (kind, granularity) != (
+            StockValueKind.SIMPLE,
+            StockValueSerieGranularity.FINE,
+        )
 
     def get_stock_values(
         self,
         ticker: str,
         kind: StockValueKind,
         granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
     ) -> list[StockValue]:
-        json = self.get_raw_stock_values(ticker, kind, granularity)
-        ret = [
-            v.as_stock_value(ticker=ticker)
-            for v in self._as_validated_list_of_values(json, kind, granularity)
-        ]
+        return list(self.iter_stock_values(ticker, kind, granularity, start, end))
+
+    def iter_stock_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> Iterator[StockValue]:
+        path, params = self._stock_values_request(ticker, kind, granularity, start, end)
+        items = self._iter_json_data(path, self._values_path(granularity), **params)
+
+        count = 0
+        if self.batch_validation:
+            adapter = self._rows_adapter(kind, granularity)
+            while batch := list(islice(items, self.batch_size)):
+                rows = adapter.validate_python(batch)
+                yield from self._rows_as_stock_values(rows, ticker, kind, granularity)
+                count += len(rows)
+        else:
+            model = self._value_model(kind, granularity)
+            for item in items:
+                yield model.model_validate(item).as_stock_value(
+                    ticker=ticker, interval=granularity.interval
+                )
+                count += 1
 
         logger.info(
             "Fetched {count} {kind} {granularity}-grained stock values",
-            count=len(ret),
+            count=count,
             kind=kind.value,
             granularity=granularity.value,
         )
-        return ret
+
+    async def get_stock_values_async(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[StockValue]:
+        path, params = self._stock_values_request(ticker, kind, granularity, start, end)
+        json = await self._get_json_data_async(path, **params)
+        return self._as_stock_values(json, ticker, kind, granularity)
+
+    def max_tickers_per_request(
+        self, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> int:
+        # Only the endpoint of daily values accepts several (comma-separated) tickers
+        match granularity:
+            case StockValueSerieGranularity.COARSE:
+                return self.max_tickers
+            case _:
+                return 1
+
+    def get_stock_values_batch(
+        self,
+        tickers: list[str],
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> dict[str, list[StockValue]]:
+        return dict(
+            self.iter_stock_values_batch(
+                tickers, kind, granularity, start=start, end=end
+            )
+        )
+
+    def iter_stock_values_batch(
+        self,
+        tickers: list[str],
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> Iterator[tuple[str, list[StockValue]]]:
+        chunk_size = self.max_tickers_per_request(kind, granularity)
+        for idx in range(0, len(tickers), chunk_size):
+            chunk = tickers[idx : idx + chunk_size]
+
+            # The serie is not wrapped into a list when a single ticker is requested
+            if len(chunk) == 1:
+                [ticker] = chunk
+                yield ticker, self.get_stock_values(
+                    ticker, kind, granularity, start=start, end=end
+                )
+                continue
+
+            # Series are decoded one by one as the response is received, and are empty
+            # for unknown tickers
+            path, params = self._stock_values_request(
+                ",".join(chunk), kind, granularity, start, end
+            )
+            missing = set(chunk)
+            for serie in self._iter_json_data(path, ("historicalStockList",), **params):
+                if serie:
+                    ticker = serie["symbol"]
+                    missing.discard(ticker)
+                    yield ticker, self._as_stock_values(
+                        serie, ticker, kind, granularity
+                    )
+
+            for ticker in chunk:
+                if ticker in missing:
+                    yield ticker, []
 
     def get_raw_stock_values(
         self,
         ticker: str,
         kind: StockValueKind,
         granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
     ) -> dict:
+        path, params = self._stock_values_request(ticker, kind, granularity, start, end)
+        return self._get_json_data(path, **params)
+
+    @staticmethod
+    def _stock_values_request(
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> tuple[str, dict]:
+        # Both endpoints accept inclusive date bounds, with a daily resolution
+        bounds = {}
+        if start is not None:
+            bounds["from"] = start.date().isoformat()
+        if end is not None:
+            bounds["to"] = end.date().isoformat()
+
         match (kind, granularity):
             case (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE):
-                return self._get_json_data(
-                    f"/historical-price-full/{ticker}",
-                    serietype="line",
-                )
+                return f"/historical-price-full/{ticker}", bounds | {
+                    "serietype": "line"
+                }
 
             case (StockValueKind.OHLC, StockValueSerieGranularity.COARSE):
-                return self._get_json_data(f"/historical-price-full/{ticker}")
+                return f"/historical-price-full/{ticker}", bounds
 
             case (StockValueKind.OHLC, StockValueSerieGranularity.FINE):
-                return self._get_json_data(f"/historical-chart/15min/{ticker}")
+                return f"/historical-chart/15min/{ticker}", bounds
 
             case _:
                 raise TypeError(
                     f"This provider cannot provide ({kind, granularity}) stock values"
                 )
 
+    @staticmethod
+    def _values_path(granularity: StockValueSerieGranularity) -> tuple[str, ...]:
+        """Keys leading to the array of values in the response for a single ticker"""
+        match granularity:
+            case StockValueSerieGranularity.COARSE:
+                return ("historical",)
+            case StockValueSerieGranularity.FINE:
+                return ()
+
+    def _as_stock_values(
+        self,
+        json,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+    ) -> list[StockValue]:
+        if self.batch_validation:
+            ret = self._rows_as_stock_values(
+                self._as_validated_rows(json, kind, granularity),
+                ticker,
+                kind,
+                granularity,
+            )
+        else:
+            ret = [
+                v.as_stock_value(ticker=ticker, interval=granularity.interval)
+                for v in self._as_validated_list_of_values(json, kind, granularity)
+            ]
+
+        logger.info(
+            "Fetched {count} {kind} {granularity}-grained stock values",
+            count=len(ret),
+            kind=kind.value,
+            granularity=granularity.value,
+        )
+        return ret
+
     @staticmethod
     def _as_validated_list_of_values(
         json, kind: StockValueKind, granularity: StockValueSerieGranularity
@@ -170,19 +390,149 @@ class FmpCloud(StockMarketProvider):
             case _:
                 raise TypeError(f"cannot validate ({kind, granularity}) stock values")
 
+    @staticmethod
+    def _as_validated_rows(
+        json, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> list[FmpCloudSimpleRow] | list[FmpCloudOhlcRow]:
+        match (kind, granularity):
+            case (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE):
+                return simple_coarse_rows_adapter.validate_python(json)["historical"]
+
+            case (StockValueKind.OHLC, StockValueSerieGranularity.COARSE):
+                return ohlc_coarse_rows_adapter.validate_python(json)["historical"]
+
+            case (StockValueKind.OHLC, StockValueSerieGranularity.FINE):
+                return ohlc_rows_adapter.validate_python(json)
+
+            case _:
+                raise TypeError(f"cannot validate ({kind, granularity}) stock values")
+
+    @staticmethod
+    def _rows_adapter(
+        kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> TypeAdapter:
+        match (kind, granularity):
+            case (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE):
+                return simple_rows_adapter
+
+            case (StockValueKind.OHLC, _):
+                return ohlc_rows_adapter
+
+            case _:
+                raise TypeError(f"cannot validate ({kind, granularity}) stock values")
+
+    @staticmethod
+    def _rows_as_stock_values(
+        rows: list,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+    ) -> list[StockValue]:
+        """Turn validated rows into stock values, exactly as the `as_stock_value`
+        methods of the models above do. All the values are built by a single call
+        to pydantic, which is much faster than building them one by one."""
+        match kind:
+            case StockValueKind.SIMPLE:
+                values = [
+                    {
+                        "ticker": ticker,
+                        "date": into_datetime(r["date"]),
+                        "close": r["close"],
+                        "interval": granularity.interval,
+                    }
+                    for r in rows
+                ]
+
+            case StockValueKind.OHLC:
+                values = [
+                    {
+                        "ticker": ticker,
+                        "date": (
+                            r["date"]
+                            if isinstance(r["date"], datetime)
+                            else into_datetime(r["date"])
+                        ),
+                        "close": r["close"],
+                        "open": r["open"],
+                        "low": r["low"],
+                        "high": r["high"],
+                        "volume": r["volume"],
+                        "interval": granularity.interval,
+                    }
+                    for r in rows
+                ]
+
+        return stock_values_adapter.validate_python(values)
+
+    @staticmethod
+    def _value_model(
+        kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> type[FmpCloudSimpleValue] | type[FmpCloudOhlcValue]:
+        match (kind, granularity):
+            case (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE):
+                return FmpCloudSimpleValue
+
+            case (StockValueKind.OHLC, _):
+                return FmpCloudOhlcValue
+
+            case _:
+                raise TypeError(f"cannot validate ({kind, granularity}) stock values")
+
     def get_company_info(self, tickers: list[str]) -> list[CompanyInfo]:
+        data = self._get_json_data(self._company_info_path(tickers))
+        return self._as_company_infos(data)
+
+    async def get_company_info_async(self, tickers: list[str]) -> list[CompanyInfo]:
+        data = await self._get_json_data_async(self._company_info_path(tickers))
+        return self._as_company_infos(data)
+
+    @staticmethod
+    def _company_info_path(tickers: list[str]) -> str:
         # This part is sorted so that getting info for the same list of tickers always
         # yields the exact same HTTP request.
         tickers_as_str = ",".join(sorted(tickers))
+        return f"/profile/{tickers_as_str}"
 
-        data = self._get_json_data(f"/profile/{tickers_as_str}")
-
+    @staticmethod
+    def _as_company_infos(data) -> list[CompanyInfo]:
         ret = [FmpCloudCompanyInfo(**v).as_company_info() for v in data]
         logger.info("Fetched company info for {} companies", len(ret))
         return ret
 
+    async def close_async(self) -> None:
+        await close_async_client()
+
     def _get_json_data(self, path: str, **params):
+        return get_json_data(
+            self._url(path),
+            params=self._params(params),
+            expire_after=self._expire_after(path),
+        )
+
+    def _iter_json_data(self, path: str, items_path: tuple[str, ...], **params):
+        return iter_json_data(
+            self._url(path),
+            items_path,
+            params=self._params(params),
+            expire_after=self._expire_after(path),
+        )
+
+    async def _get_json_data_async(self, path: str, **params):
+        return await get_json_data_async(self._url(path), params=self._params(params))
+
+    def _expire_after(self, path: str) -> timedelta | datetime:
+        if path.startswith("/profile/"):
+            return self.profile_expiry
+        elif path.startswith("/historical-chart/"):
+            return self.intraday_expiry
+        else:
+            return next_daily_publication(
+                datetime.now(market_timezone), self.daily_publication_delay
+            )
+
+    def _url(self, path: str) -> str:
         path = path[1:] if path.startswith("/") else path
-        url = f"https://fmpcloud.io/api/v3/{path}"
-        params = params | {"apikey": self.access_key}
-        return get_json_data(str(url), params=params)
+        return f"{self.base_url}/{path}"
+
+    def _params(self, params: dict) -> dict:
+        return params | {"apikey": self.access_key}
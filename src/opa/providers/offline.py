@@ -0,0 +1,256 @@
+"""
+Providers that do not make any request, so that the reader and the storage can be
+exercised (e.g. load-tested) without an API key nor any quota.
+"""
+
+import json
+import math
+import random
+import time as time_
+from abc import abstractmethod
+from datetime import date, datetime, time, timedelta
+from functools import cached_property
+from pathlib import Path
+from threading import Lock
+
+from loguru import logger
+
+from opa import settings
+from opa.core import CompanyInfo
+from opa.core.calendar import market_hours, trading_days
+from opa.core.financial_data import (
+    StockValue,
+    StockValueSerieGranularity,
+    StockValueKind,
+)
+from opa.core.providers import StockMarketProvider
+from opa.providers.fmp_cloud import FmpCloud, into_datetime
+
+
+def synthetic_tickers(nb_tickers: int) -> list[str]:
+    return [f"T{n:05}" for n in range(nb_tickers)]
+
+
+class OfflineProvider(StockMarketProvider):
+    """Base class of the offline providers, which can simulate the latency and the
+    failures of actual requests.
+
+    Each request takes `latency` seconds, and fails with probability `error_rate`.
+    Failures are drawn from a generator seeded with `seed`, so that a run makes the
+    same number of failed requests each time."""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._lock = Lock()
+
+    def provides(
+        self, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> bool:
+        return (kind, granularity) != (
+            StockValueKind.SIMPLE,
+            StockValueSerieGranularity.FINE,
+        )
+
+    def get_stock_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+        start: datetime | None = None,
+        end: datetime | None = None,
+    ) -> list[StockValue]:
+        if not self.provides(kind, granularity):
+            raise TypeError(
+                f"This provider cannot provide ({kind, granularity}) stock values"
+            )
+
+        self._request(f"{kind.value} {granularity.value}-grained values of {ticker}")
+
+        ret = [
+            v
+            for v in self._stock_values(ticker, kind, granularity)
+            if (start is None or v.date >= start) and (end is None or v.date <= end)
+        ]
+
+        logger.info(
+            "Fetched {count} {kind} {granularity}-grained stock values",
+            count=len(ret),
+            kind=kind.value,
+            granularity=granularity.value,
+        )
+        return ret
+
+    def get_company_info(self, tickers: list[str]) -> list[CompanyInfo]:
+        self._request(f"company info of {len(tickers)} companies")
+
+        ret = [
+            CompanyInfo(
+                symbol=ticker,
+                name=f"{ticker} Inc.",
+                currency="USD",
+                website=f"https://www.{ticker.lower()}.com",
+                description=f"Fictitious company traded as {ticker}",
+                sector="Technology",
+                country="US",
+                image="",
+                ipo_date=datetime(2000, 1, 3),
+                address="1 Main Street",
+                city="New York",
+            )
+            for ticker in tickers
+        ]
+        logger.info("Fetched company info for {} companies", len(ret))
+        return ret
+
+    @abstractmethod
+    def _stock_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+    ) -> list[StockValue]:
+        ...
+
+    def _request(self, what: str):
+        if self.latency:
+            time_.sleep(self.latency)
+
+        with self._lock:
+            failed = self._random.random() < self.error_rate
+
+        if failed:
+            raise RuntimeError(f"Simulated failure of the request for {what}")
+
+
+class ReplayProvider(OfflineProvider):
+    """Provides the values recorded in `examples_dir` for any ticker"""
+
+    payloads = {
+        StockValueSerieGranularity.COARSE: "fmpcloud_AAPL_history.json",
+        StockValueSerieGranularity.FINE: "fmpcloud_AAPL_15min.json",
+    }
+
+    def __init__(
+        self,
+        examples_dir: Path | None = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        super().__init__(latency=latency, error_rate=error_rate, seed=seed)
+        self.examples_dir = examples_dir or Path(settings.offline_examples_dir)
+
+    @cached_property
+    def _rows(self) -> dict[tuple[StockValueKind, StockValueSerieGranularity], list]:
+        ret = {}
+        for kind in StockValueKind:
+            for granularity, file in self.payloads.items():
+                if self.provides(kind, granularity):
+                    payload = json.loads((self.examples_dir / file).read_text())
+                    ret[kind, granularity] = FmpCloud._as_validated_rows(
+                        payload, kind, granularity
+                    )
+
+        return ret
+
+    def _stock_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+    ) -> list[StockValue]:
+        return FmpCloud._rows_as_stock_values(
+            self._rows[kind, granularity], ticker, kind, granularity
+        )
+
+
+class SyntheticProvider(OfflineProvider):
+    """Generates random values for any ticker, with the same dates and intervals as
+    the ones of `FmpCloud`.
+
+    Daily values span the `nb_years` years, and intraday values the `nb_intraday_days`
+    trading days, until `end` (today by default). Values only depend on the seed, the
+    ticker, the serie and those bounds."""
+
+    def __init__(
+        self,
+        nb_years: int = 5,
+        nb_intraday_days: int = 20,
+        end: date | None = None,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        super().__init__(latency=latency, error_rate=error_rate, seed=seed)
+        self.nb_years = nb_years
+        self.nb_intraday_days = nb_intraday_days
+        self.end = end
+        self.seed = seed
+
+    def _stock_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        granularity: StockValueSerieGranularity,
+    ) -> list[StockValue]:
+        rng = random.Random(f"{self.seed}:{ticker}:{kind.value}:{granularity.value}")
+        dates, interval = self._dates(kind, granularity)
+
+        # Geometric random walk
+        ret = []
+        close = rng.uniform(10, 500)
+        for date_ in dates:
+            open_ = close
+            close = open_ * math.exp(rng.gauss(0, 0.01))
+
+            if kind == StockValueKind.SIMPLE:
+                ret.append(
+                    StockValue.model_construct(
+                        ticker=ticker, date=date_, close=close, interval=interval
+                    )
+                )
+            else:
+                ret.append(
+                    StockValue.model_construct(
+                        ticker=ticker,
+                        date=date_,
+                        close=close,
+                        open=open_,
+                        low=min(open_, close) * (1 - rng.uniform(0, 0.005)),
+                        high=max(open_, close) * (1 + rng.uniform(0, 0.005)),
+                        volume=rng.randrange(1_000, 1_000_000),
+                        interval=interval,
+                    )
+                )
+
+        # Most recent values first, as fmpcloud does
+        ret.reverse()
+        return ret
+
+    def _dates(
+        self, kind: StockValueKind, granularity: StockValueSerieGranularity
+    ) -> tuple[list[datetime], int]:
+        end = self.end or date.today()
+        start = end - timedelta(days=round(365.25 * self.nb_years))
+
+        match (kind, granularity):
+            case (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE):
+                days = trading_days(start, end)
+                return [into_datetime(d) for d in days], 24 * 60 * 60
+
+            case (StockValueKind.OHLC, StockValueSerieGranularity.COARSE):
+                days = trading_days(start, end)
+                return [datetime.combine(d, time.min) for d in days], 24 * 60 * 60
+
+            case (StockValueKind.OHLC, StockValueSerieGranularity.FINE):
+                days = list(trading_days(start, end))[-self.nb_intraday_days :]
+                bars = []
+                for day in days:
+                    open_at, close_at = market_hours(day)
+                    bar = open_at
+                    while bar <= close_at:
+                        bars.append(bar.replace(tzinfo=None))
+                        bar += timedelta(minutes=15)
+                return bars, 15 * 60
@@ -15,7 +15,8 @@ c.InteractiveShellApp.exec_lines = [
     "from opa.config import settings",
     "from opa.http_methods import get_json_data",
     "from opa.providers import opa_provider",
-    "from opa.storage import opa_storage",
+    "from opa.storage import get_opa_storage",
+    "opa_storage = get_opa_storage()",
     "from opa.auth import opa_auth",
     "from opa.data_report import api",
 ]
@@ -1,15 +1,50 @@
 import os
+from functools import cache
 
 from opa import settings
+from opa.core.storage import Storage
 
 from .mongodb import MongoDbStorage
+from .mongodb_timeseries import MongoDbTimeSeriesStorage
+from .mongodb_buckets import MongoDbBucketStorage
+from .sqlite import SqliteStorage
+from .memory import MemoryStorage, HotTierStorage
 
 
+# Secrets are only needed by the MongoDB backends
 mongodb_uri = "mongodb://{username}:{password}@{host}:{port}".format(
-    username=settings.secrets.mongodb_username,
-    password=settings.secrets.mongodb_password,
+    username=settings.get("secrets.mongodb_username", ""),
+    password=settings.get("secrets.mongodb_password", ""),
     host=settings.mongo_host,
     port=settings.mongo_port,
 )
 
-opa_storage = MongoDbStorage(mongodb_uri, settings.mongo_database)
+
+def get_storage(backend: str, hot_tier_days: int = 0) -> Storage:
+    """The storage of the `backend`, behind a hot tier of the values of the last
+    `hot_tier_days` of each serie if not 0"""
+    if hot_tier_days:
+        return HotTierStorage(
+            get_storage(backend), hot_tier_days, settings.hot_tier_ttl
+        )
+
+    match backend:
+        case "mongodb":
+            return MongoDbStorage(mongodb_uri, settings.mongo_database)
+        case "mongodb_timeseries":
+            return MongoDbTimeSeriesStorage(mongodb_uri, settings.mongo_database)
+        case "mongodb_buckets":
+            return MongoDbBucketStorage(mongodb_uri, settings.mongo_database)
+        case "sqlite":
+            return SqliteStorage(settings.sqlite_path)
+        case "memory":
+            return MemoryStorage()
+        case _:
+            raise ValueError(f"Unknown storage backend : {backend}")
+
+
+@cache
+def get_opa_storage() -> Storage:
+    """The configured storage, created on first use so that importing the storages does
+    not connect to any database"""
+    return get_storage(settings.storage_backend, settings.hot_tier_days)
@@ -0,0 +1,541 @@
+import heapq
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from itertools import islice, repeat
+from threading import Lock
+from typing import Callable, TypeVar
+
+from loguru import logger
+
+from opa.core.financial_data import (
+    StockValue,
+    StockValueKind,
+    CompanyInfo,
+    StockCollectionStats,
+    ImportCheckpoint,
+    InsertResult,
+    StockValueColumns,
+    StockValueResolution,
+    StockValueRollup,
+    epoch_milliseconds,
+    from_epoch_milliseconds,
+    naive_utc,
+)
+from opa.core.storage import DateBounds, Storage
+
+
+# Fields of the values stored in the arrays of a serie, after their dates
+_FIELDS = ["close", "open", "low", "high", "volume"]
+
+# Rows of values read : date (in milliseconds since the epoch), interval and `_FIELDS`
+Row = tuple
+
+T = TypeVar("T", list[StockValue], StockValueColumns)
+
+
+def _page_slice(dates: array, bounds: DateBounds, limit: int) -> slice:
+    """Slice of the `limit` latest of the sorted `dates` in the `bounds` (all of them if
+    0), most recent first"""
+    lo = 0
+    if bounds.start is not None:
+        lo = bisect_left(dates, epoch_milliseconds(bounds.start))
+    hi = len(dates)
+    if bounds.end is not None:
+        search = bisect_right if bounds.end_included else bisect_left
+        hi = search(dates, epoch_milliseconds(bounds.end))
+
+    if limit:
+        lo = max(lo, hi - limit)
+
+    return slice(hi - 1, lo - 1 if lo else None, -1) if hi > lo else slice(0, 0)
+
+
+def _merge_into(column: array, positions: list[int], items: list):
+    """Insert the `items` into the `column`, each one before the element at its position
+    in the column (positions being sorted)"""
+    first = positions[0]
+    tail = column[first:]
+    del column[first:]
+
+    previous = first
+    for position, item in zip(positions, items):
+        column.extend(tail[previous - first : position - first])
+        column.append(item)
+        previous = position
+    column.extend(tail[previous - first :])
+
+
+@dataclass
+class _Serie:
+    """Values of a serie as parallel arrays sorted by date, dates being numbers of
+    milliseconds since the epoch"""
+
+    interval: int
+    kind: StockValueKind
+    dates: array = field(default_factory=lambda: array("q"))
+    columns: dict[str, array] = field(init=False)
+
+    def __post_init__(self):
+        fields = _FIELDS if self.kind == StockValueKind.OHLC else ["close"]
+        self.columns = {f: array("q" if f == "volume" else "d") for f in fields}
+
+    def insert(self, values: list[StockValue]) -> list[StockValue]:
+        """Insert the values whose date is not in the serie yet, and return them.
+
+        The values are merged into the arrays in a single pass over the arrays from the
+        position of the earliest one, so that appending the latest values of a serie
+        does not move the values stored."""
+        by_date: dict[int, StockValue] = {}
+        for v in values:
+            by_date.setdefault(epoch_milliseconds(v.date), v)
+
+        # Positions of the new values in the arrays, as found by binary search
+        positions, new = [], []
+        for date, v in sorted(by_date.items()):
+            idx = bisect_left(self.dates, date)
+            if idx == len(self.dates) or self.dates[idx] != date:
+                positions.append(idx)
+                new.append((date, v))
+
+        if new:
+            _merge_into(self.dates, positions, [date for date, _ in new])
+            for name, column in self.columns.items():
+                _merge_into(column, positions, [getattr(v, name) for _, v in new])
+
+        return [v for _, v in new]
+
+    def latest_rows(self, bounds: DateBounds, limit: int) -> list[Row]:
+        """Rows of the `limit` latest values in the `bounds` (all of them if 0), most
+        recent first"""
+        page = _page_slice(self.dates, bounds, limit)
+        columns = [
+            self.columns[f][page] if f in self.columns else repeat(None)
+            for f in _FIELDS
+        ]
+        return list(zip(self.dates[page], repeat(self.interval), *columns))
+
+    def discard_before(self, date: int):
+        idx = bisect_left(self.dates, date)
+        del self.dates[:idx]
+        for column in self.columns.values():
+            del column[:idx]
+
+
+@dataclass
+class _Rollups:
+    """Rollups of a ticker at a resolution, by start of their period and by interval of
+    their values"""
+
+    dates: array = field(default_factory=lambda: array("q"))
+    rollups: dict[int, dict[int, StockValueRollup]] = field(default_factory=dict)
+
+    def merge(self, rollup: StockValueRollup):
+        date = epoch_milliseconds(rollup.date)
+        by_interval = self.rollups.get(date)
+        if by_interval is None:
+            self.dates.insert(bisect_left(self.dates, date), date)
+            by_interval = self.rollups[date] = {}
+
+        stored = by_interval.get(rollup.interval)
+        by_interval[rollup.interval] = (
+            rollup if stored is None else stored.merge(rollup)
+        )
+
+    def latest_rows(self, bounds: DateBounds, limit: int) -> list[Row]:
+        # Rollups of the coarsest values stored over each period (see
+        # `coarsest_rollups`)
+        rollups = [
+            self.rollups[d][max(self.rollups[d])]
+            for d in self.dates[_page_slice(self.dates, bounds, limit)]
+        ]
+        return [
+            (epoch_milliseconds(r.date), r.resolution.interval)
+            + tuple(getattr(r, f) for f in _FIELDS)
+            for r in rollups
+        ]
+
+
+class MemoryStorage(Storage):
+    """Keeps everything in memory, e.g. to run without any database, or as the hot tier
+    of a `HotTierStorage`.
+
+    Each serie of values is kept as parallel arrays sorted by date : values are inserted
+    at the position found by binary search, a page of values is read from slices of the
+    arrays of each interval, and the stats on a serie from the ends of its arrays."""
+
+    def __init__(self) -> None:
+        self.series: dict[tuple[str, StockValueKind], dict[int, _Serie]] = {}
+        self.rollups: dict[
+            tuple[str, StockValueKind, StockValueResolution], _Rollups
+        ] = {}
+        self.company_infos: dict[str, CompanyInfo] = {}
+        self.checkpoints: set[ImportCheckpoint] = set()
+        self._lock = Lock()
+
+    def insert_values(self, values: list[StockValue]) -> InsertResult:
+        grouped: dict[tuple[str, StockValueKind, int], list[StockValue]] = {}
+        for v in values:
+            grouped.setdefault((v.ticker, v.kind, v.interval), []).append(v)
+
+        inserted = []
+        with self._lock:
+            for (ticker, kind, interval), serie_values in grouped.items():
+                serie = self.series.setdefault((ticker, kind), {}).setdefault(
+                    interval, _Serie(interval, kind)
+                )
+                inserted += serie.insert(serie_values)
+
+            for resolution in StockValueResolution:
+                for r in StockValueRollup.of_values(inserted, resolution):
+                    key = (r.ticker, r.kind, resolution)
+                    self.rollups.setdefault(key, _Rollups()).merge(r)
+
+        result = InsertResult(
+            inserted=len(inserted), skipped=len(values) - len(inserted), invalid=0
+        )
+        logger.info(
+            "Successfully inserted {inserted} new stock values ({skipped} were already stored)",
+            inserted=result.inserted,
+            skipped=result.skipped,
+        )
+
+        return result
+
+    def get_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
+    ) -> list[StockValue]:
+        rows = self._latest_rows(ticker, kind, limit, start, end, cursor, resolution)
+        ret = [
+            StockValue(
+                ticker=ticker,
+                date=from_epoch_milliseconds(date),
+                interval=interval,
+                **dict(zip(_FIELDS, fields)),
+            )
+            for (date, interval, *fields) in rows
+        ]
+        logger.info(
+            "{count} {kind} stock values retrieved from storage",
+            count=len(ret),
+            kind=kind.value,
+        )
+
+        return ret
+
+    def get_values_columnar(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
+    ) -> StockValueColumns:
+        rows = self._latest_rows(ticker, kind, limit, start, end, cursor, resolution)
+        columns = StockValueColumns(ticker, kind)
+        for name, column in zip(columns.fields, zip(*rows)):
+            getattr(columns, name).extend(column)
+
+        return columns
+
+    def get_dates(
+        self, ticker: str, kind: StockValueKind, interval: int | None = None
+    ) -> list[datetime]:
+        with self._lock:
+            series = self.series.get((ticker, kind), {})
+            return [
+                from_epoch_milliseconds(date)
+                for (i, serie) in series.items()
+                if interval in (None, i)
+                for date in serie.dates
+            ]
+
+    def get_all_tickers(self) -> list[str]:
+        return list(self.company_infos)
+
+    def insert_company_infos(self, infos: list[CompanyInfo]):
+        with self._lock:
+            for info in infos:
+                self.company_infos.setdefault(info.symbol, info)
+
+    def get_company_infos(self, tickers: list[str]) -> dict[str, CompanyInfo]:
+        return {t: self.company_infos[t] for t in tickers if t in self.company_infos}
+
+    def get_stats(
+        self, kind: StockValueKind, interval: int | None = None
+    ) -> dict[str, StockCollectionStats]:
+        ret: dict[str, StockCollectionStats] = {}
+        with self._lock:
+            for (ticker, k), series in self.series.items():
+                dates = [
+                    serie.dates
+                    for (i, serie) in series.items()
+                    if k == kind and interval in (None, i) and serie.dates
+                ]
+                if not dates:
+                    continue
+
+                # Stats on the different intervals of a ticker are merged together
+                ret[ticker] = StockCollectionStats(
+                    latest=from_epoch_milliseconds(max(d[-1] for d in dates)),
+                    oldest=from_epoch_milliseconds(min(d[0] for d in dates)),
+                    count=sum(len(d) for d in dates),
+                )
+
+        return ret
+
+    def insert_checkpoints(self, checkpoints: list[ImportCheckpoint]):
+        with self._lock:
+            self.checkpoints.update(checkpoints)
+
+    def get_checkpoints(self, run_id: str) -> list[ImportCheckpoint]:
+        with self._lock:
+            return [c for c in self.checkpoints if c.run_id == run_id]
+
+    def delete_checkpoints(self, run_id: str):
+        with self._lock:
+            self.checkpoints = {c for c in self.checkpoints if c.run_id != run_id}
+
+    def discard_before(
+        self, ticker: str, kind: StockValueKind, date: datetime | None = None
+    ):
+        """Discard the values of a ticker that are older than `date`, all of them if
+        None"""
+        with self._lock:
+            if date is None:
+                self.series.pop((ticker, kind), None)
+                return
+
+            for serie in self.series.get((ticker, kind), {}).values():
+                serie.discard_before(epoch_milliseconds(date))
+
+    def _latest_rows(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int,
+        start: datetime | None,
+        end: datetime | None,
+        cursor: str | None,
+        resolution: StockValueResolution | None,
+    ) -> list[Row]:
+        """Rows of the values of a page (see `Storage.get_values`), read from each
+        interval and merged"""
+        with self._lock:
+            if resolution is not None:
+                rollups = self.rollups.get((ticker, kind, resolution), _Rollups())
+                bounds = DateBounds.of_page(resolution.interval, start, end, cursor)
+                return rollups.latest_rows(bounds, limit)
+
+            streams = [
+                serie.latest_rows(
+                    DateBounds.of_page(interval, start, end, cursor), limit
+                )
+                for (interval, serie) in self.series.get((ticker, kind), {}).items()
+            ]
+
+        merged = heapq.merge(*streams, key=lambda row: (row[0], row[1]), reverse=True)
+        return list(islice(merged, limit or None))
+
+
+class HotTierStorage(Storage):
+    """Keeps the values of the last `days` of each serie of another storage in a
+    `MemoryStorage`, in front of it.
+
+    Values are written through to the other storage. A page of the latest values of a
+    ticker is read from memory when memory holds all of its values, and from the other
+    storage otherwise (e.g. older values). The values of a ticker are loaded from the
+    other storage when they are first read, and again after `ttl` seconds so that the
+    values inserted by other processes are read too.
+
+    Values are loaded without holding the lock, so that loading the values of a ticker
+    does not block the reads and writes of the others."""
+
+    def __init__(self, storage: Storage, days: int, ttl: float = 60) -> None:
+        self.storage = storage
+        self.memory = MemoryStorage()
+        self.period = timedelta(days=days)
+        self.ttl = ttl
+        # Date from which memory holds all the values of a ticker, and time at which
+        # they were loaded
+        self._since: dict[tuple[str, StockValueKind], tuple[datetime, float]] = {}
+        # Number of insertions of values of each ticker, to detect the ones made while
+        # its values are loaded
+        self._writes: dict[tuple[str, StockValueKind], int] = {}
+        self._lock = Lock()
+
+    def insert_values(self, values: list[StockValue]) -> InsertResult:
+        result = self.storage.insert_values(values)
+
+        grouped: dict[tuple[str, StockValueKind], list[StockValue]] = {}
+        for v in values:
+            grouped.setdefault((v.ticker, v.kind), []).append(v)
+
+        with self._lock:
+            for key, serie_values in grouped.items():
+                self._writes[key] = self._writes.get(key, 0) + 1
+                if key not in self._since:
+                    # They are loaded from the other storage when first read
+                    continue
+                if result.invalid:
+                    # Memory does not know which values were rejected, and they are
+                    # loaded again on the next read
+                    del self._since[key]
+                    continue
+
+                since, loaded_at = self._since[key]
+                since = max(since, max(v.date for v in serie_values) - self.period)
+                self.memory.insert_values([v for v in serie_values if v.date >= since])
+                self.memory.discard_before(*key, since)
+                self._since[key] = (since, loaded_at)
+
+        return result
+
+    def get_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
+    ) -> list[StockValue]:
+        if resolution is None:
+            values = self._read_memory(
+                ticker,
+                kind,
+                limit,
+                start,
+                lambda: self.memory.get_values(ticker, kind, limit, start, end, cursor),
+            )
+            if values is not None:
+                return values
+
+        return self.storage.get_values(
+            ticker, kind, limit, start, end, cursor, resolution
+        )
+
+    def get_values_columnar(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
+    ) -> StockValueColumns:
+        if resolution is None:
+            columns = self._read_memory(
+                ticker,
+                kind,
+                limit,
+                start,
+                lambda: self.memory.get_values_columnar(
+                    ticker, kind, limit, start, end, cursor
+                ),
+            )
+            if columns is not None:
+                return columns
+
+        return self.storage.get_values_columnar(
+            ticker, kind, limit, start, end, cursor, resolution
+        )
+
+    def get_dates(
+        self, ticker: str, kind: StockValueKind, interval: int | None = None
+    ) -> list[datetime]:
+        return self.storage.get_dates(ticker, kind, interval)
+
+    def get_all_tickers(self) -> list[str]:
+        return self.storage.get_all_tickers()
+
+    def insert_company_infos(self, infos: list[CompanyInfo]):
+        return self.storage.insert_company_infos(infos)
+
+    def get_company_infos(self, tickers: list[str]) -> dict[str, CompanyInfo]:
+        return self.storage.get_company_infos(tickers)
+
+    def get_stats(
+        self, kind: StockValueKind, interval: int | None = None
+    ) -> dict[str, StockCollectionStats]:
+        return self.storage.get_stats(kind, interval)
+
+    def insert_checkpoints(self, checkpoints: list[ImportCheckpoint]):
+        return self.storage.insert_checkpoints(checkpoints)
+
+    def get_checkpoints(self, run_id: str) -> list[ImportCheckpoint]:
+        return self.storage.get_checkpoints(run_id)
+
+    def delete_checkpoints(self, run_id: str):
+        return self.storage.delete_checkpoints(run_id)
+
+    def _read_memory(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int,
+        start: datetime | None,
+        read: Callable[[], T],
+    ) -> T | None:
+        """Page of values `read` from memory, if memory holds all of them"""
+        self._load(ticker, kind)
+        with self._lock:
+            loaded = self._since.get((ticker, kind))
+            if loaded is None:
+                return None
+            page = read()
+
+        if not self._is_whole_page(len(page), limit, start, loaded[0]):
+            return None
+        return page
+
+    def _load(self, ticker: str, kind: StockValueKind):
+        """Load the latest values of a ticker into memory if they are not there yet
+        (or were loaded more than `ttl` seconds ago).
+
+        The values read from the other storage are not kept if values of the ticker
+        were inserted meanwhile, as they may miss them : they are loaded again on the
+        next read."""
+        key = (ticker, kind)
+        with self._lock:
+            loaded = self._since.get(key)
+            if loaded is not None and time.monotonic() - loaded[1] < self.ttl:
+                return
+            writes = self._writes.get(key, 0)
+
+        since, values = datetime.min, []
+        if latest := self.storage.get_values(ticker, kind, limit=1):
+            since = latest[0].date - self.period
+            values = self.storage.get_values(ticker, kind, limit=0, start=since)
+
+        with self._lock:
+            if self._writes.get(key, 0) != writes:
+                return
+
+            self.memory.discard_before(ticker, kind)
+            self.memory.insert_values(values)
+            self._since[key] = (since, time.monotonic())
+
+    @staticmethod
+    def _is_whole_page(
+        count: int, limit: int, start: datetime | None, since: datetime
+    ) -> bool:
+        """Whether the `count` values of a page read from memory are all of its values,
+        i.e. the values of the page that memory does not hold (older than `since`) would
+        not be in it anyway"""
+        return bool(limit and count == limit) or (
+            start is not None and naive_utc(start) >= since
+        )
@@ -1,6 +1,14 @@
+import heapq
 from collections import Counter
-
-from pymongo import MongoClient
+from datetime import datetime
+from itertools import islice
+from typing import Iterable
+
+from bson import decode_all
+from bson.codec_options import CodecOptions, DatetimeConversion
+from pydantic import TypeAdapter
+from pymongo import MongoClient, ReplaceOne, UpdateOne
+from pymongo.cursor import Cursor
 from pymongo.errors import BulkWriteError, CollectionInvalid
 from loguru import logger
 
@@ -9,8 +17,13 @@ from opa.core.financial_data import (
     StockValueKind,
     CompanyInfo,
     StockCollectionStats,
+    ImportCheckpoint,
+    InsertResult,
+    StockValueColumns,
+    StockValueResolution,
+    StockValueRollup,
 )
-from opa.core.storage import Storage
+from opa.core.storage import DateBounds, Storage, coarsest_rollups
 
 
 # MongoDB error codes that we handle here
@@ -19,6 +32,13 @@ MULTIPLE_ERRORS_OCCURRED_ERROR = 65
 DUPLICATE_KEY_ERROR = 11000
 DOCUMENT_VALIDATION_FAILURE_ERROR = 121
 
+# Converts stock values into documents in one go rather than one by one
+_stock_values_adapter = TypeAdapter(list[StockValue])
+# Decodes dates as numbers of milliseconds since the epoch rather than as `datetime`s
+_columnar_codec_options = CodecOptions(
+    datetime_conversion=DatetimeConversion.DATETIME_MS
+)
+
 
 def _get_json_schema_validator(
     title: str, required_fields: list[str], field_types: dict[str, str]
@@ -45,6 +65,7 @@ class MongoDbStorage(Storage):
         "date": "date",
         "ticker": "string",
         "interval": "int",
+        "kind": "string",
         "close": "double",
         "open": "double",
         "low": "double",
@@ -52,7 +73,17 @@ class MongoDbStorage(Storage):
         "volume": "int",
     }
     stock_value_required_fields = ["_id", "date", "close", "ticker", "interval"]
-    date_ticker_interval_unique_index = {"date": 1, "ticker": 1, "interval": 1}
+    date_ticker_kind_interval_unique_index = {
+        "date": 1,
+        "ticker": 1,
+        "kind": 1,
+        "interval": 1,
+    }
+    # Former unique index, which made values of both kinds at the same date collide
+    date_ticker_interval_index = {"date": 1, "ticker": 1, "interval": 1}
+    # Supports reading the latest values of a serie without sorting them, and reading
+    # their dates from the index only
+    series_index = {"ticker": 1, "kind": 1, "interval": 1, "date": -1}
 
     collection_args = {
         StockValue: {
@@ -64,16 +95,41 @@ class MongoDbStorage(Storage):
                     stock_value_fields_types,
                 )
             },
-            "unique_index": date_ticker_interval_unique_index,
-            "index": {"ticker": 1},
+            "unique_index": date_ticker_kind_interval_unique_index,
+            "index": series_index,
         },
         CompanyInfo: {"name": "company_info", "unique_index": {"symbol": 1}},
+        # Stats on each serie of values (ticker, kind, interval), that are kept up-to-date
+        # on every insertion so that they never have to be computed from all the values.
+        StockCollectionStats: {
+            "name": "series_watermarks",
+            "unique_index": {"ticker": 1, "kind": 1, "interval": 1},
+        },
+        # Series imported by the reader during runs that are not over yet
+        ImportCheckpoint: {
+            "name": "import_checkpoints",
+            "unique_index": {"run_id": 1, "ticker": 1, "kind": 1, "granularity": 1},
+        },
+        # Rollups of the values of each ticker over periods of each resolution, which
+        # are kept up-to-date on every insertion like the stats on the series
+        StockValueRollup: {
+            "name": "stock_value_rollups",
+            "unique_index": {
+                "ticker": 1,
+                "kind": 1,
+                "resolution": 1,
+                "date": -1,
+                "interval": -1,
+            },
+        },
     }
 
     def __init__(self, uri: str, database: str) -> None:
         client: MongoClient = MongoClient(uri, serverSelectionTimeoutMS=5000)
 
         self.db = client.get_database(database)
+        self._add_missing_kinds()
+        self._drop_former_unique_index()
         self._create_collections_if_not_exist()
 
         self.collections = {
@@ -81,109 +137,333 @@ class MongoDbStorage(Storage):
             for (key, coll) in self.collection_args.items()
         }
 
-    def insert_values(self, values: list[StockValue]):
+        if self.collections[StockCollectionStats].estimated_document_count() == 0:
+            self.rebuild_watermarks()
+
+    def insert_values(self, values: list[StockValue]) -> InsertResult:
+        if not values:
+            return InsertResult(inserted=0, skipped=0, invalid=0)
+
         collection = self.collections[StockValue]
-        insertable = [
-            {k: v for (k, v) in val.model_dump().items() if v is not None}
-            for val in values
+        documents = self._as_documents(values)
+
+        # Values already stored are matched by their key and left as they are, rather
+        # than making the whole insertion fail with a duplicate key error per value.
+        # `ordered=False` ensures that all the valid values are inserted even if some
+        # are not.
+        upserts = [
+            UpdateOne(
+                {k: d.pop(k) for k in self.date_ticker_kind_interval_unique_index},
+                {"$setOnInsert": d},
+                upsert=True,
+            )
+            for d in documents
         ]
+
         try:
-            # `ordered=False` ensures that at least some data will be inserted even if there are errors
-            ret = collection.insert_many(insertable, ordered=False)
-            logger.info(
-                "Successfully inserted {count} new stock values",
-                count=len(ret.inserted_ids),
-            )
+            ret = collection.bulk_write(upserts, ordered=False)
+            upserted = set(ret.upserted_ids)
+            write_errors = []
 
-            return ret
         except BulkWriteError as err:
-            # BulkWriteError has a structure that is not very well documented either in
-            # pymongo or in MongoDB documentation :
-            #   * an error code `code`
-            #   * details about the errors in `details`
-            #
-            # `err.details`` is a dictionary with the following keys :
-            #
-            # ```
-            # dict_keys([
-            #    'writeErrors', 'writeConcernErrors', 'nInserted', 'nUpserted', 'nMatched', 'nModified', 'nRemoved', 'upserted'
-            # ])
-            # ```
-            #
-            # `err.details["writeErrors"]` is a [verbose] list of ALL the errors.
-            #
-            # Errors have the following structure :
-            # {'index': * the index of the document that failed validation within the stream we sent * ,
-            #  'code': * the error code *,
-            #  'errmsg': * a nice error message *,
-            #  'op': * the document we tried to insert, as a dict *}
-            #
-            # Duplication errors have the following additional fields :
-            # {'keyPattern': * the fields that are duplicated, as a dict *,
-            #  'keyValue': * the value of the fields that are duplicates, as a dict *}
-            #
-            # Validation errors have the following additional fields :
-            # {'errInfo': * a dictionary with additional details *}
-            # The errInfo["details"] dictionary has the keys "operatorName", "title", "schemaRulesNotSatisfied".
+            # `err.details` has the same counts as a `BulkWriteResult`, as well as a list
+            # of `writeErrors` (with the `index` of the request that failed, its error
+            # `code` and `errmsg`).
             if err.code != MULTIPLE_ERRORS_OCCURRED_ERROR:
                 raise err
 
+            upserted = {u["index"] for u in err.details["upserted"]}
             write_errors = err.details["writeErrors"]
 
-            nb_inserted = err.details["nInserted"]
-            code_counter = Counter((e["code"] for e in write_errors))
-            duplicate_counter = Counter(
-                (
-                    frozenset(e["keyPattern"].keys())
-                    for e in write_errors
-                    if e["code"] == DUPLICATE_KEY_ERROR
-                )
-            )
+        inserted = [values[idx] for idx in upserted]
+        self._update_watermarks(inserted)
+        self._update_rollups(inserted)
+
+        codes = Counter(e["code"] for e in write_errors)
+        result = InsertResult(
+            inserted=len(upserted),
+            # Concurrent upserts of the same value may fail with a duplicate key error
+            skipped=len(values)
+            - len(upserted)
+            - len(write_errors)
+            + codes[DUPLICATE_KEY_ERROR],
+            invalid=len(write_errors) - codes[DUPLICATE_KEY_ERROR],
+        )
 
-            logger.warning(
-                "Only {nb_inserted} stock values out of {write_operations} could be inserted "
-                "({nb_expected_duplicates} were duplicates of existing values)",
-                nb_inserted=nb_inserted,
-                write_operations=len(insertable),
-                nb_expected_duplicates=duplicate_counter[frozenset(["ticker", "date"])],
+        logger.info(
+            "Successfully inserted {inserted} new stock values ({skipped} were already stored)",
+            inserted=result.inserted,
+            skipped=result.skipped,
+        )
+        if codes[DOCUMENT_VALIDATION_FAILURE_ERROR]:
+            logger.error(
+                "{} documents had validation errors",
+                codes[DOCUMENT_VALIDATION_FAILURE_ERROR],
             )
-
-            unexpected_duplicates = (
-                code_counter[DUPLICATE_KEY_ERROR]
-                - duplicate_counter[frozenset(["ticker", "date"])]
+        if other_errors := result.invalid - codes[DOCUMENT_VALIDATION_FAILURE_ERROR]:
+            logger.error(
+                "{} values could not be inserted : {}",
+                other_errors,
+                {e["errmsg"] for e in write_errors},
             )
-            if unexpected_duplicates:
-                logger.error(
-                    "{} values were unexpected duplicates", unexpected_duplicates
-                )
 
-            validation_errors = code_counter[DOCUMENT_VALIDATION_FAILURE_ERROR]
-            if validation_errors:
-                logger.error("{} documents had validation errors", validation_errors)
+        return result
+
+    @staticmethod
+    def _as_documents(values: list[StockValue]) -> list[dict]:
+        documents = _stock_values_adapter.dump_python(values, exclude_none=True)
+        for d in documents:
+            d["kind"] = (
+                StockValueKind.OHLC if "open" in d else StockValueKind.SIMPLE
+            ).value
+
+        return documents
 
     def get_values(
-        self, ticker: str, kind: StockValueKind, limit: int = 500
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
     ) -> list[StockValue]:
-        collection = self.collections[StockValue]
-        base_query = (
-            {"open": {"$exists": 1}}
-            if kind == StockValueKind.OHLC
-            else {"open": {"$exists": 0}}
+        if resolution is not None:
+            return self._get_rollups(
+                ticker, kind, limit, start, end, cursor, resolution
+            )
+
+        cursors = self._values_cursors(ticker, kind, limit, start, end, cursor)
+        ret = [StockValue(**d) for d in self._merge_latest(cursors, limit)]
+        logger.info(
+            "{count} {kind} stock values retrieved from storage",
+            count=len(ret),
+            kind=kind.value,
         )
-        query = base_query | {"ticker": ticker}
 
+        return ret
+
+    def get_dates(
+        self, ticker: str, kind: StockValueKind, interval: int | None = None
+    ) -> list[datetime]:
+        return [d["date"] for d in self._dates_cursor(ticker, kind, interval)]
+
+    def get_values_columnar(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
+    ) -> StockValueColumns:
+        if resolution is not None:
+            return super().get_values_columnar(
+                ticker, kind, limit, start, end, cursor, resolution
+            )
+
+        # Documents are decoded in batches by the C extension of `bson`, and copied
+        # into the columns without validating them again
+        columns = StockValueColumns(ticker, kind)
+        cursors = self._values_cursors(
+            ticker,
+            kind,
+            limit,
+            start,
+            end,
+            cursor,
+            projection={"_id": 0} | {name: 1 for name in columns.fields},
+            raw=True,
+        )
+        docs = self._merge_latest(
+            [
+                (d for batch in c for d in decode_all(batch, _columnar_codec_options))
+                for c in cursors
+            ],
+            limit,
+        )
+
+        columns.date.extend(int(d["date"]) for d in docs)
+        for name in columns.fields[1:]:
+            getattr(columns, name).extend(d[name] for d in docs)
+
+        logger.info(
+            "{count} {kind} stock values retrieved from storage",
+            count=len(columns),
+            kind=kind.value,
+        )
+
+        return columns
+
+    def _values_cursors(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        projection: dict | None = None,
+        raw: bool = False,
+    ) -> list[Cursor]:
+        """Cursors on the latest values of each interval of a serie that may be in a
+        page of values, either as documents or as batches of raw BSON documents.
+
+        The values of each interval are read in order from `series_index`, from the
+        end of the page, so that reading a page costs the same whatever its depth."""
+        collection = self.collections[StockValue]
+        query = {"ticker": ticker, "kind": kind.value}
+        find = collection.find_raw_batches if raw else collection.find
+
+        ret = []
+        for interval in collection.distinct("interval", query):
+            interval_query = query | {"interval": interval}
+            bounds = DateBounds.of_page(interval, start, end, cursor)
+            if dates := self._dates_filter(bounds):
+                interval_query |= {"date": dates}
+
+            ret.append(
+                find(
+                    interval_query,
+                    projection=projection or {"_id": 0, "kind": 0},
+                    limit=limit,
+                ).sort("date", -1)
+            )
+
+        return ret
+
+    def _get_rollups(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int,
+        start: datetime | None,
+        end: datetime | None,
+        cursor: str | None,
+        resolution: StockValueResolution,
+    ) -> list[StockValue]:
+        query: dict = {
+            "ticker": ticker,
+            "kind": kind.value,
+            "resolution": resolution.value,
+        }
+        bounds = DateBounds.of_page(resolution.interval, start, end, cursor)
+        if dates := self._dates_filter(bounds):
+            query |= {"date": dates}
+
+        rollups = (
+            self.collections[StockValueRollup]
+            .find(query, projection={"_id": 0})
+            .sort([("date", -1), ("interval", -1)])
+        )
         ret = [
-            StockValue(**d)
-            for d in collection.find(query, limit=limit).sort("date", -1)
+            self._rollup_as_value(r, resolution)
+            for r in islice(
+                coarsest_rollups(rollups, lambda r: r["date"]), limit or None
+            )
         ]
         logger.info(
-            "{count} {kind} stock values retrieved from storage",
+            "{count} {kind} {resolution} rollups retrieved from storage",
             count=len(ret),
             kind=kind.value,
+            resolution=resolution.value,
+        )
+
+        return ret
+
+    @staticmethod
+    def _rollup_as_value(doc: dict, resolution: StockValueResolution) -> StockValue:
+        first = doc["first"][0] if "first" in doc else {}
+        return StockValue(
+            ticker=doc["ticker"],
+            date=doc["date"],
+            close=doc["last"][0]["close"],
+            interval=resolution.interval,
+            open=first.get("open"),
+            low=doc.get("low"),
+            high=doc.get("high"),
+            volume=doc.get("volume"),
         )
 
+    @staticmethod
+    def _merge_latest(streams: list[Iterable[dict]], limit: int) -> list[dict]:
+        """The `limit` latest documents of several streams of documents ordered by
+        decreasing dates, in the order of `Storage.get_values`"""
+        merged = heapq.merge(
+            *streams, key=lambda d: (d["date"], d["interval"]), reverse=True
+        )
+        return list(islice(merged, limit or None))
+
+    @staticmethod
+    def _dates_filter(bounds: DateBounds) -> dict:
+        ret = {}
+        if bounds.start is not None:
+            ret["$gte"] = bounds.start
+        if bounds.end is not None:
+            ret["$lte" if bounds.end_included else "$lt"] = bounds.end
         return ret
 
+    def _dates_cursor(
+        self, ticker: str, kind: StockValueKind, interval: int | None
+    ) -> Cursor:
+        """The dates of the values of a serie, read from `series_index` only"""
+        query: dict = {"ticker": ticker, "kind": kind.value}
+        if interval is not None:
+            query |= {"interval": interval}
+
+        return self.collections[StockValue].find(
+            query, projection={"_id": 0, "date": 1}
+        )
+
+    @staticmethod
+    def _open_filter(kind: StockValueKind) -> dict:
+        return (
+            {"open": {"$exists": 1}}
+            if kind == StockValueKind.OHLC
+            else {"open": {"$exists": 0}}
+        )
+
+    def _add_missing_kinds(self):
+        """Store the kind of the values stored before it was stored explicitly. This is
+        done once, before `series_index` is created."""
+        name = self.collection_args[StockValue]["name"]
+        if name not in self.db.list_collection_names():
+            return
+
+        collection = self.db[name]
+        if any(
+            dict(i["key"]) == self.series_index
+            for i in collection.index_information().values()
+        ):
+            return
+
+        logger.info("Storing the kind of the values of {}", name)
+        self.db.command(
+            "collMod",
+            name,
+            validator=self.collection_args[StockValue]["create_args"]["validator"],
+        )
+        for kind in StockValueKind:
+            collection.update_many(
+                self._open_filter(kind) | {"kind": {"$exists": 0}},
+                {"$set": {"kind": kind.value}},
+            )
+
+    def _drop_former_unique_index(self):
+        """Drop the unique index of the values that did not include their kind, once
+        their kind is stored"""
+        name = self.collection_args[StockValue]["name"]
+        if name not in self.db.list_collection_names():
+            return
+
+        collection = self.db[name]
+        for index_name, index in collection.index_information().items():
+            if dict(index["key"]) == self.date_ticker_interval_index:
+                logger.info("Dropping the former unique index of {}", name)
+                collection.drop_index(index_name)
+
     def get_all_tickers(self) -> list[str]:
         return self.collections[CompanyInfo].distinct("symbol")
 
@@ -207,33 +487,191 @@ class MongoDbStorage(Storage):
 
         return ret
 
-    def get_stats(self, kind: StockValueKind) -> dict[str, StockCollectionStats]:
-        filter = (
-            {"open": {"$exists": 1}}
-            if kind == StockValueKind.OHLC
-            else {"open": {"$exists": 0}}
+    def get_stats(
+        self, kind: StockValueKind, interval: int | None = None
+    ) -> dict[str, StockCollectionStats]:
+        query: dict = {"kind": kind.value}
+        if interval is not None:
+            query |= {"interval": interval}
+
+        ret: dict[str, StockCollectionStats] = {}
+        for w in self.collections[StockCollectionStats].find(query):
+            stats = StockCollectionStats(
+                latest=w["latest"], oldest=w["oldest"], count=w["count"]
+            )
+
+            # Stats on the different intervals of a ticker are merged together
+            other = ret.get(w["ticker"])
+            if other is not None:
+                stats = StockCollectionStats(
+                    latest=max(stats.latest, other.latest),
+                    oldest=min(stats.oldest, other.oldest),
+                    count=stats.count + other.count,
+                )
+
+            ret[w["ticker"]] = stats
+
+        logger.info("Getting stats from storage")
+
+        return ret
+
+    def rebuild_watermarks(self):
+        """Compute the stats on each serie from all the values stored, e.g. to initialize
+        them on a database that was created before they existed."""
+        logger.info("Rebuilding stats on all the series stored")
+
+        grouped = self.collections[StockValue].aggregate(
+            [
+                {
+                    "$group": {
+                        "_id": {
+                            "ticker": "$ticker",
+                            "kind": "$kind",
+                            "interval": "$interval",
+                        },
+                        "latest": {"$max": "$date"},
+                        "oldest": {"$min": "$date"},
+                        "count": {"$sum": 1},
+                    }
+                },
+            ]
         )
-        ret = {
-            grouped["_id"]: StockCollectionStats(
-                **{k: v for k, v in grouped.items() if k != "_id"}
+        self._replace_watermarks(grouped)
+
+    def _replace_watermarks(self, grouped: Iterable[dict]):
+        """Replace the stats of series by the ones in `grouped`, as documents whose
+        `_id` identifies the serie (ticker, kind, interval)"""
+        updates = [
+            ReplaceOne(
+                g["_id"],
+                g["_id"] | {k: g[k] for k in ["latest", "oldest", "count"]},
+                upsert=True,
             )
-            for grouped in self.collections[StockValue].aggregate(
-                [
-                    {"$match": filter},
+            for g in grouped
+        ]
+        if updates:
+            self.collections[StockCollectionStats].bulk_write(updates, ordered=False)
+
+    def insert_checkpoints(self, checkpoints: list[ImportCheckpoint]):
+        if not checkpoints:
+            return
+
+        # Upserts, so that a serie imported again does not fail on the unique index
+        self.collections[ImportCheckpoint].bulk_write(
+            [
+                UpdateOne(
+                    doc := c.model_dump(mode="json"), {"$setOnInsert": doc}, upsert=True
+                )
+                for c in checkpoints
+            ],
+            ordered=False,
+        )
+
+    def get_checkpoints(self, run_id: str) -> list[ImportCheckpoint]:
+        return [
+            ImportCheckpoint(**c)
+            for c in self.collections[ImportCheckpoint].find(
+                {"run_id": run_id}, projection={"_id": 0}
+            )
+        ]
+
+    def delete_checkpoints(self, run_id: str):
+        self.collections[ImportCheckpoint].delete_many({"run_id": run_id})
+
+    def rebuild_rollups(self):
+        """Compute the rollups of all the values stored, e.g. to initialize them on a
+        database that was created before they existed.
+
+        This must not run while values are inserted, hence it is not run on startup but
+        as a migration (see the end of this module)."""
+        logger.info("Rebuilding the rollups of all the series stored")
+
+        # Dropped rather than emptied, so that its indexes are the current ones
+        self.collections[StockValueRollup].drop()
+        self._create_collections_if_not_exist()
+        for kind in StockValueKind:
+            for ticker in self.get_stats(kind):
+                self._update_rollups(self.get_values(ticker, kind, limit=0))
+
+    def _update_rollups(self, inserted: list[StockValue]):
+        rollups = [
+            r
+            for resolution in StockValueResolution
+            for r in StockValueRollup.of_values(inserted, resolution)
+        ]
+        if not rollups:
+            return
+
+        self.collections[StockValueRollup].bulk_write(
+            [
+                UpdateOne(
                     {
-                        "$group": {
-                            "_id": "$ticker",
-                            "latest": {"$max": "$date"},
-                            "oldest": {"$min": "$date"},
-                            "count": {"$count": {}},
-                        }
+                        "ticker": r.ticker,
+                        "kind": r.kind.value,
+                        "resolution": r.resolution.value,
+                        "date": r.date,
+                        "interval": r.interval,
                     },
-                ]
-            )
-        }
-        logger.info("Getting stats from storage")
+                    self._rollup_update(r),
+                    upsert=True,
+                )
+                for r in rollups
+            ],
+            ordered=False,
+        )
 
-        return ret
+    @staticmethod
+    def _rollup_update(rollup: StockValueRollup) -> dict:
+        """Update merging the `rollup` into the one stored for the same period and
+        interval.
+
+        Only the earliest and the latest of the values pushed into `first` and `last`
+        are kept, along with their date, so that the opening and closing values of the
+        period are right whatever the order in which its values are inserted."""
+
+        def keep_one(item: dict, order: int) -> dict:
+            return {"$each": [item], "$sort": {"date": order}, "$slice": 1}
+
+        update: dict = {
+            "$push": {
+                "last": keep_one({"date": rollup.last_date, "close": rollup.close}, -1)
+            }
+        }
+        if rollup.kind == StockValueKind.OHLC:
+            update["$push"]["first"] = keep_one(
+                {"date": rollup.first_date, "open": rollup.open}, 1
+            )
+            update |= {
+                "$min": {"low": rollup.low},
+                "$max": {"high": rollup.high},
+                "$inc": {"volume": rollup.volume},
+            }
+
+        return update
+
+    def _update_watermarks(self, inserted: list[StockValue]):
+        series: dict[tuple[str, str, int], list[StockValue]] = {}
+        for v in inserted:
+            series.setdefault((v.ticker, v.kind.value, v.interval), []).append(v)
+
+        if not series:
+            return
+
+        self.collections[StockCollectionStats].bulk_write(
+            [
+                UpdateOne(
+                    {"ticker": ticker, "kind": kind, "interval": interval},
+                    {
+                        "$max": {"latest": max(v.date for v in values)},
+                        "$min": {"oldest": min(v.date for v in values)},
+                        "$inc": {"count": len(values)},
+                    },
+                    upsert=True,
+                )
+                for ((ticker, kind, interval), values) in series.items()
+            ],
+            ordered=False,
+        )
 
     def _create_collections_if_not_exist(self):
         for coll in self.collection_args.values():
@@ -261,3 +699,12 @@ class MongoDbStorage(Storage):
             if index:
                 # create_index is invariant and won't raise if the index already exists
                 self.db[name].create_index(index.items())
+
+
+if __name__ == "__main__":
+    from opa import settings
+    from opa.storage import get_storage
+
+    # Rollups of the MongoDB backend in use are rebuilt on demand, e.g. after upgrading
+    # a database created before them, while no values are inserted.
+    get_storage(settings.storage_backend).rebuild_rollups()  # type: ignore
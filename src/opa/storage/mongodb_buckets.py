@@ -0,0 +1,247 @@
+import heapq
+from datetime import datetime, time
+from itertools import islice
+from typing import Iterator
+
+from loguru import logger
+from pymongo import UpdateOne
+
+from opa.core.financial_data import (
+    InsertResult,
+    StockValue,
+    StockValueKind,
+    StockValueResolution,
+)
+from opa.core.storage import DateBounds, Storage
+from opa.storage.mongodb import MongoDbStorage
+
+
+# Identifies a bucket : ticker, kind, interval and start of the bucket
+BucketKey = tuple[str, str, int, datetime]
+
+
+class MongoDbBucketStorage(MongoDbStorage):
+    """Stores the stock values of a serie in buckets, one document per day for intraday
+    values (and per year for daily values), which hold the dates and the fields of the
+    values as parallel arrays.
+
+    Values are appended to their bucket with `$push`, after filtering out those whose
+    date is already in it."""
+
+    ohlc_fields = ["close", "open", "low", "high", "volume"]
+    collection_args = MongoDbStorage.collection_args | {
+        StockValue: {
+            "name": "stock_value_buckets",
+            "unique_index": {"ticker": 1, "kind": 1, "interval": 1, "start": -1},
+        },
+    }
+
+    def insert_values(self, values: list[StockValue]) -> InsertResult:
+        buckets: dict[BucketKey, dict[datetime, StockValue]] = {}
+        for v in values:
+            buckets.setdefault(self._bucket_key(v), {}).setdefault(v.date, v)
+
+        stored = self._stored_dates(list(buckets))
+        new_values = {
+            key: [v for (date, v) in bucket.items() if date not in stored.get(key, ())]
+            for (key, bucket) in buckets.items()
+        }
+
+        updates = [
+            UpdateOne(self._bucket_filter(key), self._push(bucket_values), upsert=True)
+            for (key, bucket_values) in new_values.items()
+            if bucket_values
+        ]
+        if updates:
+            self.collections[StockValue].bulk_write(updates, ordered=False)
+
+        inserted = [v for bucket_values in new_values.values() for v in bucket_values]
+        self._update_watermarks(inserted)
+        self._update_rollups(inserted)
+
+        result = InsertResult(
+            inserted=len(inserted), skipped=len(values) - len(inserted), invalid=0
+        )
+        logger.info(
+            "Successfully inserted {inserted} new stock values ({skipped} were already stored)",
+            inserted=result.inserted,
+            skipped=result.skipped,
+        )
+
+        return result
+
+    def get_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
+    ) -> list[StockValue]:
+        if resolution is not None:
+            return self._get_rollups(
+                ticker, kind, limit, start, end, cursor, resolution
+            )
+
+        collection = self.collections[StockValue]
+        query = {"ticker": ticker, "kind": kind.value}
+
+        # Buckets of each interval are read from the most recent one, and only until
+        # enough values are unpacked
+        streams = []
+        for interval in collection.distinct("interval", query):
+            bounds = DateBounds.of_page(interval, start, end, cursor)
+            bucket_query: dict = query | {"interval": interval}
+            if bounds.start is not None:
+                bucket_query.setdefault("start", {})["$gte"] = self._bucket_start(
+                    bounds.start, interval
+                )
+            if bounds.end is not None:
+                bucket_query.setdefault("start", {})["$lte"] = bounds.end
+
+            buckets = collection.find(bucket_query, projection={"_id": 0}).sort(
+                "start", -1
+            )
+            streams.append(self._unpack_all(buckets, bounds))
+
+        ret = list(
+            islice(
+                heapq.merge(*streams, key=lambda v: (v.date, v.interval), reverse=True),
+                limit or None,
+            )
+        )
+
+        logger.info(
+            "{count} {kind} stock values retrieved from storage",
+            count=len(ret),
+            kind=kind.value,
+        )
+
+        return ret
+
+    # Values are not stored in documents of their own, which are read as columns
+    get_values_columnar = Storage.get_values_columnar
+
+    def get_dates(
+        self, ticker: str, kind: StockValueKind, interval: int | None = None
+    ) -> list[datetime]:
+        query: dict = {"ticker": ticker, "kind": kind.value}
+        if interval is not None:
+            query |= {"interval": interval}
+
+        return [
+            date
+            for bucket in self.collections[StockValue].find(
+                query, projection={"_id": 0, "dates": 1}
+            )
+            for date in bucket["dates"]
+        ]
+
+    def rebuild_watermarks(self):
+        logger.info("Rebuilding stats on all the series stored")
+
+        grouped = self.collections[StockValue].aggregate(
+            [
+                {
+                    "$group": {
+                        "_id": {
+                            "ticker": "$ticker",
+                            "kind": "$kind",
+                            "interval": "$interval",
+                        },
+                        "latest": {"$max": {"$max": "$dates"}},
+                        "oldest": {"$min": {"$min": "$dates"}},
+                        "count": {"$sum": {"$size": "$dates"}},
+                    }
+                },
+            ]
+        )
+        self._replace_watermarks(grouped)
+
+    def _add_missing_kinds(self):
+        # The kind of the values is always stored in their bucket
+        ...
+
+    def _drop_former_unique_index(self):
+        # The values were never unique without their kind
+        ...
+
+    def _stored_dates(self, keys: list[BucketKey]) -> dict[BucketKey, set[datetime]]:
+        """Dates of the values already stored in the buckets with the given keys"""
+        starts: dict[tuple[str, str, int], list[datetime]] = {}
+        for ticker, kind, interval, start in keys:
+            starts.setdefault((ticker, kind, interval), []).append(start)
+
+        ret = {}
+        for (ticker, kind, interval), serie_starts in starts.items():
+            for bucket in self.collections[StockValue].find(
+                {
+                    "ticker": ticker,
+                    "kind": kind,
+                    "interval": interval,
+                    "start": {"$in": serie_starts},
+                },
+                projection={"_id": 0, "start": 1, "dates": 1},
+            ):
+                ret[ticker, kind, interval, bucket["start"]] = set(bucket["dates"])
+
+        return ret
+
+    def _push(self, values: list[StockValue]) -> dict:
+        """Update appending the `values` to their bucket"""
+        fields = (
+            self.ohlc_fields if values[0].kind == StockValueKind.OHLC else ["close"]
+        )
+        arrays = {"dates": [v.date for v in values]} | {
+            field: [getattr(v, field) for v in values] for field in fields
+        }
+
+        return {"$push": {k: {"$each": array} for (k, array) in arrays.items()}}
+
+    def _unpack_all(
+        self, buckets: Iterator[dict], bounds: DateBounds
+    ) -> Iterator[StockValue]:
+        """Values of the `buckets` in the `bounds`"""
+        for bucket in buckets:
+            yield from (v for v in self._unpack(bucket) if v.date in bounds)
+
+    def _unpack(self, bucket: dict) -> list[StockValue]:
+        """Values of a bucket, most recent first"""
+        fields = [f for f in self.ohlc_fields if f in bucket]
+        rows = sorted(
+            zip(bucket["dates"], *(bucket[f] for f in fields)),
+            key=lambda row: row[0],
+            reverse=True,
+        )
+
+        return [
+            StockValue(
+                ticker=bucket["ticker"],
+                interval=bucket["interval"],
+                date=row[0],
+                **dict(zip(fields, row[1:])),
+            )
+            for row in rows
+        ]
+
+    @classmethod
+    def _bucket_key(cls, value: StockValue) -> BucketKey:
+        return (
+            value.ticker,
+            value.kind.value,
+            value.interval,
+            cls._bucket_start(value.date, value.interval),
+        )
+
+    @staticmethod
+    def _bucket_start(date: datetime, interval: int) -> datetime:
+        if interval < 24 * 60 * 60:
+            return datetime.combine(date.date(), time.min)
+        return datetime(date.year, 1, 1)
+
+    @staticmethod
+    def _bucket_filter(key: BucketKey) -> dict:
+        ticker, kind, interval, start = key
+        return {"ticker": ticker, "kind": kind, "interval": interval, "start": start}
@@ -0,0 +1,286 @@
+import heapq
+from datetime import datetime
+from itertools import islice
+from typing import Iterable, Iterator
+
+from loguru import logger
+from pymongo.collection import Collection
+from pymongo.errors import CollectionInvalid
+
+from opa.core.financial_data import (
+    InsertResult,
+    StockValue,
+    StockValueKind,
+    StockValueResolution,
+)
+from opa.core.storage import DateBounds, Storage
+from opa.storage.mongodb import MongoDbStorage
+
+
+class MongoDbTimeSeriesStorage(MongoDbStorage):
+    """Stores stock values in MongoDB time-series collections, one per interval, which
+    group the values of a serie into compressed buckets.
+
+    Each value is a measurement whose `date` is the time field, and whose ticker, interval
+    and kind are the metadata identifying its serie. Time-series collections cannot have
+    unique indexes, so the values already stored are filtered out before inserting the
+    others."""
+
+    collection_args = {
+        key: args
+        for (key, args) in MongoDbStorage.collection_args.items()
+        if key is not StockValue
+    }
+    series_collection_prefix = "stock_values_ts_"
+
+    def __init__(self, uri: str, database: str) -> None:
+        self.series_collections: dict[int, Collection] = {}
+        super().__init__(uri, database)
+
+    def insert_values(self, values: list[StockValue]) -> InsertResult:
+        inserted = self._insert_new_values(values)
+        self._update_watermarks(inserted)
+        self._update_rollups(inserted)
+
+        result = InsertResult(
+            inserted=len(inserted), skipped=len(values) - len(inserted), invalid=0
+        )
+        logger.info(
+            "Successfully inserted {inserted} new stock values ({skipped} were already stored)",
+            inserted=result.inserted,
+            skipped=result.skipped,
+        )
+
+        return result
+
+    def get_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
+    ) -> list[StockValue]:
+        if resolution is not None:
+            return self._get_rollups(
+                ticker, kind, limit, start, end, cursor, resolution
+            )
+
+        cursors = []
+        for interval, collection in self.series_collections.items():
+            query: dict = {"meta.ticker": ticker, "meta.kind": kind.value}
+            bounds = DateBounds.of_page(interval, start, end, cursor)
+            if dates := self._dates_filter(bounds):
+                query |= {"date": dates}
+
+            cursors.append(
+                self._as_values(collection.find(query, limit=limit).sort("date", -1))
+            )
+
+        ret = list(
+            islice(
+                heapq.merge(*cursors, key=lambda v: (v.date, v.interval), reverse=True),
+                limit or None,
+            )
+        )
+
+        logger.info(
+            "{count} {kind} stock values retrieved from storage",
+            count=len(ret),
+            kind=kind.value,
+        )
+
+        return ret
+
+    # Values are not stored in documents of their own, which are read as columns
+    get_values_columnar = Storage.get_values_columnar
+
+    def get_dates(
+        self, ticker: str, kind: StockValueKind, interval: int | None = None
+    ) -> list[datetime]:
+        collections = (
+            self.series_collections.values()
+            if interval is None
+            else [self.series_collections[interval]]
+            if interval in self.series_collections
+            else []
+        )
+
+        return [
+            d["date"]
+            for collection in collections
+            for d in collection.find(
+                {"meta.ticker": ticker, "meta.kind": kind.value},
+                projection={"_id": 0, "date": 1},
+            )
+        ]
+
+    def rebuild_watermarks(self):
+        logger.info("Rebuilding stats on all the series stored")
+
+        for collection in self.series_collections.values():
+            grouped = collection.aggregate(
+                [
+                    {
+                        "$group": {
+                            "_id": "$meta",
+                            "latest": {"$max": "$date"},
+                            "oldest": {"$min": "$date"},
+                            "count": {"$sum": 1},
+                        }
+                    },
+                ]
+            )
+            self._replace_watermarks(grouped)
+
+    def migrate(self, source: str = "stock_values", batch_size: int = 10_000) -> int:
+        """Copy the values of the `source` collection of a `MongoDbStorage` into the
+        time-series collections, and return the number of values copied.
+
+        Values already copied are skipped, so that an interrupted migration can be run
+        again. The `source` collection is left as is."""
+        # Values of a ticker are read together, so that they fill the same buckets
+        cursor = self.db[source].find(projection={"_id": 0}).sort("ticker", 1)
+
+        nb_copied = 0
+        while docs := list(islice(cursor, batch_size)):
+            nb_copied += len(self._insert_new_values([StockValue(**d) for d in docs]))
+            logger.info("{} stock values copied from {}", nb_copied, source)
+
+        self.rebuild_watermarks()
+        self.rebuild_rollups()
+        return nb_copied
+
+    def _insert_new_values(self, values: list[StockValue]) -> list[StockValue]:
+        """Insert the values that are not stored yet, and return them"""
+        by_interval: dict[int, list[StockValue]] = {}
+        for v in values:
+            by_interval.setdefault(v.interval, []).append(v)
+
+        inserted = []
+        for interval, interval_values in by_interval.items():
+            collection = self._series_collection(interval)
+            new_values = self._not_stored(collection, interval_values)
+            if new_values:
+                collection.insert_many(
+                    [self._as_document(v) for v in new_values], ordered=False
+                )
+                inserted += new_values
+
+        return inserted
+
+    @staticmethod
+    def _not_stored(
+        collection: Collection, values: list[StockValue]
+    ) -> list[StockValue]:
+        """Values of a same interval that are not in the collection (nor duplicates of
+        each other)"""
+        by_serie: dict[tuple[str, StockValueKind], dict[datetime, StockValue]] = {}
+        for v in values:
+            by_serie.setdefault((v.ticker, v.kind), {}).setdefault(v.date, v)
+
+        ret = []
+        for (ticker, kind), by_date in by_serie.items():
+            stored = {
+                d["date"]
+                for d in collection.find(
+                    {
+                        "meta.ticker": ticker,
+                        "meta.kind": kind.value,
+                        "date": {"$gte": min(by_date), "$lte": max(by_date)},
+                    },
+                    projection={"_id": 0, "date": 1},
+                )
+            }
+            ret += [v for (date, v) in by_date.items() if date not in stored]
+
+        return ret
+
+    def _series_collection(self, interval: int) -> Collection:
+        collection = self.series_collections.get(interval)
+        if collection is not None:
+            return collection
+
+        name = f"{self.series_collection_prefix}{interval}"
+        try:
+            self.db.create_collection(
+                name,
+                check_exists=True,
+                timeseries={
+                    "timeField": "date",
+                    "metaField": "meta",
+                    "granularity": self._granularity(interval),
+                },
+            )
+            logger.info("Collection {} successfully created", name)
+        except CollectionInvalid as err:
+            if "already exists" not in err.args[0]:
+                raise err
+
+        collection = self.db[name]
+        collection.create_index(
+            [("meta.ticker", 1), ("meta.kind", 1), ("date", -1)],
+        )
+        self.series_collections[interval] = collection
+        return collection
+
+    @staticmethod
+    def _granularity(interval: int) -> str:
+        """Granularity of the buckets of a time-series collection, which should match
+        the time between two values of a serie"""
+        if interval < 60:
+            return "seconds"
+        if interval < 60 * 60:
+            return "minutes"
+        return "hours"
+
+    def _add_missing_kinds(self):
+        # The kind of the values is always stored in their metadata
+        ...
+
+    def _drop_former_unique_index(self):
+        # The values were never unique without their kind
+        ...
+
+    def _create_collections_if_not_exist(self):
+        super()._create_collections_if_not_exist()
+
+        for name in self.db.list_collection_names():
+            if name.startswith(self.series_collection_prefix):
+                interval = int(name.removeprefix(self.series_collection_prefix))
+                self._series_collection(interval)
+
+    @staticmethod
+    def _as_document(value: StockValue) -> dict:
+        doc = {
+            k: v
+            for (k, v) in value.model_dump(exclude={"ticker", "interval"}).items()
+            if v is not None
+        }
+        doc["meta"] = {
+            "ticker": value.ticker,
+            "interval": value.interval,
+            "kind": value.kind.value,
+        }
+        return doc
+
+    @classmethod
+    def _as_values(cls, docs: Iterable[dict]) -> Iterator[StockValue]:
+        for doc in docs:
+            yield cls._as_value(doc)
+
+    @staticmethod
+    def _as_value(doc: dict) -> StockValue:
+        meta = doc["meta"]
+        fields = {k: v for (k, v) in doc.items() if k not in {"_id", "meta"}}
+        return StockValue(ticker=meta["ticker"], interval=meta["interval"], **fields)
+
+
+if __name__ == "__main__":
+    from opa import settings
+    from opa.storage import mongodb_uri
+
+    storage = MongoDbTimeSeriesStorage(mongodb_uri, settings.mongo_database)
+    storage.migrate()
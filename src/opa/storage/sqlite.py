@@ -0,0 +1,491 @@
+import heapq
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from pathlib import Path
+from threading import Lock
+from typing import Iterator
+
+from loguru import logger
+
+from opa.core.financial_data import (
+    StockValue,
+    StockValueKind,
+    CompanyInfo,
+    StockCollectionStats,
+    ImportCheckpoint,
+    InsertResult,
+    StockValueColumns,
+    StockValueResolution,
+    StockValueRollup,
+    epoch_milliseconds,
+    from_epoch_milliseconds,
+)
+from opa.core.storage import DateBounds, Storage, coarsest_rollups
+
+
+# Dates are stored as numbers of milliseconds since the epoch. Tables of values are
+# clustered on their primary key (WITHOUT ROWID), so that the values of a serie are
+# stored in the order of their dates and read from a single range of the table.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS stock_values (
+    ticker TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    interval INTEGER NOT NULL,
+    date INTEGER NOT NULL,
+    close REAL NOT NULL,
+    open REAL,
+    low REAL,
+    high REAL,
+    volume INTEGER,
+    PRIMARY KEY (ticker, kind, interval, date)
+) WITHOUT ROWID;
+
+-- Stats on each serie of values, kept up-to-date on every insertion, so that the stats
+-- on all the series of a kind are read from a range of the primary key
+CREATE TABLE IF NOT EXISTS series_watermarks (
+    kind TEXT NOT NULL,
+    interval INTEGER NOT NULL,
+    ticker TEXT NOT NULL,
+    latest INTEGER NOT NULL,
+    oldest INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (kind, interval, ticker)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS stock_value_rollups (
+    ticker TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    resolution TEXT NOT NULL,
+    date INTEGER NOT NULL,
+    interval INTEGER NOT NULL,
+    first_date INTEGER NOT NULL,
+    last_date INTEGER NOT NULL,
+    close REAL NOT NULL,
+    open REAL,
+    low REAL,
+    high REAL,
+    volume INTEGER,
+    PRIMARY KEY (ticker, kind, resolution, date, interval)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS company_infos (
+    symbol TEXT PRIMARY KEY,
+    info TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS import_checkpoints (
+    run_id TEXT NOT NULL,
+    ticker TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    granularity TEXT NOT NULL,
+    PRIMARY KEY (run_id, ticker, kind, granularity)
+) WITHOUT ROWID;
+"""
+
+# Columns of the rows of values read, in the order of the fields of `StockValueColumns`
+_VALUE_COLUMNS = ["date", "interval", "close", "open", "low", "high", "volume"]
+
+# Key of a stock value : ticker, kind, interval and date
+ValueKey = tuple[str, str, int, int]
+
+
+class SqliteStorage(Storage):
+    """Stores everything in a SQLite database file, so that no database server is
+    needed.
+
+    The database is in WAL mode, so that reading is not blocked by insertions. Values
+    are inserted in a transaction that also updates the stats and the rollups of their
+    series, after filtering out those that are already stored."""
+
+    def __init__(self, path: str) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+
+        # The connection is shared by the threads of the reader and of the API, which
+        # use it in turn. Transactions are started explicitly.
+        self.connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._lock = Lock()
+
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        # In WAL mode, this may only lose the last transactions on a power loss, whose
+        # values are fetched again by the next import
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(_SCHEMA)
+
+    def insert_values(self, values: list[StockValue]) -> InsertResult:
+        new_values: dict[ValueKey, StockValue] = {}
+        with self._transaction() as db:
+            stored = self._stored_keys(db, values)
+            for v in values:
+                key = (v.ticker, v.kind.value, v.interval, epoch_milliseconds(v.date))
+                if key not in stored:
+                    new_values.setdefault(key, v)
+
+            db.executemany(
+                "INSERT INTO stock_values VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT DO NOTHING",
+                [
+                    key + (v.close, v.open, v.low, v.high, v.volume)
+                    for (key, v) in new_values.items()
+                ],
+            )
+            self._update_watermarks(db, list(new_values))
+            self._update_rollups(db, list(new_values.values()))
+
+        result = InsertResult(
+            inserted=len(new_values), skipped=len(values) - len(new_values), invalid=0
+        )
+        logger.info(
+            "Successfully inserted {inserted} new stock values ({skipped} were already stored)",
+            inserted=result.inserted,
+            skipped=result.skipped,
+        )
+
+        return result
+
+    def get_values(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
+    ) -> list[StockValue]:
+        rows = self._latest_rows(ticker, kind, limit, start, end, cursor, resolution)
+        ret = [self._as_value(ticker, row) for row in rows]
+        logger.info(
+            "{count} {kind} stock values retrieved from storage",
+            count=len(ret),
+            kind=kind.value,
+        )
+
+        return ret
+
+    def get_values_columnar(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int = 500,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        cursor: str | None = None,
+        resolution: StockValueResolution | None = None,
+    ) -> StockValueColumns:
+        # Rows already have dates as numbers of milliseconds, and are copied into the
+        # columns as they are
+        rows = self._latest_rows(ticker, kind, limit, start, end, cursor, resolution)
+        columns = StockValueColumns(ticker, kind)
+        for name, column in zip(columns.fields, zip(*rows)):
+            getattr(columns, name).extend(column)
+
+        logger.info(
+            "{count} {kind} stock values retrieved from storage",
+            count=len(columns),
+            kind=kind.value,
+        )
+
+        return columns
+
+    def get_dates(
+        self, ticker: str, kind: StockValueKind, interval: int | None = None
+    ) -> list[datetime]:
+        sql = "SELECT date FROM stock_values WHERE ticker = ? AND kind = ?"
+        params: list = [ticker, kind.value]
+        if interval is not None:
+            sql += " AND interval = ?"
+            params.append(interval)
+
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+
+        return [from_epoch_milliseconds(date) for (date,) in rows]
+
+    def get_all_tickers(self) -> list[str]:
+        with self._lock:
+            rows = self.connection.execute("SELECT symbol FROM company_infos")
+            return [symbol for (symbol,) in rows]
+
+    def insert_company_infos(self, infos: list[CompanyInfo]):
+        with self._transaction() as db:
+            db.executemany(
+                "INSERT INTO company_infos VALUES (?, ?) ON CONFLICT DO NOTHING",
+                [(i.symbol, i.model_dump_json()) for i in infos],
+            )
+
+    def get_company_infos(self, tickers: list[str]) -> dict[str, CompanyInfo]:
+        placeholders = ", ".join("?" * len(tickers))
+        with self._lock:
+            rows = self.connection.execute(
+                f"SELECT info FROM company_infos WHERE symbol IN ({placeholders})",
+                tickers,
+            ).fetchall()
+
+        ret = {
+            info.symbol: info
+            for info in (CompanyInfo.model_validate_json(i) for (i,) in rows)
+        }
+        logger.info("Fetched company info for {} companies from storage", len(ret))
+
+        return ret
+
+    def get_stats(
+        self, kind: StockValueKind, interval: int | None = None
+    ) -> dict[str, StockCollectionStats]:
+        sql = (
+            "SELECT ticker, latest, oldest, count FROM series_watermarks WHERE kind = ?"
+        )
+        params: list = [kind.value]
+        if interval is not None:
+            sql += " AND interval = ?"
+            params.append(interval)
+
+        with self._lock:
+            rows = self.connection.execute(sql, params).fetchall()
+
+        ret: dict[str, StockCollectionStats] = {}
+        for ticker, latest, oldest, count in rows:
+            stats = StockCollectionStats(
+                latest=from_epoch_milliseconds(latest),
+                oldest=from_epoch_milliseconds(oldest),
+                count=count,
+            )
+
+            # Stats on the different intervals of a ticker are merged together
+            other = ret.get(ticker)
+            if other is not None:
+                stats = StockCollectionStats(
+                    latest=max(stats.latest, other.latest),
+                    oldest=min(stats.oldest, other.oldest),
+                    count=stats.count + other.count,
+                )
+
+            ret[ticker] = stats
+
+        logger.info("Getting stats from storage")
+
+        return ret
+
+    def insert_checkpoints(self, checkpoints: list[ImportCheckpoint]):
+        with self._transaction() as db:
+            db.executemany(
+                "INSERT INTO import_checkpoints VALUES (?, ?, ?, ?) "
+                "ON CONFLICT DO NOTHING",
+                [
+                    (c.run_id, c.ticker, c.kind.value, c.granularity.value)
+                    for c in checkpoints
+                ],
+            )
+
+    def get_checkpoints(self, run_id: str) -> list[ImportCheckpoint]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT ticker, kind, granularity FROM import_checkpoints "
+                "WHERE run_id = ?",
+                [run_id],
+            ).fetchall()
+
+        return [
+            ImportCheckpoint(
+                run_id=run_id, ticker=ticker, kind=kind, granularity=granularity
+            )
+            for (ticker, kind, granularity) in rows
+        ]
+
+    def delete_checkpoints(self, run_id: str):
+        with self._transaction() as db:
+            db.execute("DELETE FROM import_checkpoints WHERE run_id = ?", [run_id])
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction, which locks the database from its start so that what is
+        read in it is still true when writing"""
+        with self._lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+
+            self.connection.execute("COMMIT")
+
+    @staticmethod
+    def _stored_keys(db: sqlite3.Connection, values: list[StockValue]) -> set[ValueKey]:
+        """Keys of the values of the same series and dates as `values` that are already
+        stored, read from a range of the primary key per serie"""
+        series: dict[tuple[str, str, int], list[int]] = {}
+        for v in values:
+            serie = (v.ticker, v.kind.value, v.interval)
+            series.setdefault(serie, []).append(epoch_milliseconds(v.date))
+
+        ret = set()
+        for serie, dates in series.items():
+            rows = db.execute(
+                "SELECT date FROM stock_values WHERE ticker = ? AND kind = ? "
+                "AND interval = ? AND date BETWEEN ? AND ?",
+                [*serie, min(dates), max(dates)],
+            )
+            ret |= {serie + (date,) for (date,) in rows}
+
+        return ret
+
+    @staticmethod
+    def _update_watermarks(db: sqlite3.Connection, inserted: list[ValueKey]):
+        series: dict[tuple[str, int, str], list[int]] = {}
+        for ticker, kind, interval, date in inserted:
+            series.setdefault((kind, interval, ticker), []).append(date)
+
+        db.executemany(
+            """
+            INSERT INTO series_watermarks VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT DO UPDATE SET
+                latest = max(latest, excluded.latest),
+                oldest = min(oldest, excluded.oldest),
+                count = count + excluded.count
+            """,
+            [
+                serie + (max(dates), min(dates), len(dates))
+                for (serie, dates) in series.items()
+            ],
+        )
+
+    @staticmethod
+    def _update_rollups(db: sqlite3.Connection, inserted: list[StockValue]):
+        """Merge the rollups of the values inserted into the ones stored for the same
+        period and interval. The opening and closing values of a period are the ones of
+        its earliest and latest values, whatever the order in which its values are
+        inserted."""
+        rollups = [
+            r
+            for resolution in StockValueResolution
+            for r in StockValueRollup.of_values(inserted, resolution)
+        ]
+
+        db.executemany(
+            """
+            INSERT INTO stock_value_rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT DO UPDATE SET
+                first_date = min(first_date, excluded.first_date),
+                open = iif(excluded.first_date < first_date, excluded.open, open),
+                last_date = max(last_date, excluded.last_date),
+                close = iif(excluded.last_date > last_date, excluded.close, close),
+                low = min(low, excluded.low),
+                high = max(high, excluded.high),
+                volume = volume + excluded.volume
+            """,
+            [
+                (
+                    r.ticker,
+                    r.kind.value,
+                    r.resolution.value,
+                    epoch_milliseconds(r.date),
+                    r.interval,
+                    epoch_milliseconds(r.first_date),
+                    epoch_milliseconds(r.last_date),
+                    r.close,
+                    r.open,
+                    r.low,
+                    r.high,
+                    r.volume,
+                )
+                for r in rollups
+            ],
+        )
+
+    def _latest_rows(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int,
+        start: datetime | None,
+        end: datetime | None,
+        cursor: str | None,
+        resolution: StockValueResolution | None,
+    ) -> list[tuple]:
+        """Rows of `_VALUE_COLUMNS` of the values of a page (see `Storage.get_values`).
+
+        The values of each interval are read from a range of the primary key, from the
+        end of the page, and merged."""
+        if resolution is not None:
+            return self._latest_rollup_rows(
+                ticker, kind, limit, start, end, cursor, resolution
+            )
+
+        intervals = self._intervals(ticker, kind)
+        streams = []
+        with self._lock:
+            for interval in intervals:
+                bounds = DateBounds.of_page(interval, start, end, cursor)
+                dates_sql, dates_params = self._dates_condition(bounds)
+                streams.append(
+                    self.connection.execute(
+                        f"SELECT {', '.join(_VALUE_COLUMNS)} FROM stock_values "
+                        f"WHERE ticker = ? AND kind = ? AND interval = ?{dates_sql} "
+                        "ORDER BY date DESC LIMIT ?",
+                        [ticker, kind.value, interval] + dates_params + [limit or -1],
+                    ).fetchall()
+                )
+
+        merged = heapq.merge(*streams, key=lambda row: (row[0], row[1]), reverse=True)
+        return list(islice(merged, limit or None))
+
+    def _latest_rollup_rows(
+        self,
+        ticker: str,
+        kind: StockValueKind,
+        limit: int,
+        start: datetime | None,
+        end: datetime | None,
+        cursor: str | None,
+        resolution: StockValueResolution,
+    ) -> list[tuple]:
+        """Rows of `_VALUE_COLUMNS` of the rollups of a page, read from a range of the
+        primary key, of the coarsest values stored over each period"""
+        bounds = DateBounds.of_page(resolution.interval, start, end, cursor)
+        dates_sql, dates_params = self._dates_condition(bounds)
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT date, close, open, low, high, volume FROM stock_value_rollups "
+                f"WHERE ticker = ? AND kind = ? AND resolution = ?{dates_sql} "
+                "ORDER BY date DESC, interval DESC",
+                [ticker, kind.value, resolution.value] + dates_params,
+            )
+            rollups = coarsest_rollups(rows, lambda row: row[0])
+            return [
+                (date, resolution.interval, *fields)
+                for (date, *fields) in islice(rollups, limit or None)
+            ]
+
+    def _intervals(self, ticker: str, kind: StockValueKind) -> list[int]:
+        with self._lock:
+            rows = self.connection.execute(
+                "SELECT interval FROM series_watermarks WHERE kind = ? AND ticker = ?",
+                [kind.value, ticker],
+            )
+            return [interval for (interval,) in rows]
+
+    @staticmethod
+    def _as_value(ticker: str, row: tuple) -> StockValue:
+        date, *fields = row
+        return StockValue(
+            ticker=ticker,
+            date=from_epoch_milliseconds(date),
+            **dict(zip(_VALUE_COLUMNS[1:], fields)),
+        )
+
+    @staticmethod
+    def _dates_condition(bounds: DateBounds) -> tuple[str, list]:
+        sql, params = "", []
+        if bounds.start is not None:
+            sql += " AND date >= ?"
+            params.append(epoch_milliseconds(bounds.start))
+        if bounds.end is not None:
+            sql += " AND date <= ?" if bounds.end_included else " AND date < ?"
+            params.append(epoch_milliseconds(bounds.end))
+
+        return sql, params
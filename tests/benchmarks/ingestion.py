@@ -0,0 +1,278 @@
+"""
+Benchmark of a whole ingestion (`FinancialDataReader.run`) from an offline provider
+into an in-memory storage, for several numbers of tickers.
+
+Each case runs in its own process, so that peak memory use is measured per case :
+
+    python -m tests.benchmarks.ingestion --tickers 10 100 1000 --output results.json
+
+Results of another commit can be compared with `--compare previous.json`.
+"""
+
+import gc
+import json
+import platform
+import resource
+import subprocess
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from functools import wraps
+from multiprocessing import get_context
+from threading import Lock
+
+from loguru import logger
+
+from opa import settings
+from opa.core import FinancialDataReader, StockValueKind
+
+# `opa.providers` instantiates the configured provider on import, which must not require
+# any API key, and the configured storage must not require any database.
+settings.set("providers", ["synthetic"])
+settings.set("storage_backend", "memory")
+settings.set("hot_tier_days", 0)
+
+from opa.providers import ReplayProvider, SyntheticProvider, synthetic_tickers
+from opa.storage import MemoryStorage
+
+
+@dataclass
+class Case:
+    nb_tickers: int
+    provider: str = "synthetic"
+    nb_years: int = 5
+    max_workers: int = 8
+    batch_size: int = 10_000
+    # Latency of the provider's requests, in seconds
+    latency: float = 0.0
+
+
+@dataclass
+class Result:
+    case: Case
+    wall_seconds: float
+    # Wall time of each step of the run, in the order they happen
+    phases: dict[str, float]
+    # Time spent in each method of the provider and the storage, summed over all the
+    # threads calling them
+    cumulative_seconds: dict[str, float]
+    nb_values: int
+    values_per_second: float
+    peak_rss_bytes: int
+    # Number of collections of each generation of the garbage collector, which are
+    # triggered by allocations of objects
+    gc_collections: list[int]
+    # Peak of the memory allocated by Python, measured on a second run as tracing
+    # allocations slows the run down
+    traced_peak_bytes: int
+
+
+def instrument(obj, methods: list[str], timings: Counter, prefix: str):
+    """Replace methods of `obj` by ones adding their duration to `timings`"""
+    lock = Lock()
+
+    for name in methods:
+        method = getattr(obj, name)
+
+        @wraps(method)
+        def timed(*args, _method=method, _key=f"{prefix}.{name}", **kwargs):
+            start = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                with lock:
+                    timings[_key] += time.perf_counter() - start
+
+        setattr(obj, name, timed)
+
+
+def make_reader(case: Case) -> tuple[FinancialDataReader, Counter, dict]:
+    match case.provider:
+        case "synthetic":
+            # A fixed end date keeps the values the same from one day to another
+            provider = SyntheticProvider(
+                nb_years=case.nb_years, end=date(2023, 7, 7), latency=case.latency
+            )
+        case "replay":
+            provider = ReplayProvider(latency=case.latency)
+        case _:
+            raise ValueError(f"Unknown provider : {case.provider}")
+
+    storage = MemoryStorage()
+    cumulative: Counter = Counter()
+    instrument(
+        provider,
+        ["get_company_info", "get_stock_values", "get_stock_values_batch"],
+        cumulative,
+        "provider",
+    )
+    instrument(
+        storage,
+        ["insert_company_infos", "insert_values", "get_stats"],
+        cumulative,
+        "storage",
+    )
+
+    reader = FinancialDataReader(
+        provider,
+        storage,
+        max_workers=case.max_workers,
+        batch_size=case.batch_size,
+    )
+
+    # Series are stored one after the other by the main thread, so the wall time of
+    # each step is the one spent storing the serie (including waiting for its values).
+    phases: dict = {}
+    for name in ["import_company_info", "_store_new_values"]:
+        method = getattr(reader, name)
+
+        @wraps(method)
+        def timed(*args, _method=method, **kwargs):
+            start = time.perf_counter()
+            try:
+                return _method(*args, **kwargs)
+            finally:
+                match args:
+                    case (_, kind, granularity, *_):
+                        phase = f"{kind.value}/{granularity.value}"
+                    case _:
+                        phase = "company_info"
+                phases[phase] = time.perf_counter() - start
+
+        setattr(reader, name, timed)
+
+    return reader, cumulative, phases
+
+
+def run_case(case: Case) -> Result:
+    logger.remove()
+    tickers = synthetic_tickers(case.nb_tickers)
+
+    reader, cumulative, phases = make_reader(case)
+    collections = [g["collections"] for g in gc.get_stats()]
+    start = time.perf_counter()
+    reader.run(tickers)
+    wall = time.perf_counter() - start
+    collections = [g["collections"] - c for g, c in zip(gc.get_stats(), collections)]
+
+    nb_values = sum(
+        stats.count
+        for kind in StockValueKind
+        for stats in reader.storage.get_stats(kind).values()
+    )
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    del reader
+
+    reader, _, _ = make_reader(case)
+    tracemalloc.start()
+    reader.run(tickers)
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return Result(
+        case=case,
+        wall_seconds=wall,
+        phases=phases,
+        cumulative_seconds=dict(cumulative),
+        nb_values=nb_values,
+        values_per_second=nb_values / wall,
+        peak_rss_bytes=peak_rss,
+        gc_collections=collections,
+        traced_peak_bytes=traced_peak,
+    )
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            check=True,
+            text=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], previous: list[dict]):
+    def key(r):
+        return tuple(sorted(r["case"].items()))
+
+    before = {key(r): r for r in previous}
+    for r in results:
+        if (p := before.get(key(r))) is None:
+            continue
+
+        print(f"{r['case']['nb_tickers']} tickers :")
+        for metric in [
+            "wall_seconds",
+            "values_per_second",
+            "peak_rss_bytes",
+            "traced_peak_bytes",
+        ]:
+            change = (r[metric] - p[metric]) / p[metric] * 100
+            print(
+                f"  {metric:>20} {p[metric]:>14.2f} -> {r[metric]:>14.2f} ({change:+.1f}%)"
+            )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(
+        description="Benchmark an ingestion from an offline provider"
+    )
+    parser.add_argument("--tickers", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument(
+        "--provider", choices=["synthetic", "replay"], default="synthetic"
+    )
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--max-workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--output", help="JSON file to save the results to")
+    parser.add_argument("--compare", help="JSON file of results to compare with")
+    args = parser.parse_args()
+
+    cases = [
+        Case(
+            nb_tickers=n,
+            provider=args.provider,
+            nb_years=args.years,
+            max_workers=args.max_workers,
+            batch_size=args.batch_size,
+            latency=args.latency,
+        )
+        for n in args.tickers
+    ]
+
+    results = []
+    for case in cases:
+        with ProcessPoolExecutor(1, mp_context=get_context("spawn")) as executor:
+            result = asdict(executor.submit(run_case, case).result())
+
+        print(
+            f"{case.nb_tickers} tickers : {result['nb_values']} values in "
+            f"{result['wall_seconds']:.2f}s ({result['values_per_second']:.0f} values/s), "
+            f"peak RSS {result['peak_rss_bytes'] / 2**20:.0f} MiB"
+        )
+        results.append(result)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "date": datetime.now().isoformat(),
+                    "python": platform.python_version(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
@@ -0,0 +1,189 @@
+"""
+Benchmark of the layouts of stock values in MongoDB and in SQLite : size of the values
+and of their indexes on disk, and latency of reading the latest values of a ticker, for
+the intraday values of several tickers.
+
+The MongoDB layouts need a MongoDB server, in which a database is created (and dropped)
+per layout, while the SQLite database is created in a temporary directory :
+
+    python -m tests.benchmarks.storage_layouts --tickers 100 --days 20 --output results.json
+"""
+
+import json
+import statistics
+import time
+from argparse import ArgumentParser
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from typing import Iterator
+
+from loguru import logger
+from pymongo import MongoClient
+
+from opa import settings
+from opa.core import Storage, StockValue, StockValueKind, StockValueSerieGranularity
+
+# `opa.providers` instantiates the configured provider on import, which must not require
+# any API key, and the SQLite layout must be benchmarked without any MongoDB server.
+settings.set("providers", ["synthetic"])
+settings.set("storage_backend", "sqlite")
+settings.set("hot_tier_days", 0)
+
+from opa.providers import SyntheticProvider, synthetic_tickers
+from opa.storage import (
+    MongoDbBucketStorage,
+    MongoDbStorage,
+    MongoDbTimeSeriesStorage,
+    SqliteStorage,
+    mongodb_uri,
+)
+from tests.benchmarks.ingestion import git_commit
+
+
+layouts = {
+    "documents": MongoDbStorage,
+    "timeseries": MongoDbTimeSeriesStorage,
+    "buckets": MongoDbBucketStorage,
+    "sqlite": SqliteStorage,
+}
+
+
+@dataclass
+class Result:
+    layout: str
+    nb_tickers: int
+    nb_days: int
+    nb_values: int
+    insert_seconds: float
+    # Sizes on disk of the collections of values, and of their indexes
+    storage_bytes: int
+    index_bytes: int
+    # Latencies of reading the `limit` latest values of a ticker, in milliseconds
+    read_p50_ms: float
+    read_p95_ms: float
+
+
+@contextmanager
+def empty_storage(layout: str) -> Iterator[Storage]:
+    if layout == "sqlite":
+        with TemporaryDirectory() as directory:
+            yield SqliteStorage(str(Path(directory) / "benchmark.sqlite3"))
+        return
+
+    database = f"{settings.mongo_database}-benchmark-{layout}"
+    client: MongoClient = MongoClient(mongodb_uri)
+    client.drop_database(database)
+    try:
+        yield layouts[layout](mongodb_uri, database)
+    finally:
+        client.drop_database(database)
+
+
+def sizes_on_disk(storage: Storage) -> tuple[int, int]:
+    """Sizes of the values stored and of their indexes, in bytes"""
+    if isinstance(storage, SqliteStorage):
+        # Values are stored in their primary key, which is the only index on them
+        (size,) = storage.connection.execute(
+            "SELECT sum(pgsize) FROM dbstat WHERE name = 'stock_values'"
+        ).fetchone()
+        return size, 0
+
+    assert isinstance(storage, MongoDbStorage)
+    if isinstance(storage, MongoDbTimeSeriesStorage):
+        names = [c.name for c in storage.series_collections.values()]
+    else:
+        names = [storage.collections[StockValue].name]
+
+    stats = [storage.db.command("collStats", name) for name in names]
+    return (
+        sum(s["storageSize"] for s in stats),
+        sum(s["totalIndexSize"] for s in stats),
+    )
+
+
+def run_layout(
+    layout: str, nb_tickers: int, nb_days: int, limit: int, batch_size: int
+) -> Result:
+    # A fixed end date keeps the values the same from one day to another
+    provider = SyntheticProvider(nb_intraday_days=nb_days, end=date(2023, 7, 7))
+    tickers = synthetic_tickers(nb_tickers)
+
+    with empty_storage(layout) as storage:
+        nb_values = 0
+        insert_seconds = 0.0
+        for ticker in tickers:
+            values = provider.get_stock_values(
+                ticker, StockValueKind.OHLC, StockValueSerieGranularity.FINE
+            )
+            nb_values += len(values)
+
+            start = time.perf_counter()
+            for idx in range(0, len(values), batch_size):
+                storage.insert_values(values[idx : idx + batch_size])
+            insert_seconds += time.perf_counter() - start
+
+        storage_bytes, index_bytes = sizes_on_disk(storage)
+
+        latencies = []
+        for ticker in tickers:
+            start = time.perf_counter()
+            storage.get_values(ticker, StockValueKind.OHLC, limit=limit)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+        percentiles = statistics.quantiles(latencies, n=20)
+        return Result(
+            layout=layout,
+            nb_tickers=nb_tickers,
+            nb_days=nb_days,
+            nb_values=nb_values,
+            insert_seconds=insert_seconds,
+            storage_bytes=storage_bytes,
+            index_bytes=index_bytes,
+            read_p50_ms=statistics.median(latencies),
+            read_p95_ms=percentiles[18],
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the layouts of stock values")
+    parser.add_argument(
+        "--layouts", nargs="+", choices=list(layouts), default=list(layouts)
+    )
+    parser.add_argument("--tickers", type=int, default=100)
+    parser.add_argument("--days", type=int, default=20)
+    parser.add_argument(
+        "--limit", type=int, default=500, help="Number of values read at once"
+    )
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--output", help="JSON file to save the results to")
+    args = parser.parse_args()
+
+    logger.remove()
+
+    results = []
+    for layout in args.layouts:
+        result = run_layout(
+            layout, args.tickers, args.days, args.limit, args.batch_size
+        )
+        print(
+            f"{layout:>10} : {result.storage_bytes / 2**20:.1f} MiB of values, "
+            f"{result.index_bytes / 2**20:.1f} MiB of indexes, "
+            f"inserted in {result.insert_seconds:.2f}s, "
+            f"read in {result.read_p50_ms:.1f}ms (p95 {result.read_p95_ms:.1f}ms)"
+        )
+        results.append(asdict(result))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "commit": git_commit(),
+                    "date": datetime.now().isoformat(),
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
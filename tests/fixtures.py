@@ -1,4 +1,4 @@
-from datetime import timedelta
+from datetime import datetime, timedelta
 
 import pytest
 from faker import Faker
@@ -66,6 +66,42 @@ def stock_values_serie(
     ]
 
 
+@pytest.fixture
+def overlapping_stock_values(ticker) -> list[StockValue]:
+    """OHLC values of 3 days : daily values of the first two, and 15 minutes values of
+    the last two, as if the daily value of the last day were not published yet"""
+    days = [datetime(2023, 7, 5), datetime(2023, 7, 6), datetime(2023, 7, 7)]
+
+    def value(date: datetime, interval: int, volume: int) -> StockValue:
+        return StockValue(
+            ticker=ticker,
+            date=date,
+            interval=interval,
+            close=fake_value(),
+            open=fake_value(),
+            low=fake_value(),
+            high=fake_value(),
+            volume=volume,
+        )
+
+    return [value(d, 24 * 60 * 60, 5000) for d in days[:2]] + [
+        value(d + timedelta(hours=9, minutes=30 + 15 * n), 15 * 60, 1000)
+        for d in days[1:]
+        for n in range(2)
+    ]
+
+
+@pytest.fixture
+def both_kinds_stock_values(ticker) -> list[StockValue]:
+    """A SIMPLE and an OHLC daily value of a ticker at the same date"""
+    date = datetime(2023, 7, 5)
+    simple = StockValue(ticker=ticker, date=date, interval=24 * 60 * 60, close=1.0)
+    ohlc = simple.model_copy(
+        update={"close": 2.0, "open": 1.5, "low": 1.0, "high": 2.5, "volume": 1000}
+    )
+    return [simple, ohlc]
+
+
 @pytest.fixture
 def company_infos() -> list[CompanyInfo]:
     return [
@@ -74,6 +74,51 @@ class TestStockValues:
         assert r.status_code == 200
         assert isinstance(r.json(), list)
 
+    def test_pages(self, api_host, actual_ticker, stock_value_kind, credentials):
+        url = f"http://{api_host}:8000/{actual_ticker}"
+        params = {"kind": stock_value_kind.value, "limit": 10}
+
+        r = requests.get(url, params=params, auth=credentials)
+        assert r.status_code == 200
+        first_page = r.json()
+
+        r = requests.get(
+            url,
+            params=params | {"cursor": r.headers["X-Next-Cursor"]},
+            auth=credentials,
+        )
+        assert r.status_code == 200
+        assert r.json()[0]["date"] < first_page[-1]["date"]
+
+    def test_invalid_cursor(
+        self, api_host, actual_ticker, stock_value_kind, credentials
+    ):
+        r = requests.get(
+            f"http://{api_host}:8000/{actual_ticker}",
+            params={"kind": stock_value_kind.value, "cursor": "invalid"},
+            auth=credentials,
+        )
+        assert r.status_code == 400
+
+    def test_resolution(self, api_host, actual_ticker, stock_value_kind, credentials):
+        r = requests.get(
+            f"http://{api_host}:8000/{actual_ticker}",
+            params={"kind": stock_value_kind.value, "resolution": "1w", "limit": 10},
+            auth=credentials,
+        )
+        assert r.status_code == 200
+        assert {v["interval"] for v in r.json()} <= {7 * 24 * 60 * 60}
+
+    def test_columns(self, api_host, actual_ticker, stock_value_kind, credentials):
+        r = requests.get(
+            f"http://{api_host}:8000/{actual_ticker}/columns",
+            params={"kind": stock_value_kind.value, "limit": 10},
+            auth=credentials,
+        )
+        assert r.status_code == 200
+        columns = r.json()
+        assert len({len(values) for values in columns.values()}) == 1
+
 
 class TestCompanyInfo:
     def test_not_auth(self, api_host, actual_ticker):
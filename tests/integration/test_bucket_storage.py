@@ -0,0 +1,125 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from opa import settings
+from opa.core import StockCollectionStats, page_cursor, StockValue, StockValueKind
+from opa.storage import MongoDbBucketStorage, mongodb_uri
+
+
+database = f"{settings.mongo_database}-buckets"
+
+
+@pytest.fixture
+def storage():
+    storage = MongoDbBucketStorage(mongodb_uri, database)
+    for c in storage.collections.values():
+        c.delete_many({})
+
+    return storage
+
+
+class TestBuckets:
+    def test_values_retrieval(
+        self, storage, ticker, stock_values_serie, stock_value_kind
+    ):
+        storage.insert_values(stock_values_serie)
+
+        expected = sorted(stock_values_serie, key=lambda v: v.date, reverse=True)
+
+        assert storage.get_values(ticker, stock_value_kind) == expected
+        assert storage.get_values(ticker, stock_value_kind, limit=3) == expected[:3]
+
+    def test_bucket_per_day(self, storage, ticker):
+        """Intraday values of a same day should be appended to the same document"""
+        values = [
+            StockValue(
+                ticker=ticker,
+                date=datetime(2023, 7, day, 9, 30) + timedelta(minutes=15 * idx),
+                close=1.0,
+                open=1.0,
+                low=1.0,
+                high=1.0,
+                volume=1,
+                interval=15 * 60,
+            )
+            for day in [5, 6]
+            for idx in range(26)
+        ]
+
+        storage.insert_values(values[::2])
+        storage.insert_values(values[1::2])
+
+        buckets = list(storage.collections[StockValue].find({"ticker": ticker}))
+        assert [len(b["dates"]) for b in buckets] == [26, 26]
+        assert storage.get_values(ticker, StockValueKind.OHLC) == values[::-1]
+
+    def test_several_intervals(
+        self, storage, ticker, stock_values_serie, stock_value_kind
+    ):
+        other_interval = [
+            v.model_copy(update={"interval": 60, "date": v.date + timedelta(seconds=1)})
+            for v in stock_values_serie
+        ]
+        storage.insert_values(stock_values_serie + other_interval)
+
+        expected = sorted(
+            stock_values_serie + other_interval, key=lambda v: v.date, reverse=True
+        )
+        assert storage.get_values(ticker, stock_value_kind, limit=1000) == expected
+        assert sorted(storage.get_dates(ticker, stock_value_kind, 60)) == sorted(
+            v.date for v in other_interval
+        )
+
+    def test_pages(self, storage, ticker, stock_values_serie, stock_value_kind):
+        other_interval = [
+            v.model_copy(update={"interval": 60}) for v in stock_values_serie
+        ]
+        storage.insert_values(stock_values_serie + other_interval)
+
+        expected = storage.get_values(ticker, stock_value_kind, limit=0)
+        first_page = storage.get_values(ticker, stock_value_kind, limit=5)
+        next_page = storage.get_values(
+            ticker, stock_value_kind, limit=5, cursor=page_cursor(first_page[-1])
+        )
+        assert first_page + next_page == expected[:10]
+
+        start, end = expected[12].date, expected[4].date
+        assert storage.get_values(ticker, stock_value_kind, start=start, end=end) == [
+            v for v in expected if start <= v.date <= end
+        ]
+
+        # Dates with a time zone bound the values as the same naive UTC dates
+        assert storage.get_values(
+            ticker,
+            stock_value_kind,
+            start=start.replace(tzinfo=timezone.utc),
+            end=end.replace(tzinfo=timezone.utc),
+        ) == [v for v in expected if start <= v.date <= end]
+
+    def test_duplicates(self, storage, ticker, stock_values_serie, stock_value_kind):
+        """Values already stored should neither be stored nor counted twice"""
+        storage.insert_values(stock_values_serie)
+        expected = storage.get_stats(stock_value_kind)
+
+        result = storage.insert_values(stock_values_serie + stock_values_serie[:3])
+
+        assert (result.inserted, result.skipped) == (0, len(stock_values_serie) + 3)
+        assert storage.get_stats(stock_value_kind) == expected
+        assert len(storage.get_dates(ticker, stock_value_kind)) == len(
+            stock_values_serie
+        )
+
+    def test_rebuilt_stats(self, storage, ticker, stock_values_serie, stock_value_kind):
+        storage.insert_values(stock_values_serie)
+
+        storage.collections[StockCollectionStats].delete_many({})
+        storage.rebuild_watermarks()
+
+        assert storage.get_stats(stock_value_kind) == {
+            ticker: StockCollectionStats(
+                oldest=min(v.date for v in stock_values_serie),
+                latest=max(v.date for v in stock_values_serie),
+                count=len(stock_values_serie),
+            )
+        }
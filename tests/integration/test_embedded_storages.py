@@ -0,0 +1,174 @@
+from datetime import timedelta
+
+import pytest
+
+from opa.core import (
+    ImportCheckpoint,
+    InsertResult,
+    StockCollectionStats,
+    StockValueColumns,
+    StockValueKind,
+    StockValueResolution,
+    StockValueRollup,
+    StockValueSerieGranularity,
+    page_cursor,
+)
+from opa.storage import HotTierStorage, MemoryStorage, SqliteStorage
+
+
+@pytest.fixture(params=["sqlite", "memory", "hot_tier"])
+def storage(request, tmp_path):
+    """Storages that run without any database server"""
+    match request.param:
+        case "sqlite":
+            return SqliteStorage(str(tmp_path / "opa.sqlite3"))
+        case "memory":
+            return MemoryStorage()
+        case "hot_tier":
+            # A tier too short to hold all the values, which are also read from behind
+            return HotTierStorage(MemoryStorage(), days=30)
+
+
+def query_plan(storage: SqliteStorage, sql: str, params: list) -> str:
+    rows = storage.connection.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+    return " ".join(row[-1] for row in rows)
+
+
+class TestEmbedded:
+    def test_values_retrieval(
+        self, storage, ticker, stock_values_serie, stock_value_kind
+    ):
+        storage.insert_values(stock_values_serie)
+
+        expected = sorted(stock_values_serie, key=lambda v: v.date, reverse=True)
+
+        assert storage.get_values(ticker, stock_value_kind) == expected
+        assert storage.get_values(ticker, stock_value_kind, limit=3) == expected[:3]
+        assert storage.get_values_columnar(
+            ticker, stock_value_kind, limit=3
+        ) == StockValueColumns.from_values(ticker, stock_value_kind, expected[:3])
+
+    def test_insert_result(self, storage, ticker, stock_values_serie, stock_value_kind):
+        half = len(stock_values_serie) // 2
+
+        assert storage.insert_values(stock_values_serie[:half]) == InsertResult(
+            inserted=half, skipped=0, invalid=0
+        )
+        assert storage.insert_values(stock_values_serie) == InsertResult(
+            inserted=len(stock_values_serie) - half, skipped=half, invalid=0
+        )
+        assert sorted(storage.get_dates(ticker, stock_value_kind)) == sorted(
+            v.date for v in stock_values_serie
+        )
+
+    def test_pages(self, storage, ticker, stock_values_serie, stock_value_kind):
+        other_interval = [
+            v.model_copy(update={"interval": 60}) for v in stock_values_serie
+        ]
+        storage.insert_values(stock_values_serie + other_interval)
+
+        expected = storage.get_values(ticker, stock_value_kind, limit=0)
+        first_page = storage.get_values(ticker, stock_value_kind, limit=5)
+        next_page = storage.get_values(
+            ticker, stock_value_kind, limit=5, cursor=page_cursor(first_page[-1])
+        )
+        assert len(expected) == 2 * len(stock_values_serie)
+        assert first_page + next_page == expected[:10]
+
+        start, end = expected[12].date, expected[4].date
+        assert storage.get_values(ticker, stock_value_kind, start=start, end=end) == [
+            v for v in expected if start <= v.date <= end
+        ]
+
+    def test_stats(self, storage, ticker, stock_values_serie, stock_value_kind):
+        storage.insert_values(stock_values_serie)
+        storage.insert_values(stock_values_serie[:3])
+
+        assert storage.get_stats(stock_value_kind) == {
+            ticker: StockCollectionStats(
+                oldest=min(v.date for v in stock_values_serie),
+                latest=max(v.date for v in stock_values_serie),
+                count=len(stock_values_serie),
+            )
+        }
+
+    def test_rollups(self, storage, ticker, stock_values_serie, stock_value_kind):
+        resolution = StockValueResolution.WEEK
+        storage.insert_values(stock_values_serie[1::2])
+        storage.insert_values(stock_values_serie)
+
+        expected = sorted(
+            StockValueRollup.of_values(stock_values_serie, resolution),
+            key=lambda r: r.date,
+            reverse=True,
+        )
+        assert storage.get_values(
+            ticker, stock_value_kind, limit=0, resolution=resolution
+        ) == [r.as_stock_value() for r in expected]
+
+    def test_rollups_of_several_intervals(
+        self, storage, ticker, overlapping_stock_values
+    ):
+        """Each period should be rolled up from the coarsest values stored over it
+        only, rather than from all the values that overlap"""
+        storage.insert_values(overlapping_stock_values)
+
+        days = storage.get_values(
+            ticker, StockValueKind.OHLC, limit=0, resolution=StockValueResolution.DAY
+        )
+        assert [(v.date.day, v.volume) for v in days] == [
+            (7, 2000),
+            (6, 5000),
+            (5, 5000),
+        ]
+
+        weeks = storage.get_values(
+            ticker, StockValueKind.OHLC, limit=0, resolution=StockValueResolution.WEEK
+        )
+        assert [v.volume for v in weeks] == [10000]
+
+    def test_company_infos(self, storage, company_infos):
+        storage.insert_company_infos(company_infos)
+        storage.insert_company_infos(company_infos[:1])
+
+        tickers = [i.symbol for i in company_infos]
+        assert sorted(storage.get_all_tickers()) == sorted(tickers)
+        assert storage.get_company_infos(tickers) == {
+            i.symbol: i for i in company_infos
+        }
+
+    def test_checkpoints(self, storage, ticker):
+        checkpoints = [
+            ImportCheckpoint(run_id=run_id, ticker=ticker, kind=kind, granularity=g)
+            for run_id in ["run", "other_run"]
+            for kind in StockValueKind
+            for g in StockValueSerieGranularity
+        ]
+        storage.insert_checkpoints(checkpoints)
+        storage.insert_checkpoints(checkpoints)
+
+        assert set(storage.get_checkpoints("run")) == set(checkpoints[:4])
+
+        storage.delete_checkpoints("run")
+        assert storage.get_checkpoints("run") == []
+        assert len(storage.get_checkpoints("other_run")) == 4
+
+
+class TestSqlite:
+    def test_stats_index(self, tmp_path, stock_value_kind):
+        """Stats should be read from the primary key of the watermarks"""
+        storage = SqliteStorage(str(tmp_path / "opa.sqlite3"))
+
+        assert "USING PRIMARY KEY" in query_plan(
+            storage,
+            "SELECT * FROM series_watermarks WHERE kind = ?",
+            [stock_value_kind.value],
+        )
+
+    def test_persistence(self, tmp_path, ticker, stock_values_serie, stock_value_kind):
+        path = str(tmp_path / "opa.sqlite3")
+        SqliteStorage(path).insert_values(stock_values_serie)
+
+        assert len(SqliteStorage(path).get_values(ticker, stock_value_kind)) == len(
+            stock_values_serie
+        )
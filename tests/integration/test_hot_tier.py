@@ -0,0 +1,149 @@
+import threading
+from datetime import timedelta, timezone
+
+import pytest
+
+from opa.storage import HotTierStorage, MemoryStorage
+
+
+@pytest.fixture
+def behind():
+    return MemoryStorage()
+
+
+@pytest.fixture
+def hot_tier(behind):
+    return HotTierStorage(behind, days=10)
+
+
+@pytest.fixture
+def latest_values(stock_values_serie):
+    return sorted(stock_values_serie, key=lambda v: v.date, reverse=True)
+
+
+class TestHotTier:
+    def test_latest_values(
+        self, mocker, hot_tier, behind, ticker, stock_values_serie, stock_value_kind
+    ):
+        """The latest values should be read from memory once loaded"""
+        hot_tier.insert_values(stock_values_serie)
+        hot_tier.get_values(ticker, stock_value_kind, limit=1)
+
+        spy = mocker.spy(behind, "get_values")
+        values = hot_tier.get_values(ticker, stock_value_kind, limit=3)
+
+        assert values == behind.get_values(ticker, stock_value_kind, limit=3)
+        assert spy.call_count == 1
+
+    def test_older_values(
+        self, mocker, hot_tier, behind, ticker, latest_values, stock_value_kind
+    ):
+        """Values older than the ones in memory should be read from behind"""
+        hot_tier.insert_values(latest_values)
+        hot_tier.get_values(ticker, stock_value_kind, limit=1)
+
+        spy = mocker.spy(behind, "get_values")
+        start = latest_values[0].date - timedelta(days=20)
+
+        assert hot_tier.get_values(ticker, stock_value_kind, limit=0) == latest_values
+        assert hot_tier.get_values(ticker, stock_value_kind, start=start) == [
+            v for v in latest_values if v.date >= start
+        ]
+        assert spy.call_count == 2
+
+    def test_aware_start(self, hot_tier, ticker, latest_values):
+        """A start with a time zone should select the same values as the same naive
+        UTC start"""
+        kind = latest_values[0].kind
+        hot_tier.insert_values(latest_values)
+        start = latest_values[5].date
+
+        assert hot_tier.get_values(
+            ticker, kind, start=start.replace(tzinfo=timezone.utc)
+        ) == hot_tier.get_values(ticker, kind, start=start)
+
+    def test_write_through(self, hot_tier, behind, ticker, latest_values):
+        """Values inserted after the latest ones were loaded should be read, and the
+        values out of the last days discarded from memory"""
+        kind = latest_values[0].kind
+        hot_tier.insert_values(latest_values[1:])
+        hot_tier.get_values(ticker, kind, limit=1)
+
+        new_value = latest_values[0].model_copy(
+            update={"date": latest_values[0].date + timedelta(days=30)}
+        )
+        hot_tier.insert_values([new_value])
+
+        assert behind.get_values(ticker, kind, limit=1) == [new_value]
+        assert hot_tier.get_values(ticker, kind, limit=2) == [
+            new_value,
+            latest_values[1],
+        ]
+        assert hot_tier.memory.get_values(ticker, kind, limit=0) == [new_value]
+
+    def test_reload(self, behind, ticker, latest_values):
+        """Values inserted behind the hot tier should be read once its `ttl` is over"""
+        kind = latest_values[0].kind
+        hot_tier = HotTierStorage(behind, days=10, ttl=0)
+        hot_tier.insert_values(latest_values[1:])
+        hot_tier.get_values(ticker, kind, limit=1)
+
+        behind.insert_values(latest_values[:1])
+
+        assert hot_tier.get_values(ticker, kind, limit=1) == latest_values[:1]
+
+    def test_load_does_not_block(self, mocker, hot_tier, behind, ticker, latest_values):
+        """Reads and writes of a ticker should not wait for the values of another
+        ticker to be loaded"""
+        kind = latest_values[0].kind
+        hot_tier.insert_values(latest_values[1:])
+        hot_tier.get_values(ticker, kind, limit=1)
+
+        loading, release = threading.Event(), threading.Event()
+        get_values = behind.get_values
+
+        def slow_get_values(other_ticker, *args, **kwargs):
+            if other_ticker != ticker:
+                loading.set()
+                release.wait(timeout=10)
+            return get_values(other_ticker, *args, **kwargs)
+
+        mocker.patch.object(behind, "get_values", side_effect=slow_get_values)
+        load = threading.Thread(target=hot_tier.get_values, args=("OTHER", kind))
+        load.start()
+        try:
+            assert loading.wait(timeout=10)
+            hot_tier.insert_values(latest_values[:1])
+            assert hot_tier.get_values(ticker, kind, limit=1) == latest_values[:1]
+            assert load.is_alive()
+        finally:
+            release.set()
+            load.join()
+
+    def test_insert_while_loading(
+        self, mocker, hot_tier, behind, ticker, latest_values
+    ):
+        """Values inserted while the values of their ticker are loaded should be read"""
+        kind = latest_values[0].kind
+        behind.insert_values(latest_values[1:])
+
+        fetched, release = threading.Event(), threading.Event()
+        get_values = behind.get_values
+
+        def slow_get_values(*args, **kwargs):
+            values = get_values(*args, **kwargs)
+            fetched.set()
+            release.wait(timeout=10)
+            return values
+
+        mocker.patch.object(behind, "get_values", side_effect=slow_get_values)
+        load = threading.Thread(target=hot_tier.get_values, args=(ticker, kind))
+        load.start()
+        try:
+            assert fetched.wait(timeout=10)
+            hot_tier.insert_values(latest_values[:1])
+        finally:
+            release.set()
+            load.join()
+
+        assert hot_tier.get_values(ticker, kind, limit=1) == latest_values[:1]
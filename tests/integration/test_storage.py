@@ -1,7 +1,22 @@
+from datetime import timedelta
+
 import pytest
 
-from opa.core import StockCollectionStats
-from opa.storage import opa_storage
+from opa.core import (
+    ImportCheckpoint,
+    InsertResult,
+    StockCollectionStats,
+    StockValue,
+    StockValueColumns,
+    StockValueKind,
+    StockValueResolution,
+    StockValueRollup,
+    page_cursor,
+)
+from opa.storage import get_opa_storage
+
+
+opa_storage = get_opa_storage()
 
 
 @pytest.fixture(scope="function")
@@ -16,6 +31,22 @@ def db_wipeout():
     yield
 
 
+def plan_stages(explain: dict) -> list[str]:
+    """Stages of the winning plan of a query"""
+    winning_plan = explain["queryPlanner"]["winningPlan"]
+    plans = [winning_plan.get("queryPlan", winning_plan)]
+
+    stages = []
+    while plans:
+        plan = plans.pop()
+        stages.append(plan["stage"])
+        plans += plan.get("inputStages", [])
+        if "inputStage" in plan:
+            plans.append(plan["inputStage"])
+
+    return stages
+
+
 @pytest.mark.usefixtures("db_wipeout")
 class TestIntegration:
     def test_values_retrieval(self, ticker, stock_values_serie, stock_value_kind):
@@ -27,6 +58,99 @@ class TestIntegration:
 
         assert opa_storage.get_values(ticker, stock_value_kind) == expected
 
+    def test_insert_result(self, ticker, stock_values_serie, stock_value_kind):
+        """Values already stored should be skipped, and counted as such"""
+        half = len(stock_values_serie) // 2
+
+        assert opa_storage.insert_values(stock_values_serie[:half]) == InsertResult(
+            inserted=half, skipped=0, invalid=0
+        )
+        assert opa_storage.insert_values(stock_values_serie) == InsertResult(
+            inserted=len(stock_values_serie) - half, skipped=half, invalid=0
+        )
+        assert len(opa_storage.get_dates(ticker, stock_value_kind)) == len(
+            stock_values_serie
+        )
+
+    def test_pages(self, ticker, stock_values_serie, stock_value_kind):
+        """Pages of values should follow each other, even through values of several
+        intervals at the same dates"""
+        other_interval = [
+            v.model_copy(update={"interval": 60}) for v in stock_values_serie
+        ]
+        opa_storage.insert_values(stock_values_serie + other_interval)
+
+        pages = [opa_storage.get_values(ticker, stock_value_kind, limit=7)]
+        while len(pages[-1]) == 7:
+            cursor = page_cursor(pages[-1][-1])
+            pages.append(
+                opa_storage.get_values(ticker, stock_value_kind, limit=7, cursor=cursor)
+            )
+
+        assert [v for page in pages for v in page] == opa_storage.get_values(
+            ticker, stock_value_kind, limit=0
+        )
+        assert sum(len(page) for page in pages) == 2 * len(stock_values_serie)
+
+    def test_dates_range(self, ticker, stock_values_serie, stock_value_kind):
+        opa_storage.insert_values(stock_values_serie)
+
+        dates = sorted(v.date for v in stock_values_serie)
+        start, end = dates[2], dates[-3]
+        values = opa_storage.get_values(ticker, stock_value_kind, start=start, end=end)
+
+        assert [v.date for v in values] == dates[2:-2][::-1]
+
+    def test_rollups(self, ticker, stock_values_serie, stock_value_kind):
+        """Rollups should be updated on every insertion, as if all the values had been
+        inserted at once"""
+        resolution = StockValueResolution.WEEK
+        opa_storage.insert_values(stock_values_serie[1::2])
+        opa_storage.insert_values(stock_values_serie[::2])
+
+        expected = sorted(
+            StockValueRollup.of_values(stock_values_serie, resolution),
+            key=lambda r: r.date,
+            reverse=True,
+        )
+        assert opa_storage.get_values(
+            ticker, stock_value_kind, limit=0, resolution=resolution
+        ) == [r.as_stock_value() for r in expected]
+
+        opa_storage.rebuild_rollups()
+        assert opa_storage.get_values(
+            ticker, stock_value_kind, limit=3, resolution=resolution
+        ) == [r.as_stock_value() for r in expected[:3]]
+
+    def test_rollups_of_several_intervals(self, ticker, overlapping_stock_values):
+        """Each period should be rolled up from the coarsest values stored over it
+        only, rather than from all the values that overlap"""
+        opa_storage.insert_values(overlapping_stock_values)
+
+        days = opa_storage.get_values(
+            ticker, StockValueKind.OHLC, limit=0, resolution=StockValueResolution.DAY
+        )
+        assert [(v.date.day, v.volume) for v in days] == [
+            (7, 2000),
+            (6, 5000),
+            (5, 5000),
+        ]
+
+        weeks = opa_storage.get_values(
+            ticker, StockValueKind.OHLC, limit=0, resolution=StockValueResolution.WEEK
+        )
+        assert [v.volume for v in weeks] == [10000]
+
+    def test_columnar_retrieval(self, ticker, stock_values_serie, stock_value_kind):
+        """`get_values_columnar` should return the same values as `get_values`"""
+        opa_storage.insert_values(stock_values_serie)
+
+        for limit in [0, 10]:
+            values = opa_storage.get_values(ticker, stock_value_kind, limit=limit)
+            assert opa_storage.get_values_columnar(
+                ticker, stock_value_kind, limit=limit
+            ) == StockValueColumns.from_values(ticker, stock_value_kind, values)
+
     def test_company_info_retrieval(self, company_infos):
         opa_storage.insert_company_infos(company_infos)
 
@@ -58,3 +182,129 @@ class TestIntegration:
         }
 
         assert opa_storage.get_stats(stock_value_kind) == expected
+
+    def test_stats_not_changed_by_duplicates(
+        self, ticker, stock_values_serie, stock_value_kind
+    ):
+        """Values that were already stored should not be counted twice"""
+        opa_storage.insert_values(stock_values_serie)
+        expected = opa_storage.get_stats(stock_value_kind)
+
+        opa_storage.insert_values(stock_values_serie)
+
+        assert opa_storage.get_stats(stock_value_kind) == expected
+
+    def test_stats_by_interval(self, ticker, stock_values_serie, stock_value_kind):
+        """Stats should be taken on each interval separately if asked to"""
+        other_interval = [
+            v.model_copy(update={"interval": 60, "date": v.date - timedelta(days=365)})
+            for v in stock_values_serie
+        ]
+        opa_storage.insert_values(stock_values_serie + other_interval)
+
+        interval = stock_values_serie[0].interval
+        assert opa_storage.get_stats(stock_value_kind, interval) == {
+            ticker: StockCollectionStats(
+                oldest=min((v.date for v in stock_values_serie)),
+                latest=max((v.date for v in stock_values_serie)),
+                count=len(stock_values_serie),
+            )
+        }
+        assert opa_storage.get_stats(stock_value_kind)[ticker].count == 2 * len(
+            stock_values_serie
+        )
+
+    def test_rebuilt_stats(self, ticker, stock_values_serie, stock_value_kind):
+        """Stats rebuilt from all the values should be the same as those kept up-to-date"""
+        opa_storage.insert_values(stock_values_serie)
+        expected = opa_storage.get_stats(stock_value_kind)
+
+        opa_storage.collections[StockCollectionStats].delete_many({})
+        opa_storage.rebuild_watermarks()
+
+        assert opa_storage.get_stats(stock_value_kind) == expected
+
+    def test_dates(self, ticker, stock_values_serie, stock_value_kind):
+        opa_storage.insert_values(stock_values_serie)
+
+        expected = sorted(v.date for v in stock_values_serie)
+
+        assert sorted(opa_storage.get_dates(ticker, stock_value_kind)) == expected
+
+    def test_series_index(self, ticker, stock_values_serie, stock_value_kind):
+        """The latest values of a serie should be read in order from the index, and
+        their dates from the index only"""
+        other_interval = [
+            v.model_copy(update={"interval": 60}) for v in stock_values_serie
+        ]
+        opa_storage.insert_values(stock_values_serie + other_interval)
+
+        for cursor in opa_storage._values_cursors(ticker, stock_value_kind, 10):
+            values_stages = plan_stages(cursor.explain())
+            assert "IXSCAN" in values_stages
+            assert not {"SORT", "COLLSCAN"} & set(values_stages)
+
+        dates_stages = plan_stages(
+            opa_storage._dates_cursor(ticker, stock_value_kind, None).explain()
+        )
+        assert "IXSCAN" in dates_stages
+        assert not {"FETCH", "COLLSCAN"} & set(dates_stages)
+
+    def test_both_kinds(self, ticker, both_kinds_stock_values):
+        """Values of both kinds should be stored at the same date and interval"""
+        simple, ohlc = both_kinds_stock_values
+        opa_storage.insert_values([simple])
+
+        assert opa_storage.insert_values([ohlc]) == InsertResult(
+            inserted=1, skipped=0, invalid=0
+        )
+        assert opa_storage.get_values(ticker, StockValueKind.SIMPLE) == [simple]
+        assert opa_storage.get_values(ticker, StockValueKind.OHLC) == [ohlc]
+
+    def test_former_unique_index(self, ticker, both_kinds_stock_values):
+        """The former unique index, without the kind, should be dropped on start"""
+        collection = opa_storage.collections[StockValue]
+        collection.create_index(
+            list(opa_storage.date_ticker_interval_index.items()), unique=True
+        )
+
+        opa_storage._drop_former_unique_index()
+
+        assert opa_storage.insert_values(both_kinds_stock_values).inserted == 2
+
+    def test_missing_kinds(self, ticker, stock_values_serie, stock_value_kind):
+        """Values stored before their kind was should be given one"""
+        collection = opa_storage.collections[StockValue]
+        collection.insert_many(
+            [v.model_dump(exclude_none=True) for v in stock_values_serie]
+        )
+        collection.drop_index(list(opa_storage.series_index.items()))
+
+        # As done when the storage starts
+        try:
+            opa_storage._add_missing_kinds()
+        finally:
+            opa_storage._create_collections_if_not_exist()
+
+        expected = sorted(stock_values_serie, key=lambda v: v.date, reverse=True)
+        assert opa_storage.get_values(ticker, stock_value_kind) == expected
+
+    def test_checkpoints(self, ticker, stock_value_kind, stock_value_serie_granularity):
+        """Checkpoints are kept per run, and may be inserted several times"""
+        checkpoint = ImportCheckpoint(
+            run_id="run",
+            ticker=ticker,
+            kind=stock_value_kind,
+            granularity=stock_value_serie_granularity,
+        )
+        other = checkpoint.model_copy(update={"run_id": "other"})
+
+        opa_storage.insert_checkpoints([checkpoint, other])
+        opa_storage.insert_checkpoints([checkpoint])
+
+        assert opa_storage.get_checkpoints("run") == [checkpoint]
+
+        opa_storage.delete_checkpoints("run")
+
+        assert opa_storage.get_checkpoints("run") == []
+        assert opa_storage.get_checkpoints("other") == [other]
@@ -0,0 +1,124 @@
+from datetime import timedelta
+
+import pytest
+
+from opa import settings
+from opa.core import StockCollectionStats, StockValueKind, page_cursor
+from opa.storage import MongoDbTimeSeriesStorage, mongodb_uri
+
+
+database = f"{settings.mongo_database}-timeseries"
+
+
+@pytest.fixture
+def storage():
+    storage = MongoDbTimeSeriesStorage(mongodb_uri, database)
+    for c in storage.series_collections.values():
+        c.drop()
+    for c in storage.collections.values():
+        c.delete_many({})
+
+    return MongoDbTimeSeriesStorage(mongodb_uri, database)
+
+
+class TestTimeSeries:
+    def test_values_retrieval(
+        self, storage, ticker, stock_values_serie, stock_value_kind
+    ):
+        storage.insert_values(stock_values_serie)
+
+        expected = sorted(stock_values_serie, key=lambda v: v.date, reverse=True)
+
+        assert storage.get_values(ticker, stock_value_kind) == expected
+        assert storage.get_values(ticker, stock_value_kind, limit=3) == expected[:3]
+
+    def test_several_intervals(
+        self, storage, ticker, stock_values_serie, stock_value_kind
+    ):
+        other_interval = [
+            v.model_copy(update={"interval": 60, "date": v.date - timedelta(days=365)})
+            for v in stock_values_serie
+        ]
+        storage.insert_values(stock_values_serie + other_interval)
+
+        assert set(storage.series_collections) == {stock_values_serie[0].interval, 60}
+        assert len(storage.get_values(ticker, stock_value_kind, limit=1000)) == 2 * len(
+            stock_values_serie
+        )
+        assert sorted(storage.get_dates(ticker, stock_value_kind, 60)) == sorted(
+            v.date for v in other_interval
+        )
+
+    def test_pages(self, storage, ticker, stock_values_serie, stock_value_kind):
+        other_interval = [
+            v.model_copy(update={"interval": 60}) for v in stock_values_serie
+        ]
+        storage.insert_values(stock_values_serie + other_interval)
+
+        expected = storage.get_values(ticker, stock_value_kind, limit=0)
+        first_page = storage.get_values(ticker, stock_value_kind, limit=5)
+        next_page = storage.get_values(
+            ticker, stock_value_kind, limit=5, cursor=page_cursor(first_page[-1])
+        )
+        assert first_page + next_page == expected[:10]
+
+        start, end = expected[12].date, expected[4].date
+        assert storage.get_values(ticker, stock_value_kind, start=start, end=end) == [
+            v for v in expected if start <= v.date <= end
+        ]
+
+    def test_duplicates(self, storage, ticker, stock_values_serie, stock_value_kind):
+        """Values already stored should neither be stored nor counted twice"""
+        storage.insert_values(stock_values_serie)
+        expected = storage.get_stats(stock_value_kind)
+
+        result = storage.insert_values(stock_values_serie + stock_values_serie[:3])
+
+        assert (result.inserted, result.skipped) == (0, len(stock_values_serie) + 3)
+
+        assert storage.get_stats(stock_value_kind) == expected
+        assert len(storage.get_dates(ticker, stock_value_kind)) == len(
+            stock_values_serie
+        )
+
+    def test_both_kinds(self, storage, ticker, both_kinds_stock_values):
+        """Values of both kinds should be stored at the same date and interval"""
+        simple, ohlc = both_kinds_stock_values
+        storage.insert_values([simple])
+
+        assert storage.insert_values([ohlc]).inserted == 1
+        assert storage.get_values(ticker, StockValueKind.SIMPLE) == [simple]
+        assert storage.get_values(ticker, StockValueKind.OHLC) == [ohlc]
+
+    def test_rebuilt_stats(self, storage, ticker, stock_values_serie, stock_value_kind):
+        storage.insert_values(stock_values_serie)
+        expected = storage.get_stats(stock_value_kind)
+
+        storage.collections[StockCollectionStats].delete_many({})
+        storage.rebuild_watermarks()
+
+        assert storage.get_stats(stock_value_kind) == {
+            ticker: StockCollectionStats(
+                oldest=min(v.date for v in stock_values_serie),
+                latest=max(v.date for v in stock_values_serie),
+                count=len(stock_values_serie),
+            )
+        }
+        assert storage.get_stats(stock_value_kind) == expected
+
+    def test_migration(self, storage, ticker, stock_values_serie, stock_value_kind):
+        """Values stored by `MongoDbStorage` should be copied once"""
+        source = storage.db["stock_values"]
+        source.delete_many({})
+        source.insert_many(
+            [v.model_dump(exclude_none=True) for v in stock_values_serie]
+        )
+
+        assert storage.migrate(batch_size=7) == len(stock_values_serie)
+        assert storage.migrate() == 0
+
+        expected = sorted(stock_values_serie, key=lambda v: v.date, reverse=True)
+        assert storage.get_values(ticker, stock_value_kind) == expected
+        assert storage.get_stats(stock_value_kind)[ticker].count == len(
+            stock_values_serie
+        )
@@ -0,0 +1,6 @@
+from opa import settings
+
+# Providers read their API key at instantiation, and `opa.providers` instantiates the
+# configured ones on import.
+settings.set("secrets.fmp_cloud_api_key", "test-key")
+settings.set("secrets.alphavantage_api_key", "test-key")
@@ -0,0 +1,134 @@
+from datetime import datetime
+import json
+from pathlib import Path
+
+import pytest
+from pydantic import ValidationError
+
+from opa.core import StockValueKind, StockValueSerieGranularity, StockValue
+from opa.providers import Alphavantage
+
+
+examples_dir = Path(__file__).parents[2] / "data" / "examples"
+
+
+@pytest.fixture
+def provider():
+    return Alphavantage()
+
+
+@pytest.fixture
+def responses(mocker):
+    """Serves the example payloads in place of www.alphavantage.co"""
+    examples = {
+        "TIME_SERIES_DAILY": "alphavantage_AAPL_daily.json",
+        "TIME_SERIES_INTRADAY": "alphavantage_AAPL_15min.json",
+        "OVERVIEW": "alphavantage_AAPL_overview.json",
+    }
+
+    def get_json_data(url, params, **kwargs):
+        return json.loads((examples_dir / examples[params["function"]]).read_text())
+
+    mocker.patch(
+        "opa.providers.alphavantage.get_text_data",
+        return_value=(examples_dir / "alphavantage_listing_status.csv").read_text(),
+    )
+    return mocker.patch(
+        "opa.providers.alphavantage.get_json_data", side_effect=get_json_data
+    )
+
+
+@pytest.mark.parametrize(
+    ("kind", "granularity", "expected"),
+    [
+        (
+            StockValueKind.SIMPLE,
+            StockValueSerieGranularity.COARSE,
+            StockValue(
+                ticker="AAPL",
+                date=datetime(2023, 7, 5, 16),
+                close=191.33,
+                interval=24 * 60 * 60,
+            ),
+        ),
+        (
+            StockValueKind.OHLC,
+            StockValueSerieGranularity.COARSE,
+            StockValue(
+                ticker="AAPL",
+                date=datetime(2023, 7, 5),
+                close=191.33,
+                open=191.565,
+                low=190.62,
+                high=192.98,
+                volume=46920261,
+                interval=24 * 60 * 60,
+            ),
+        ),
+        (
+            StockValueKind.OHLC,
+            StockValueSerieGranularity.FINE,
+            StockValue(
+                ticker="AAPL",
+                date=datetime(2023, 7, 5, 15, 45),
+                close=191.33,
+                open=191.375,
+                low=191.235,
+                high=191.4899,
+                volume=2811813,
+                interval=15 * 60,
+            ),
+        ),
+    ],
+)
+def test_get_stock_values(provider, responses, kind, granularity, expected):
+    values = provider.get_stock_values("AAPL", kind, granularity)
+
+    assert len(values) == 3
+    assert values[1] == expected
+
+
+def test_output_size(provider, responses):
+    provider.get_stock_values(
+        "AAPL", StockValueKind.OHLC, StockValueSerieGranularity.COARSE
+    )
+    assert responses.call_args.kwargs["params"]["outputsize"] == "full"
+
+    provider.get_stock_values(
+        "AAPL",
+        StockValueKind.OHLC,
+        StockValueSerieGranularity.COARSE,
+        start=datetime.now(),
+    )
+    assert responses.call_args.kwargs["params"]["outputsize"] == "compact"
+
+
+def test_error_response(provider, mocker):
+    mocker.patch(
+        "opa.providers.alphavantage.get_json_data",
+        return_value={"Note": "Thank you for using Alpha Vantage!"},
+    )
+
+    with pytest.raises(RuntimeError):
+        provider.get_stock_values(
+            "AAPL", StockValueKind.OHLC, StockValueSerieGranularity.FINE
+        )
+
+
+def test_get_company_info(provider, responses):
+    [info] = provider.get_company_info(["AAPL"])
+
+    assert info.name == "Apple Inc"
+    assert info.website == "https://www.apple.com"
+    assert info.city == "CUPERTINO"
+    assert info.ipo_date == datetime(1980, 12, 12)
+
+
+def test_get_company_info_without_ipo_date(provider, responses, mocker):
+    mocker.patch(
+        "opa.providers.alphavantage.get_text_data",
+        return_value="symbol,name,exchange,assetType,ipoDate,delistingDate,status\n",
+    )
+
+    with pytest.raises(ValidationError):
+        provider.get_company_info(["AAPL"])
@@ -0,0 +1,210 @@
+import math
+from threading import Event
+
+import pytest
+
+from opa.core import StockMarketProvider, StockValueKind, StockValueSerieGranularity
+from opa.providers.composite import CompositeProvider, LatencyTracker
+from tests.fixtures import fake_ticker
+
+
+OHLC_FINE = (StockValueKind.OHLC, StockValueSerieGranularity.FINE)
+
+
+@pytest.fixture
+def make_provider(mocker):
+    mocker.patch.multiple(StockMarketProvider, __abstractmethods__=set())
+
+    def make_provider():
+        provider = StockMarketProvider()
+        for method in ["get_stock_values", "get_company_info"]:
+            mocker.patch.object(provider, method, autospec=True)
+        return provider
+
+    return make_provider
+
+
+@pytest.fixture
+def primary(make_provider):
+    return make_provider()
+
+
+@pytest.fixture
+def secondary(make_provider):
+    return make_provider()
+
+
+class TestLatencyTracker:
+    def test_percentile(self):
+        tracker = LatencyTracker()
+        for seconds in range(1, 101):
+            tracker.record("p", seconds)
+
+        assert tracker.percentile("p", 50) == 50
+        assert tracker.percentile("p", 95) == 95
+        assert tracker.percentile("other", 50) is None
+
+    def test_window(self):
+        tracker = LatencyTracker(window=2)
+        for seconds in [10, 1, 2]:
+            tracker.record("p", seconds)
+
+        assert tracker.percentile("p", 100) == 2
+
+    def test_failures(self):
+        tracker = LatencyTracker()
+        tracker.record("p", 1)
+        tracker.record_failure("p")
+
+        assert tracker.percentile("p", 100) == math.inf
+
+
+class TestFailover:
+    def test_first_provider(self, primary, secondary):
+        provider = CompositeProvider({"primary": primary, "secondary": secondary})
+
+        values = provider.get_stock_values("AAPL", *OHLC_FINE)
+
+        assert values is primary.get_stock_values.return_value
+        secondary.get_stock_values.assert_not_called()
+
+    def test_failover(self, primary, secondary):
+        provider = CompositeProvider({"primary": primary, "secondary": secondary})
+        primary.get_stock_values.side_effect = RuntimeError
+
+        values = provider.get_stock_values("AAPL", *OHLC_FINE)
+
+        assert values is secondary.get_stock_values.return_value
+        secondary.get_stock_values.assert_called_once_with(
+            "AAPL", *OHLC_FINE, start=None, end=None
+        )
+
+    def test_all_providers_fail(self, primary, secondary):
+        provider = CompositeProvider({"primary": primary, "secondary": secondary})
+        primary.get_company_info.side_effect = RuntimeError
+        secondary.get_company_info.side_effect = ValueError
+
+        with pytest.raises(ValueError):
+            provider.get_company_info([fake_ticker()])
+
+    def test_capabilities(self, mocker, primary, secondary):
+        mocker.patch.object(primary, "provides", return_value=False)
+        provider = CompositeProvider({"primary": primary, "secondary": secondary})
+
+        provider.get_stock_values("AAPL", *OHLC_FINE)
+
+        primary.get_stock_values.assert_not_called()
+
+        mocker.patch.object(secondary, "provides", return_value=False)
+        with pytest.raises(TypeError):
+            provider.get_stock_values("AAPL", *OHLC_FINE)
+
+    def test_routing_by_latency(self, primary, secondary):
+        latencies = LatencyTracker()
+        latencies.record("primary", 2.0)
+        latencies.record("secondary", 0.5)
+        provider = CompositeProvider(
+            {"primary": primary, "secondary": secondary}, latencies=latencies
+        )
+
+        provider.get_stock_values("AAPL", *OHLC_FINE)
+
+        primary.get_stock_values.assert_not_called()
+
+    def test_failures_feed_routing(self, primary, secondary):
+        provider = CompositeProvider({"primary": primary, "secondary": secondary})
+        primary.get_stock_values.side_effect = RuntimeError
+        provider.get_stock_values("AAPL", *OHLC_FINE)
+
+        primary.get_stock_values.reset_mock()
+        provider.get_stock_values("AAPL", *OHLC_FINE)
+
+        primary.get_stock_values.assert_not_called()
+
+
+class TestStreaming:
+    def test_failover(self, primary, secondary):
+        """Streams fail over until their first values are received"""
+        provider = CompositeProvider({"primary": primary, "secondary": secondary})
+        primary.get_stock_values.side_effect = RuntimeError
+        secondary.get_stock_values.return_value = [1, 2, 3]
+
+        assert list(provider.iter_stock_values("AAPL", *OHLC_FINE)) == [1, 2, 3]
+
+    def test_provider_streams(self, mocker, primary, secondary):
+        provider = CompositeProvider({"primary": primary, "secondary": secondary})
+        mocker.patch.object(primary, "iter_stock_values", return_value=iter([1, 2]))
+
+        assert list(provider.iter_stock_values("AAPL", *OHLC_FINE)) == [1, 2]
+        primary.get_stock_values.assert_not_called()
+
+    def test_late_failure(self, mocker, primary, secondary):
+        def values(*args, **kwargs):
+            yield 1
+            raise RuntimeError
+
+        provider = CompositeProvider({"primary": primary, "secondary": secondary})
+        mocker.patch.object(primary, "iter_stock_values", side_effect=values)
+
+        with pytest.raises(RuntimeError):
+            list(provider.iter_stock_values("AAPL", *OHLC_FINE))
+        secondary.get_stock_values.assert_not_called()
+
+
+class TestBatch:
+    series = (StockValueKind.OHLC, StockValueSerieGranularity.COARSE)
+
+    def test_max_tickers(self, mocker, primary, secondary):
+        mocker.patch.object(primary, "max_tickers_per_request", return_value=5)
+        provider = CompositeProvider({"primary": primary, "secondary": secondary})
+
+        assert provider.max_tickers_per_request(*self.series) == 5
+
+    def test_failover(self, mocker, primary, secondary):
+        provider = CompositeProvider({"primary": primary, "secondary": secondary})
+        mocker.patch.object(primary, "get_stock_values_batch", side_effect=RuntimeError)
+        batch = mocker.patch.object(
+            secondary, "get_stock_values_batch", return_value={"AAPL": [1]}
+        )
+
+        assert dict(
+            provider.iter_stock_values_batch(["AAPL", "MSFT"], *self.series)
+        ) == {"AAPL": [1]}
+        batch.assert_called_once_with(
+            ["AAPL", "MSFT"], *self.series, start=None, end=None
+        )
+
+
+class TestHedging:
+    def test_slow_request_hedged(self, primary, secondary):
+        latencies = LatencyTracker()
+        latencies.record("primary", 0.01)
+        provider = CompositeProvider(
+            {"primary": primary, "secondary": secondary},
+            hedge_percentile=95,
+            latencies=latencies,
+        )
+
+        unblock = Event()
+        primary.get_stock_values.side_effect = lambda *args, **kwargs: unblock.wait(5)
+
+        try:
+            values = provider.get_stock_values("AAPL", *OHLC_FINE)
+        finally:
+            unblock.set()
+
+        assert values is secondary.get_stock_values.return_value
+
+    def test_fast_request_not_hedged(self, primary, secondary):
+        latencies = LatencyTracker()
+        latencies.record("primary", 5)
+        provider = CompositeProvider(
+            {"primary": primary, "secondary": secondary},
+            hedge_percentile=95,
+            latencies=latencies,
+        )
+
+        values = provider.get_stock_values("AAPL", *OHLC_FINE)
+
+        assert values is primary.get_stock_values.return_value
+        secondary.get_stock_values.assert_not_called()
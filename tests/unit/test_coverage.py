@@ -0,0 +1,149 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from opa.core.calendar import (
+    market_holidays,
+    market_hours,
+    market_timezone,
+    next_daily_publication,
+    next_market_close,
+    is_trading_day,
+    next_trading_day,
+    trading_days,
+)
+from opa.core.coverage import SeriesCoverage
+
+
+class TestCalendar:
+    def test_holidays(self):
+        # As published on https://www.nyse.com/markets/hours-calendars
+        assert sorted(market_holidays(2023)) == [
+            date(2023, 1, 2),
+            date(2023, 1, 16),
+            date(2023, 2, 20),
+            date(2023, 4, 7),
+            date(2023, 5, 29),
+            date(2023, 6, 19),
+            date(2023, 7, 4),
+            date(2023, 9, 4),
+            date(2023, 11, 23),
+            date(2023, 12, 25),
+        ]
+
+    def test_new_year_on_saturday(self):
+        """New Year's Day is not observed when it falls on a Saturday"""
+        assert date(2021, 12, 31) not in market_holidays(2021)
+        assert date(2022, 1, 1) not in market_holidays(2022)
+        assert is_trading_day(date(2021, 12, 31))
+
+    @pytest.mark.parametrize(
+        ("day", "expected"),
+        [
+            (date(2023, 7, 3), date(2023, 7, 5)),  # Independence Day
+            (date(2023, 7, 7), date(2023, 7, 10)),  # Week-end
+            (date(2023, 4, 6), date(2023, 4, 10)),  # Good Friday and week-end
+        ],
+    )
+    def test_next_trading_day(self, day, expected):
+        assert next_trading_day(day) == expected
+
+    def test_market_hours(self):
+        assert market_hours(date(2023, 7, 6)) == (
+            datetime(2023, 7, 6, 9, 30, tzinfo=market_timezone),
+            datetime(2023, 7, 6, 16, tzinfo=market_timezone),
+        )
+        # Day after Thanksgiving
+        assert market_hours(date(2023, 11, 24))[1] == datetime(
+            2023, 11, 24, 13, tzinfo=market_timezone
+        )
+
+    @pytest.mark.parametrize(
+        ("now", "expected"),
+        [
+            (datetime(2023, 7, 6, 12), datetime(2023, 7, 6, 16)),
+            (datetime(2023, 7, 6, 16), datetime(2023, 7, 7, 16)),
+            # Week-end
+            (datetime(2023, 7, 7, 17), datetime(2023, 7, 10, 16)),
+            # Early close before Independence Day
+            (datetime(2023, 7, 3, 9), datetime(2023, 7, 3, 13)),
+        ],
+    )
+    def test_next_market_close(self, now, expected):
+        now = now.replace(tzinfo=market_timezone)
+        assert next_market_close(now) == expected.replace(tzinfo=market_timezone)
+
+    def test_next_daily_publication(self):
+        def publication(*args):
+            return next_daily_publication(
+                datetime(*args, tzinfo=market_timezone), timedelta(hours=1)
+            )
+
+        assert publication(2023, 7, 6, 16, 30) == datetime(
+            2023, 7, 6, 17, tzinfo=market_timezone
+        )
+        assert publication(2023, 7, 6, 17) == datetime(
+            2023, 7, 7, 17, tzinfo=market_timezone
+        )
+
+    def test_trading_days(self):
+        assert list(trading_days(date(2023, 7, 1), date(2023, 7, 7))) == [
+            date(2023, 7, 3),
+            date(2023, 7, 5),
+            date(2023, 7, 6),
+            date(2023, 7, 7),
+        ]
+
+
+class TestSeriesCoverage:
+    def test_contiguous_ranges(self):
+        """Week-ends and holidays do not break a range"""
+        coverage = SeriesCoverage.from_dates(
+            [
+                datetime(2023, 6, 30, 16),
+                datetime(2023, 7, 3, 10),
+                datetime(2023, 7, 3, 16),
+                datetime(2023, 7, 5, 16),
+                date(2023, 7, 10),
+            ]
+        )
+
+        assert coverage.ranges == [
+            (date(2023, 6, 30), date(2023, 7, 5)),
+            (date(2023, 7, 10), date(2023, 7, 10)),
+        ]
+
+    def test_covers(self):
+        coverage = SeriesCoverage([(date(2023, 6, 30), date(2023, 7, 5))])
+
+        assert coverage.covers(date(2023, 7, 3))
+        assert coverage.covers(date(2023, 7, 5))
+        assert not coverage.covers(date(2023, 6, 29))
+        assert not coverage.covers(date(2023, 7, 6))
+
+    def test_missing(self):
+        coverage = SeriesCoverage(
+            [
+                (date(2023, 6, 30), date(2023, 7, 5)),
+                (date(2023, 7, 10), date(2023, 7, 10)),
+            ]
+        )
+
+        assert coverage.missing(date(2023, 6, 26), date(2023, 7, 14)) == [
+            (date(2023, 6, 26), date(2023, 6, 29)),
+            (date(2023, 7, 6), date(2023, 7, 7)),
+            (date(2023, 7, 11), date(2023, 7, 14)),
+        ]
+
+    def test_nothing_missing(self):
+        coverage = SeriesCoverage.from_dates(
+            trading_days(date(2023, 1, 1), date(2023, 12, 31))
+        )
+
+        assert len(coverage.ranges) == 1
+        assert coverage.missing(date(2023, 1, 1), date(2023, 12, 31)) == []
+
+    def test_empty(self):
+        assert SeriesCoverage().missing(date(2023, 7, 1), date(2023, 7, 9)) == [
+            (date(2023, 7, 3), date(2023, 7, 7))
+        ]
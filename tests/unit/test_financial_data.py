@@ -0,0 +1,103 @@
+from datetime import datetime, timezone, timedelta
+
+from opa.core import (
+    StockValue,
+    StockValueColumns,
+    StockValueKind,
+    StockValueResolution,
+    StockValueRollup,
+)
+from opa.core.financial_data import epoch_milliseconds
+
+
+def test_epoch_milliseconds():
+    assert epoch_milliseconds(datetime(1970, 1, 1, 0, 0, 1, 500_000)) == 1500
+    assert epoch_milliseconds(
+        datetime(2023, 7, 5, 11, tzinfo=timezone(timedelta(hours=2)))
+    ) == epoch_milliseconds(datetime(2023, 7, 5, 9))
+
+
+def test_columns(stock_values_serie, stock_value_kind, ticker):
+    columns = StockValueColumns.from_values(
+        ticker, stock_value_kind, stock_values_serie
+    )
+
+    assert len(columns) == len(stock_values_serie)
+    assert columns.close.tolist() == [v.close for v in stock_values_serie]
+    assert columns.date[0] == epoch_milliseconds(stock_values_serie[0].date)
+
+    as_dict = columns.as_dict()
+    if stock_value_kind == StockValueKind.OHLC:
+        assert as_dict["volume"] == [v.volume for v in stock_values_serie]
+    else:
+        assert set(as_dict) == {"date", "interval", "close"}
+
+
+def test_period_start():
+    date = datetime(2023, 7, 5, 10, 45, 3)
+
+    assert [r.period_start(date) for r in StockValueResolution] == [
+        datetime(2023, 7, 5, 10),
+        datetime(2023, 7, 5),
+        datetime(2023, 7, 3),
+        datetime(2023, 7, 1),
+    ]
+
+
+class TestRollups:
+    resolution = StockValueResolution.MONTH
+
+    def test_values(self, stock_values_serie, stock_value_kind):
+        rollups = StockValueRollup.of_values(stock_values_serie, self.resolution)
+
+        assert {r.date for r in rollups} == {
+            datetime(v.date.year, v.date.month, 1) for v in stock_values_serie
+        }
+        last = max(stock_values_serie, key=lambda v: v.date)
+        assert max(rollups, key=lambda r: r.date).close == last.close
+        if stock_value_kind == StockValueKind.OHLC:
+            first = min(stock_values_serie, key=lambda v: v.date)
+            assert min(rollups, key=lambda r: r.date).open == first.open
+            assert sum(r.volume for r in rollups) == sum(
+                v.volume for v in stock_values_serie
+            )
+
+    def test_merge(self, stock_values_serie):
+        """Rollups of parts of the values should merge into the rollup of all of them,
+        whatever the order"""
+        half = len(stock_values_serie) // 2
+        merged = {
+            r.date: r
+            for r in StockValueRollup.of_values(
+                stock_values_serie[half:], self.resolution
+            )
+        }
+        for r in StockValueRollup.of_values(stock_values_serie[:half], self.resolution):
+            merged[r.date] = merged[r.date].merge(r) if r.date in merged else r
+
+        expected = StockValueRollup.of_values(stock_values_serie, self.resolution)
+        assert sorted(merged.values(), key=lambda r: r.date) == sorted(
+            expected, key=lambda r: r.date
+        )
+
+    def test_shorter_periods(self, stock_values_serie):
+        """Values should only be rolled up over periods longer than their interval"""
+        rollups = StockValueRollup.of_values(
+            stock_values_serie, StockValueResolution.HOUR
+        )
+
+        assert bool(rollups) == (stock_values_serie[0].interval <= 60 * 60)
+
+    def test_intervals(self, overlapping_stock_values):
+        """Values of different intervals should be rolled up separately, as they span
+        the same periods"""
+        rollups = StockValueRollup.of_values(
+            overlapping_stock_values, StockValueResolution.DAY
+        )
+
+        assert sorted((r.date.day, r.interval, r.volume) for r in rollups) == [
+            (5, 24 * 60 * 60, 5000),
+            (6, 15 * 60, 2000),
+            (6, 24 * 60 * 60, 5000),
+            (7, 15 * 60, 2000),
+        ]
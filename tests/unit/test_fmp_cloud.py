@@ -0,0 +1,379 @@
+import asyncio
+from datetime import datetime, time
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlparse
+
+import pytest
+from pydantic import ValidationError
+
+from opa.core import StockValueKind, StockValueSerieGranularity
+from opa import http_methods
+from opa.providers import FmpCloud
+
+
+examples_dir = Path(__file__).parents[2] / "data" / "examples"
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Serves the example payloads for any ticker, in place of fmpcloud.io"""
+
+    routes = {
+        "/historical-price-full": "fmpcloud_AAPL_history.json",
+        "/historical-chart/15min": "fmpcloud_AAPL_15min.json",
+    }
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        prefix, _, tickers = path.rpartition("/")
+
+        try:
+            body = (examples_dir / self.routes[prefix]).read_bytes()
+            if "," in tickers:
+                payload = json.loads(body)
+                body = json.dumps(
+                    {
+                        "historicalStockList": [
+                            payload | {"symbol": t} for t in tickers.split(",")
+                        ]
+                    }
+                ).encode()
+            self.send_response(200)
+        except KeyError:
+            body = json.dumps({"Error Message": f"{path} not found"}).encode()
+            self.send_response(404)
+
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        ...
+
+
+@pytest.fixture(scope="module")
+def stand_in_url():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    host, port = server.server_address
+    yield f"http://{host}:{port}"
+
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def provider(stand_in_url):
+    provider = FmpCloud()
+    provider.base_url = stand_in_url
+    return provider
+
+
+@pytest.mark.parametrize(
+    ("kind", "granularity", "example"),
+    [
+        (
+            StockValueKind.OHLC,
+            StockValueSerieGranularity.COARSE,
+            "fmpcloud_AAPL_history.json",
+        ),
+        (
+            StockValueKind.OHLC,
+            StockValueSerieGranularity.FINE,
+            "fmpcloud_AAPL_15min.json",
+        ),
+    ],
+)
+def test_get_stock_values_async(provider, kind, granularity, example):
+    """The async path should yield the same values as parsing the payload directly"""
+
+    async def fetch():
+        try:
+            return await provider.get_stock_values_async("AAPL", kind, granularity)
+        finally:
+            await provider.close_async()
+
+    values = asyncio.run(fetch())
+
+    payload = json.loads((examples_dir / example).read_text())
+    assert values
+    assert values == provider._as_stock_values(payload, "AAPL", kind, granularity)
+
+
+def test_many_requests_in_flight(provider):
+    tickers = [f"T{n}" for n in range(100)]
+
+    async def fetch_all():
+        try:
+            return await asyncio.gather(
+                *(
+                    provider.get_stock_values_async(
+                        t, StockValueKind.OHLC, StockValueSerieGranularity.FINE
+                    )
+                    for t in tickers
+                )
+            )
+        finally:
+            await provider.close_async()
+
+    all_values = asyncio.run(fetch_all())
+
+    assert [values[0].ticker for values in all_values] == tickers
+
+
+def test_error_response(provider):
+    async def fetch():
+        try:
+            return await provider.get_stock_values_async(
+                "AAPL", StockValueKind.SIMPLE, StockValueSerieGranularity.FINE
+            )
+        finally:
+            await provider.close_async()
+
+    with pytest.raises(TypeError):
+        asyncio.run(fetch())
+
+    async def fetch_unknown():
+        try:
+            return await provider._get_json_data_async("/unknown/AAPL")
+        finally:
+            await provider.close_async()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(fetch_unknown())
+
+
+@pytest.mark.parametrize(
+    ("kind", "granularity", "example"),
+    [
+        (
+            StockValueKind.SIMPLE,
+            StockValueSerieGranularity.COARSE,
+            "fmpcloud_AAPL_history.json",
+        ),
+        (
+            StockValueKind.OHLC,
+            StockValueSerieGranularity.FINE,
+            "fmpcloud_AAPL_15min.json",
+        ),
+    ],
+)
+def test_iter_stock_values(provider, kind, granularity, example):
+    """The streaming path should yield the same values as parsing the whole payload"""
+    values = list(provider.iter_stock_values("AAPL", kind, granularity))
+
+    payload = json.loads((examples_dir / example).read_text())
+    assert values
+    assert values == provider._as_stock_values(payload, "AAPL", kind, granularity)
+
+
+@pytest.mark.parametrize(
+    ("kind", "granularity", "body"),
+    [
+        (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE, {}),
+        (StockValueKind.OHLC, StockValueSerieGranularity.COARSE, {"symbol": "AAPL"}),
+        (
+            StockValueKind.OHLC,
+            StockValueSerieGranularity.FINE,
+            {"Error Message": "Invalid API KEY."},
+        ),
+    ],
+)
+def test_iter_unexpected_body(provider, mocker, kind, granularity, body):
+    """A response without any array of values should not look like an empty serie"""
+    response = mocker.Mock(status_code=200)
+    response.iter_content.return_value = [json.dumps(body).encode()]
+    mocker.patch.object(http_methods.session, "get", return_value=response)
+
+    with pytest.raises(ValueError):
+        list(provider.iter_stock_values("AAPL", kind, granularity))
+
+
+class TestBatchValidation:
+    series = [
+        (
+            StockValueKind.SIMPLE,
+            StockValueSerieGranularity.COARSE,
+            "fmpcloud_AAPL_history.json",
+        ),
+        (
+            StockValueKind.OHLC,
+            StockValueSerieGranularity.COARSE,
+            "fmpcloud_AAPL_history.json",
+        ),
+        (
+            StockValueKind.OHLC,
+            StockValueSerieGranularity.FINE,
+            "fmpcloud_AAPL_15min.json",
+        ),
+    ]
+
+    @pytest.fixture
+    def per_value_provider(self, provider):
+        provider.batch_validation = False
+        return provider
+
+    @pytest.fixture
+    def batch_provider(self, stand_in_url):
+        provider = FmpCloud()
+        provider.base_url = stand_in_url
+        provider.batch_validation = True
+        return provider
+
+    @pytest.mark.parametrize(("kind", "granularity", "example"), series)
+    def test_same_values(
+        self, per_value_provider, batch_provider, kind, granularity, example
+    ):
+        payload = json.loads((examples_dir / example).read_text())
+
+        expected = per_value_provider._as_stock_values(
+            payload, "AAPL", kind, granularity
+        )
+        assert expected
+        assert (
+            batch_provider._as_stock_values(payload, "AAPL", kind, granularity)
+            == expected
+        )
+
+    @pytest.mark.parametrize(("kind", "granularity", "example"), series)
+    def test_same_streamed_values(
+        self, per_value_provider, batch_provider, kind, granularity, example
+    ):
+        batch_provider.batch_size = 7
+
+        assert list(
+            batch_provider.iter_stock_values("AAPL", kind, granularity)
+        ) == list(per_value_provider.iter_stock_values("AAPL", kind, granularity))
+
+    @pytest.mark.parametrize("batch_validation", [True, False])
+    @pytest.mark.parametrize(
+        "bad_value",
+        [
+            {"date": "2023-07-05 16:00:00", "close": 1.0},
+            {"date": "not a date", "close": 1.0, "open": 1.0, "low": 1.0},
+            {"date": "2023-07-05", "close": "abc", "open": 1.0, "low": 1.0},
+            {"date": "2023-07-05", "close": 1, "open": 1, "low": 1, "volume": 1.5},
+        ],
+    )
+    def test_same_schema(self, provider, batch_validation, bad_value):
+        provider.batch_validation = batch_validation
+        value = {"high": 1.0, "volume": 10} | bad_value
+
+        with pytest.raises(ValidationError):
+            provider._as_stock_values(
+                [value], "AAPL", StockValueKind.OHLC, StockValueSerieGranularity.FINE
+            )
+
+
+def test_date_bounds():
+    path, params = FmpCloud._stock_values_request(
+        "AAPL",
+        StockValueKind.SIMPLE,
+        StockValueSerieGranularity.COARSE,
+        start=datetime(2023, 7, 3, 16),
+        end=datetime(2023, 7, 5),
+    )
+
+    assert path == "/historical-price-full/AAPL"
+    assert params == {"from": "2023-07-03", "to": "2023-07-05", "serietype": "line"}
+
+
+class TestBatch:
+    tickers = ["AAPL", "MSFT", "AMZN", "GOOG", "META", "NVDA", "TSLA"]
+
+    def test_chunks(self, provider, mocker):
+        spy = mocker.spy(provider, "_iter_json_data")
+
+        values = provider.get_stock_values_batch(
+            self.tickers, StockValueKind.OHLC, StockValueSerieGranularity.COARSE
+        )
+
+        assert [call.args[0] for call in spy.call_args_list] == [
+            "/historical-price-full/AAPL,MSFT,AMZN,GOOG,META",
+            "/historical-price-full/NVDA,TSLA",
+        ]
+        assert list(values) == self.tickers
+        assert all(v.ticker == "TSLA" for v in values["TSLA"])
+        assert values["TSLA"] == [
+            v.model_copy(update={"ticker": "TSLA"}) for v in values["AAPL"]
+        ]
+
+    def test_single_ticker(self, provider):
+        values = provider.get_stock_values_batch(
+            ["AAPL"], StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE
+        )
+
+        assert values["AAPL"] == provider.get_stock_values(
+            "AAPL", StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE
+        )
+
+    def test_intraday_not_batched(self, provider, mocker):
+        spy = mocker.spy(provider, "iter_stock_values")
+
+        values = provider.get_stock_values_batch(
+            self.tickers[:2], StockValueKind.OHLC, StockValueSerieGranularity.FINE
+        )
+
+        assert spy.call_count == 2
+        assert list(values) == self.tickers[:2]
+
+    def test_streamed_by_ticker(self, provider, mocker):
+        """Values of each ticker are yielded before those of the next tickers are
+        received"""
+        received = []
+
+        def series(*args, **kwargs):
+            for ticker in ["AAPL", "MSFT"]:
+                received.append(ticker)
+                yield {
+                    "symbol": ticker,
+                    "historical": [{"date": "2023-07-05", "close": 1.0}],
+                }
+
+        mocker.patch.object(provider, "_iter_json_data", side_effect=series)
+
+        values = provider.iter_stock_values_batch(
+            ["AAPL", "MSFT"], StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE
+        )
+
+        ticker, _ = next(values)
+        assert ticker == "AAPL" and received == ["AAPL"]
+        assert [t for (t, _) in values] == ["MSFT"]
+
+    def test_unknown_ticker(self, provider, mocker):
+        mocker.patch.object(provider, "_iter_json_data", return_value=iter([{}]))
+
+        values = provider.get_stock_values_batch(
+            ["XXXX", "YYYY"], StockValueKind.OHLC, StockValueSerieGranularity.COARSE
+        )
+
+        assert values == {"XXXX": [], "YYYY": []}
+
+    def test_error_response(self, provider, mocker):
+        response = mocker.Mock(status_code=200)
+        response.iter_content.return_value = [b'{"Error Message": "Limit reached"}']
+        mocker.patch.object(http_methods.session, "get", return_value=response)
+
+        with pytest.raises(ValueError):
+            provider.get_stock_values_batch(
+                ["AAPL", "MSFT"],
+                StockValueKind.OHLC,
+                StockValueSerieGranularity.COARSE,
+            )
+
+
+def test_cache_expiration(provider, mocker):
+    assert provider._expire_after("/profile/AAPL,MSFT") == provider.profile_expiry
+    assert provider._expire_after("/historical-chart/15min/AAPL") == (
+        provider.intraday_expiry
+    )
+
+    expiry = provider._expire_after("/historical-price-full/AAPL")
+    # One hour after the close, possibly an early one
+    assert expiry.time() in {time(17), time(14)}
+    assert expiry > datetime.now(expiry.tzinfo)
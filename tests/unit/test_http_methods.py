@@ -0,0 +1,271 @@
+import json
+import threading
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from opa import http_methods
+from opa.http_methods import (
+    TokenBucket,
+    retry_delay,
+    get_json_data,
+    iter_json_array_items,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucket:
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+
+    @pytest.fixture
+    def bucket(self, clock):
+        return TokenBucket(rate=2.0, capacity=4.0, clock=clock)
+
+    def test_burst(self, bucket):
+        assert [bucket.reserve() for _ in range(4)] == [0.0] * 4
+
+    def test_throttled_after_burst(self, bucket):
+        for _ in range(4):
+            bucket.reserve()
+
+        assert [bucket.reserve() for _ in range(3)] == [0.5, 1.0, 1.5]
+
+    def test_refill(self, bucket, clock):
+        for _ in range(4):
+            bucket.reserve()
+
+        clock.now += 1.0
+        assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.5]
+
+    def test_refill_does_not_exceed_capacity(self, bucket, clock):
+        clock.now += 100.0
+        assert [bucket.reserve() for _ in range(5)] == [0.0] * 4 + [0.5]
+
+    def test_pause(self, bucket, clock):
+        bucket.pause(10.0)
+        assert bucket.reserve() == 10.5
+
+        clock.now += 11.0
+        assert bucket.reserve() == 0.0
+
+
+class TestRetryDelay:
+    def test_retry_after_seconds(self):
+        assert retry_delay(1, "12") == 12.0
+
+    def test_retry_after_negative_seconds(self):
+        assert retry_delay(1, "-5") == 0.0
+
+    def test_retry_after_date(self):
+        date = datetime.now(timezone.utc) + timedelta(seconds=30)
+        assert 25.0 < retry_delay(1, format_datetime(date, usegmt=True)) <= 30.0
+
+    @pytest.mark.parametrize("attempt", range(1, 10))
+    def test_backoff(self, attempt):
+        max_delay = min(
+            http_methods.settings.http_backoff_max,
+            http_methods.settings.http_backoff_base * 2 ** (attempt - 1),
+        )
+        assert 0.0 <= retry_delay(attempt, "not-a-date") <= max_delay
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers={}):
+        self.status_code = status_code
+        self.headers = headers
+        self.url = "https://fmpcloud.io/api/v3/path"
+
+    def json(self):
+        return {"status": self.status_code}
+
+    def close(self):
+        ...
+
+
+class TestGetJsonData:
+    @pytest.fixture(autouse=True)
+    def sleep(self, mocker):
+        return mocker.patch("opa.http_methods.time.sleep")
+
+    @pytest.fixture
+    def get(self, mocker):
+        return mocker.patch.object(http_methods.session, "get")
+
+    def test_retries_until_success(self, get, sleep):
+        get.side_effect = [
+            FakeResponse(503),
+            FakeResponse(429, {"Retry-After": "7"}),
+            FakeResponse(200),
+        ]
+
+        assert get_json_data("https://fmpcloud.io/api/v3/path") == {"status": 200}
+        assert get.call_count == 3
+        assert 7.0 in [c.args[0] for c in sleep.call_args_list]
+
+    def test_gives_up(self, get):
+        get.return_value = FakeResponse(500)
+
+        with pytest.raises(RuntimeError):
+            get_json_data("https://fmpcloud.io/api/v3/path")
+
+        assert get.call_count == http_methods.settings.http_max_retries + 1
+
+    def test_does_not_retry_client_errors(self, get):
+        get.return_value = FakeResponse(404)
+
+        with pytest.raises(RuntimeError):
+            get_json_data("https://fmpcloud.io/api/v3/path")
+
+        assert get.call_count == 1
+
+
+class TestCache:
+    class ValidatingHandler(BaseHTTPRequestHandler):
+        """Serves a constant body with an ETag, and counts the full responses sent"""
+
+        nb_full_responses = 0
+
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == '"v1"':
+                self.send_response(304)
+                self.send_header("ETag", '"v1"')
+                self.end_headers()
+                return
+
+            type(self).nb_full_responses += 1
+            body = b'{"value": 1}'
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("ETag", '"v1"')
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            ...
+
+    @pytest.fixture
+    def url(self):
+        self.ValidatingHandler.nb_full_responses = 0
+        server = ThreadingHTTPServer(("127.0.0.1", 0), self.ValidatingHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        host, port = server.server_address
+        yield f"http://{host}:{port}/profile/AAPL"
+
+        server.shutdown()
+        server.server_close()
+
+    @pytest.fixture
+    def cached_session(self, mocker, tmp_path):
+        http_methods.settings.set("use_http_cache", True)
+        http_methods.settings.set("http_cache_dir", str(tmp_path))
+        try:
+            session = http_methods.get_session()
+        finally:
+            http_methods.settings.set("use_http_cache", False)
+
+        mocker.patch.object(http_methods, "session", session)
+        return session
+
+    def test_expiration_by_request(self, cached_session, url):
+        get_json_data(url, expire_after=timedelta(hours=1))
+        get_json_data(url, expire_after=timedelta(hours=1))
+
+        assert self.ValidatingHandler.nb_full_responses == 1
+        assert cached_session.cache.responses.wal
+
+    def test_revalidation(self, cached_session, url):
+        # Expired as soon as it is stored
+        assert get_json_data(url, expire_after=timedelta(0)) == {"value": 1}
+        assert get_json_data(url, expire_after=timedelta(0)) == {"value": 1}
+
+        assert self.ValidatingHandler.nb_full_responses == 1
+
+    def test_no_cache(self, get_mock):
+        """Without cache, the expiration is not passed on to the session"""
+        get_json_data("https://fmpcloud.io/api/v3/path", expire_after=timedelta(0))
+
+        assert "expire_after" not in get_mock.call_args.kwargs
+
+    @pytest.fixture
+    def get_mock(self, mocker):
+        return mocker.patch.object(
+            http_methods.session, "get", return_value=FakeResponse(200)
+        )
+
+
+def as_chunks(data: bytes, size: int):
+    return (data[i : i + size] for i in range(0, len(data), size))
+
+
+class TestIterJsonArrayItems:
+    examples_dir = Path(__file__).parents[2] / "data" / "examples"
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 4096, 1_000_000])
+    def test_coarse_payload(self, chunk_size):
+        data = (self.examples_dir / "fmpcloud_AAPL_history.json").read_bytes()
+
+        items = list(
+            iter_json_array_items(as_chunks(data, chunk_size), ("historical",))
+        )
+        assert items == json.loads(data)["historical"]
+
+    @pytest.mark.parametrize("chunk_size", [1, 7, 4096, 1_000_000])
+    def test_fine_payload(self, chunk_size):
+        data = (self.examples_dir / "fmpcloud_AAPL_15min.json").read_bytes()
+
+        items = list(iter_json_array_items(as_chunks(data, chunk_size)))
+        assert items == json.loads(data)
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 3, 100])
+    def test_tricky_strings(self, chunk_size):
+        expected = [
+            {"label": 'a "quoted" {brace} [bracket]', "nested": [{"a": 1}]},
+            {"label": "back\\slash\\", "other": '\\"}'},
+            {},
+        ]
+        data = json.dumps(
+            {
+                "s": "[{",
+                "before": [{"a": 1}],
+                '"items\\"': [{"b": 2}],
+                "items": expected,
+                "after": [1, 2],
+            }
+        ).encode()
+
+        items = list(iter_json_array_items(as_chunks(data, chunk_size), ("items",)))
+        assert items == expected
+
+    @pytest.mark.parametrize("chunk_size", [1, 5, 100])
+    def test_nested_path(self, chunk_size):
+        series = [{"symbol": "AAPL", "historical": [{"a": 1}]}, {}]
+        data = json.dumps({"historicalStockList": series}).encode()
+
+        path = ("historicalStockList",)
+        assert list(iter_json_array_items(as_chunks(data, chunk_size), path)) == series
+        assert list(iter_json_array_items([b'{"historicalStockList": []}'], path)) == []
+
+    @pytest.mark.parametrize(
+        "data", [b'{"Error Message": "[{"}', b"{}", b'{"historical": {"a": [{}]}}']
+    )
+    def test_no_array(self, data):
+        with pytest.raises(ValueError):
+            list(iter_json_array_items([data], ("historical",)))
+
+    def test_not_an_array(self):
+        with pytest.raises(ValueError):
+            list(iter_json_array_items([b'{"Error Message": "[{"}']))
@@ -0,0 +1,124 @@
+from datetime import date, datetime
+import json
+from pathlib import Path
+
+import pytest
+
+from opa.core import FinancialDataReader, StockValueKind, StockValueSerieGranularity
+from opa.providers import FmpCloud, ReplayProvider, SyntheticProvider, synthetic_tickers
+
+
+examples_dir = Path(__file__).parents[2] / "data" / "examples"
+
+series = [
+    (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE),
+    (StockValueKind.OHLC, StockValueSerieGranularity.COARSE),
+    (StockValueKind.OHLC, StockValueSerieGranularity.FINE),
+]
+
+
+@pytest.mark.parametrize(("kind", "granularity"), series)
+def test_replay(kind, granularity):
+    provider = ReplayProvider(examples_dir)
+    file = provider.payloads[granularity]
+
+    values = provider.get_stock_values("MSFT", kind, granularity)
+
+    expected = FmpCloud._rows_as_stock_values(
+        FmpCloud._as_validated_rows(
+            json.loads((examples_dir / file).read_text()),
+            kind,
+            granularity,
+        ),
+        "MSFT",
+        kind,
+        granularity,
+    )
+    assert values == expected
+
+
+def test_replay_bounds():
+    provider = ReplayProvider(examples_dir)
+
+    values = provider.get_stock_values(
+        "MSFT",
+        StockValueKind.OHLC,
+        StockValueSerieGranularity.FINE,
+        start=datetime(2023, 7, 5),
+    )
+
+    assert values
+    assert all(v.date >= datetime(2023, 7, 5) for v in values)
+
+
+class TestSynthetic:
+    @pytest.fixture
+    def provider(self):
+        return SyntheticProvider(nb_years=2, end=date(2023, 7, 7))
+
+    @pytest.mark.parametrize(("kind", "granularity"), series)
+    def test_deterministic(self, provider, kind, granularity):
+        values = provider.get_stock_values("AAPL", kind, granularity)
+        other = SyntheticProvider(nb_years=2, end=date(2023, 7, 7))
+
+        assert values == other.get_stock_values("AAPL", kind, granularity)
+        assert values != provider.get_stock_values("MSFT", kind, granularity)
+        assert all(v.kind == kind for v in values)
+
+    def test_daily_values(self, provider):
+        values = provider.get_stock_values(
+            "AAPL", StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE
+        )
+
+        # About 252 trading days per year
+        assert 500 <= len(values) <= 505
+        assert values[0].date == datetime(2023, 7, 7, 16)
+        assert datetime(2023, 7, 4, 16) not in {v.date for v in values}
+
+    def test_intraday_values(self, provider):
+        values = provider.get_stock_values(
+            "AAPL", StockValueKind.OHLC, StockValueSerieGranularity.FINE
+        )
+
+        days = {v.date.date() for v in values}
+        assert len(days) == 20
+        # Early close before Independence Day
+        assert max(v.date for v in values if v.date.date() == date(2023, 7, 3)) == (
+            datetime(2023, 7, 3, 13)
+        )
+        assert values[0].date == datetime(2023, 7, 7, 16)
+        assert all(v.low <= min(v.open, v.close) for v in values)
+        assert all(v.high >= max(v.open, v.close) for v in values)
+
+
+def test_error_injection():
+    provider = SyntheticProvider(nb_years=1, error_rate=0.5, seed=1)
+
+    def nb_failures():
+        failures = 0
+        for _ in range(100):
+            try:
+                provider.get_company_info(["AAPL"])
+            except RuntimeError:
+                failures += 1
+        return failures
+
+    failures = nb_failures()
+    assert 30 < failures < 70
+
+    provider = SyntheticProvider(nb_years=1, error_rate=0.5, seed=1)
+    assert nb_failures() == failures
+
+
+def test_offline_ingestion(mocker):
+    storage = mocker.Mock()
+    storage.get_stats.return_value = {}
+    tickers = synthetic_tickers(50)
+    reader = FinancialDataReader(SyntheticProvider(nb_years=1), storage, max_workers=4)
+
+    reader.run(tickers)
+
+    inserted = {
+        v.ticker for args in storage.insert_values.call_args_list for v in args.args[0]
+    }
+    assert inserted == set(tickers)
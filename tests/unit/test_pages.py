@@ -0,0 +1,64 @@
+import base64
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from opa.core import StockValue, page_cursor
+from opa.core.storage import DateBounds, parse_page_cursor
+
+
+def test_cursor(stock_values_serie):
+    value = stock_values_serie[3]
+
+    assert parse_page_cursor(page_cursor(value)) == (value.date, value.interval)
+
+
+@pytest.mark.parametrize(
+    "cursor", ["invalid", "", base64.urlsafe_b64encode(b'["2023-07-05"]').decode()]
+)
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        parse_page_cursor(cursor)
+
+
+class TestDateBounds:
+    date = datetime(2023, 7, 5, 10)
+    cursor = page_cursor(
+        StockValue(ticker="MSFT", date=date, close=1.0, interval=15 * 60)
+    )
+
+    def test_range(self):
+        bounds = DateBounds.of_page(60, start=datetime(2023, 7, 5), end=self.date)
+
+        assert self.date in bounds
+        assert datetime(2023, 7, 5) in bounds
+        assert datetime(2023, 7, 4, 23) not in bounds
+        assert datetime(2023, 7, 5, 10, 1) not in bounds
+
+    def test_cursor_interval(self):
+        """Values at the date of the cursor follow it only if their interval is
+        smaller"""
+        assert self.date in DateBounds.of_page(60, cursor=self.cursor)
+        assert self.date not in DateBounds.of_page(15 * 60, cursor=self.cursor)
+        assert self.date not in DateBounds.of_page(24 * 60 * 60, cursor=self.cursor)
+
+    def test_cursor_end(self):
+        """The end of the range should be kept when the cursor is after it"""
+        end = datetime(2023, 7, 5, 9)
+
+        assert DateBounds.of_page(60, end=end, cursor=self.cursor).end == end
+
+    def test_aware_dates(self):
+        """Dates with a time zone should bound the dates of the values, which are naive
+        UTC ones"""
+        paris = timezone(timedelta(hours=2))
+        bounds = DateBounds.of_page(
+            60,
+            start=datetime(2023, 7, 5, 2, tzinfo=paris),
+            end=datetime(2023, 7, 5, 12, tzinfo=paris),
+            cursor=self.cursor,
+        )
+
+        assert bounds == DateBounds(datetime(2023, 7, 5), self.date)
+        assert datetime(2023, 7, 5) in bounds
+        assert datetime(2023, 7, 4, 23) not in bounds
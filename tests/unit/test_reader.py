@@ -1,11 +1,18 @@
+from datetime import date, datetime, time
+
 import pytest
 
 from opa.core import (
     FinancialDataReader,
+    ImportCheckpoint,
     Storage,
     StockMarketProvider,
     StockCollectionStats,
+    StockValueKind,
+    StockValueSerieGranularity,
+    StockValue,
 )
+from opa.core.calendar import trading_days
 from tests.fixtures import fake_ticker
 
 
@@ -28,10 +35,14 @@ def storage(mocker):
     for method in [
         "insert_values",
         "get_values",
+        "get_dates",
         "get_all_tickers",
         "insert_company_infos",
         "get_company_infos",
         "get_stats",
+        "insert_checkpoints",
+        "get_checkpoints",
+        "delete_checkpoints",
     ]:
         mocker.patch.object(storage, method, autospec=True)
 
@@ -137,3 +148,423 @@ class TestImportStockValues:
         assert sorted(tickers) == sorted(called_tickers)
 
         storage_with_all_data.insert_values.assert_not_called()
+
+    def test_only_new_values_fetched(
+        self,
+        tickers,
+        provider_for_stock_values,
+        storage_with_all_data,
+        reader,
+        stock_value_kind,
+        stock_value_serie_granularity,
+        stock_values_serie,
+    ):
+        """Values are requested from the date of the latest value stored"""
+        reader.import_stock_values(
+            tickers, stock_value_kind, stock_value_serie_granularity
+        )
+
+        latest = max((v.date for v in stock_values_serie))
+        for args in provider_for_stock_values.get_stock_values.call_args_list:
+            assert args.kwargs["start"] == latest
+
+    def test_everything_fetched_for_new_tickers(
+        self,
+        tickers,
+        provider_for_stock_values,
+        storage_empty,
+        reader,
+        stock_value_kind,
+        stock_value_serie_granularity,
+    ):
+        reader.import_stock_values(
+            tickers, stock_value_kind, stock_value_serie_granularity
+        )
+
+        for args in provider_for_stock_values.get_stock_values.call_args_list:
+            assert args.kwargs["start"] is None
+
+
+class TestRun:
+    @pytest.fixture
+    def tickers(self):
+        return [fake_ticker() for _ in range(5)]
+
+    @pytest.fixture
+    def concurrent_reader(self, provider, storage):
+        storage.get_stats.return_value = {}
+        return FinancialDataReader(provider, storage, max_workers=4)
+
+    def test_fetches_all_series(self, concurrent_reader, provider, tickers):
+        concurrent_reader.run(tickers)
+
+        called = sorted(
+            (args.args[0], args.args[1].value, args.args[2].value)
+            for args in provider.get_stock_values.call_args_list
+        )
+        expected = sorted(
+            (t, kind.value, granularity.value)
+            for t in tickers
+            for (kind, granularity) in [
+                (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE),
+                (StockValueKind.OHLC, StockValueSerieGranularity.FINE),
+                (StockValueKind.OHLC, StockValueSerieGranularity.COARSE),
+            ]
+        )
+        assert called == expected
+
+    def test_starts_of_each_serie(self, concurrent_reader, provider, storage, tickers):
+        """Values of a serie are requested from the latest value of that serie, whatever
+        the values stored for the other series of the same kind"""
+        latest = datetime(2023, 7, 5, 15, 45)
+        fine = StockValueSerieGranularity.FINE
+        storage.get_stats.side_effect = lambda kind, interval=None: (
+            {
+                t: StockCollectionStats(latest=latest, oldest=latest, count=1)
+                for t in tickers
+            }
+            if interval == fine.interval
+            else {}
+        )
+
+        concurrent_reader.run(tickers)
+
+        for args in provider.get_stock_values.call_args_list:
+            expected = latest if args.args[2] == fine else None
+            assert args.kwargs["start"] == expected
+
+    def test_values_filtered_on_their_serie(
+        self, concurrent_reader, provider, storage, tickers
+    ):
+        """Values are only discarded if they are in the time range of the values
+        stored for their own serie"""
+        fine = StockValueSerieGranularity.FINE
+        storage.get_stats.side_effect = lambda kind, interval=None: (
+            {
+                t: StockCollectionStats(
+                    latest=datetime(2023, 7, 31), oldest=datetime(2023, 7, 1), count=1
+                )
+                for t in tickers
+            }
+            if interval == fine.interval
+            else {}
+        )
+        provider.get_stock_values.side_effect = lambda ticker, *args, **kwargs: [
+            StockValue(
+                ticker=ticker,
+                date=datetime(2023, 7, 5),
+                close=1.0,
+                open=1.0,
+                low=1.0,
+                high=1.0,
+                volume=1,
+                interval=24 * 60 * 60,
+            )
+        ]
+
+        concurrent_reader.import_stock_values(
+            tickers, StockValueKind.OHLC, StockValueSerieGranularity.COARSE
+        )
+
+        storage.get_stats.assert_called_with(StockValueKind.OHLC, 24 * 60 * 60)
+        inserted = storage.insert_values.call_args.args[0]
+        assert sorted(v.ticker for v in inserted) == sorted(tickers)
+
+    def test_fine_values_stored_first(
+        self, concurrent_reader, provider, storage, tickers
+    ):
+        """Fine-grained OHLC values must be stored before coarse-grained ones, whatever
+        the order in which the provider's responses arrive"""
+
+        def get_stock_values(ticker, kind, granularity, start=None, end=None):
+            return [(ticker, kind, granularity)]
+
+        provider.get_stock_values.side_effect = get_stock_values
+
+        concurrent_reader.run(tickers)
+
+        stored_series = [
+            {v[1:] for v in args.args[0]}
+            for args in storage.insert_values.call_args_list
+        ]
+        assert stored_series == [
+            {(StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE)},
+            {(StockValueKind.OHLC, StockValueSerieGranularity.FINE)},
+            {(StockValueKind.OHLC, StockValueSerieGranularity.COARSE)},
+        ]
+
+
+class TestPipeline:
+    @pytest.fixture
+    def tickers(self):
+        return [fake_ticker() for _ in range(20)]
+
+    @pytest.fixture
+    def pipeline_reader(self, provider, storage):
+        storage.get_stats.return_value = {}
+        return FinancialDataReader(
+            provider, storage, max_workers=4, batch_size=30, max_pending_batches=1
+        )
+
+    def test_bounded_batches(
+        self,
+        tickers,
+        provider,
+        storage,
+        pipeline_reader,
+        stock_value_kind,
+        stock_value_serie_granularity,
+        stock_values_serie,
+    ):
+        provider.get_stock_values.return_value = stock_values_serie
+
+        nb_inserted = pipeline_reader.import_stock_values(
+            tickers, stock_value_kind, stock_value_serie_granularity
+        )
+
+        inserted = [
+            v for args in storage.insert_values.call_args_list for v in args.args[0]
+        ]
+        assert nb_inserted == len(inserted) == len(tickers) * len(stock_values_serie)
+        assert all(
+            len(args.args[0]) < 2 * 30 for args in storage.insert_values.call_args_list
+        )
+
+    def test_fetch_error(self, tickers, provider, storage, pipeline_reader):
+        provider.get_stock_values.side_effect = RuntimeError("provider failure")
+
+        with pytest.raises(RuntimeError, match="provider failure"):
+            pipeline_reader.run(tickers)
+
+    def test_storage_error(
+        self, tickers, provider, storage, pipeline_reader, stock_values_serie
+    ):
+        """Producers waiting for room in the queue should not block forever if the
+        values cannot be stored"""
+        provider.get_stock_values.return_value = stock_values_serie
+        storage.insert_values.side_effect = RuntimeError("storage failure")
+
+        with pytest.raises(RuntimeError, match="storage failure"):
+            pipeline_reader.run(tickers)
+
+
+class TestBatchRequests:
+    @pytest.fixture
+    def tickers(self):
+        return [fake_ticker() for _ in range(7)]
+
+    @pytest.fixture
+    def batch_provider(self, mocker, provider, stock_values_serie):
+        mocker.patch.object(provider, "max_tickers_per_request", return_value=3)
+        provider.get_stock_values.return_value = stock_values_serie
+        mocker.patch.object(
+            provider,
+            "get_stock_values_batch",
+            autospec=True,
+            side_effect=lambda tickers, *args, **kwargs: {
+                t: stock_values_serie for t in tickers
+            },
+        )
+        return provider
+
+    def test_batches(
+        self,
+        tickers,
+        batch_provider,
+        storage,
+        stock_value_kind,
+        stock_value_serie_granularity,
+        stock_values_serie,
+    ):
+        storage.get_stats.return_value = {}
+        reader = FinancialDataReader(batch_provider, storage, max_workers=2)
+
+        nb_inserted = reader.import_stock_values(
+            tickers, stock_value_kind, stock_value_serie_granularity
+        )
+
+        # A chunk of a single ticker is streamed
+        requested = [
+            args.args[0]
+            for args in batch_provider.get_stock_values_batch.call_args_list
+        ] + [[args.args[0]] for args in batch_provider.get_stock_values.call_args_list]
+        assert sorted(len(chunk) for chunk in requested) == [1, 3, 3]
+        assert sorted(t for chunk in requested for t in chunk) == sorted(tickers)
+        assert nb_inserted == len(tickers) * len(stock_values_serie)
+
+    def test_chunks_grouped_by_start(self, reader, tickers, batch_provider, storage):
+        starts = {
+            t: datetime(2023, 7, day)
+            for t, day in zip(tickers, [3, 7, 5, 6, 4, 11, 10])
+        }
+
+        chunks = reader._chunks(
+            tickers, (StockValueKind.OHLC, StockValueSerieGranularity.COARSE), starts
+        )
+
+        assert [[starts[t].day for t in chunk] for chunk in chunks] == [
+            [3, 4, 5],
+            [6, 7, 10],
+            [11],
+        ]
+        assert reader._chunk_start(chunks[1], starts) == datetime(2023, 7, 6)
+
+        # Values of tickers not stored yet are all requested
+        del starts[chunks[1][0]]
+        assert reader._chunk_start(chunks[1], starts) is None
+
+
+class TestCheckpoints:
+    series = [
+        (StockValueKind.SIMPLE, StockValueSerieGranularity.COARSE),
+        (StockValueKind.OHLC, StockValueSerieGranularity.FINE),
+        (StockValueKind.OHLC, StockValueSerieGranularity.COARSE),
+    ]
+
+    @pytest.fixture
+    def tickers(self):
+        return [fake_ticker() for _ in range(5)]
+
+    @pytest.fixture
+    def checkpoint_reader(self, provider, storage, stock_values_serie):
+        storage.get_stats.return_value = {}
+        storage.get_checkpoints.return_value = []
+        provider.get_stock_values.return_value = stock_values_serie
+        return FinancialDataReader(provider, storage, max_workers=2, batch_size=30)
+
+    @staticmethod
+    def saved(storage) -> set[tuple]:
+        return {
+            (c.ticker, c.kind, c.granularity)
+            for args in storage.insert_checkpoints.call_args_list
+            for c in args.args[0]
+        }
+
+    def test_checkpoints(self, tickers, storage, checkpoint_reader):
+        checkpoint_reader.run(tickers, run_id="run")
+
+        assert self.saved(storage) == {
+            (t, *serie) for t in tickers for serie in self.series
+        }
+        storage.delete_checkpoints.assert_called_once_with("run")
+
+    def test_no_run_id(self, tickers, storage, checkpoint_reader):
+        checkpoint_reader.run(tickers)
+
+        storage.get_checkpoints.assert_not_called()
+        storage.insert_checkpoints.assert_not_called()
+        storage.delete_checkpoints.assert_not_called()
+
+    def test_resume(self, tickers, provider, storage, checkpoint_reader):
+        done = (StockValueKind.OHLC, StockValueSerieGranularity.FINE)
+        storage.get_checkpoints.return_value = [
+            ImportCheckpoint(run_id="run", ticker=t, kind=done[0], granularity=done[1])
+            for t in tickers[:3]
+        ]
+
+        checkpoint_reader.run(tickers, run_id="run")
+
+        requested = {args.args for args in provider.get_stock_values.call_args_list}
+        assert requested == {
+            (t, *serie)
+            for t in tickers
+            for serie in self.series
+            if (t, *serie) not in {(t, *done) for t in tickers[:3]}
+        }
+
+    def test_failed_serie(self, tickers, provider, storage, checkpoint_reader):
+        """Only the series whose values were all stored are recorded, and the
+        checkpoints of a failed run are kept"""
+        failing = tickers[0]
+        values = provider.get_stock_values.return_value
+
+        def get_stock_values(ticker, kind, granularity, **kwargs):
+            if ticker == failing and kind == StockValueKind.OHLC:
+                raise RuntimeError("provider failure")
+            return values
+
+        provider.get_stock_values.side_effect = get_stock_values
+
+        with pytest.raises(RuntimeError, match="provider failure"):
+            checkpoint_reader.run(tickers, run_id="run")
+
+        assert self.saved(storage) == {
+            (t, *serie)
+            for t in tickers
+            for serie in self.series
+            if t != failing or serie[0] == StockValueKind.SIMPLE
+        }
+        storage.delete_checkpoints.assert_not_called()
+
+
+class TestBackfill:
+    @pytest.fixture
+    def stored_days(self):
+        # Values are missing on 2023-07-06 and 2023-07-10
+        return [date(2023, 7, 3), date(2023, 7, 5), date(2023, 7, 7), date(2023, 7, 11)]
+
+    @pytest.fixture
+    def storage_with_gaps(self, storage, stored_days):
+        storage.get_dates.return_value = [
+            datetime.combine(d, time(16)) for d in stored_days
+        ]
+        return storage
+
+    @pytest.fixture
+    def provider_for_all_days(self, provider):
+        def get_stock_values(ticker, kind, granularity, start=None, end=None):
+            # More values than requested are returned
+            return [
+                StockValue(
+                    ticker=ticker,
+                    date=datetime.combine(d, time(16)),
+                    close=1.0,
+                    interval=24 * 60 * 60,
+                )
+                for d in trading_days(date(2023, 7, 1), date(2023, 7, 14))
+            ]
+
+        provider.get_stock_values.side_effect = get_stock_values
+        return provider
+
+    def test_only_gaps_fetched(self, provider_for_all_days, storage_with_gaps, reader):
+        ticker = fake_ticker()
+        reader.backfill(
+            [ticker],
+            StockValueKind.SIMPLE,
+            StockValueSerieGranularity.COARSE,
+            date(2023, 7, 3),
+            date(2023, 7, 11),
+        )
+
+        requested = sorted(
+            (args.kwargs["start"].date(), args.kwargs["end"].date())
+            for args in provider_for_all_days.get_stock_values.call_args_list
+        )
+        assert requested == [
+            (date(2023, 7, 6), date(2023, 7, 6)),
+            (date(2023, 7, 10), date(2023, 7, 10)),
+        ]
+
+        inserted = storage_with_gaps.insert_values.call_args.args[0]
+        assert sorted(v.date.date() for v in inserted) == [
+            date(2023, 7, 6),
+            date(2023, 7, 10),
+        ]
+
+        # Days that only have values of another serie are not covered
+        storage_with_gaps.get_dates.assert_called_once_with(
+            ticker, StockValueKind.SIMPLE, 24 * 60 * 60
+        )
+
+    def test_nothing_missing(self, provider_for_all_days, storage_with_gaps, reader):
+        reader.backfill(
+            [fake_ticker()],
+            StockValueKind.SIMPLE,
+            StockValueSerieGranularity.COARSE,
+            date(2023, 7, 3),
+            date(2023, 7, 5),
+        )
+
+        provider_for_all_days.get_stock_values.assert_not_called()
+        storage_with_gaps.insert_values.assert_not_called()
@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from opa.core import FinancialDataReader, StockValueKind, StockValueSerieGranularity
+from opa.core.calendar import market_timezone
+from opa.core.scheduler import IngestionScheduler, ScheduledImport
+
+
+def market_time(*args):
+    return datetime(*args, tzinfo=market_timezone)
+
+
+class FakeClock:
+    def __init__(self, now: datetime):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += timedelta(seconds=seconds)
+
+
+@pytest.fixture
+def reader(mocker):
+    reader = mocker.create_autospec(FinancialDataReader, instance=True)
+    reader.provider = mocker.Mock(daily_publication_delay=timedelta(hours=1))
+    return reader
+
+
+@pytest.fixture
+def scheduler(reader):
+    return IngestionScheduler(reader, ["AAPL", "MSFT"])
+
+
+class TestNextImport:
+    @pytest.mark.parametrize(
+        ("now", "expected"),
+        [
+            # Before the opening
+            (
+                market_time(2023, 7, 6, 8),
+                (market_time(2023, 7, 6, 9, 46), ScheduledImport.INTRADAY),
+            ),
+            # During the session
+            (
+                market_time(2023, 7, 6, 9, 46),
+                (market_time(2023, 7, 6, 10, 1), ScheduledImport.INTRADAY),
+            ),
+            (
+                market_time(2023, 7, 6, 15, 50),
+                (market_time(2023, 7, 6, 17), ScheduledImport.END_OF_DAY),
+            ),
+            # Once the daily values are published
+            (
+                market_time(2023, 7, 6, 16, 1),
+                (market_time(2023, 7, 6, 17), ScheduledImport.END_OF_DAY),
+            ),
+            # After the close on Friday: wait for Monday
+            (
+                market_time(2023, 7, 7, 17),
+                (market_time(2023, 7, 10, 9, 46), ScheduledImport.INTRADAY),
+            ),
+            # Before Independence Day
+            (
+                market_time(2023, 7, 3, 12, 55),
+                (market_time(2023, 7, 3, 14), ScheduledImport.END_OF_DAY),
+            ),
+            (
+                market_time(2023, 7, 3, 14),
+                (market_time(2023, 7, 5, 9, 46), ScheduledImport.INTRADAY),
+            ),
+        ],
+    )
+    def test_next_import(self, scheduler, now, expected):
+        assert scheduler.next_import(now) == expected
+
+    def test_other_timezone(self, scheduler):
+        now = datetime.fromisoformat("2023-07-06T20:50:00+01:00")
+
+        assert scheduler.next_import(now) == (
+            market_time(2023, 7, 6, 17),
+            ScheduledImport.END_OF_DAY,
+        )
+
+    def test_provider_delay(self, reader):
+        reader.provider.daily_publication_delay = timedelta(minutes=30)
+        scheduler = IngestionScheduler(reader, ["AAPL"])
+
+        assert scheduler.next_import(market_time(2023, 7, 6, 15, 50)) == (
+            market_time(2023, 7, 6, 16, 30),
+            ScheduledImport.END_OF_DAY,
+        )
+
+
+class TestRun:
+    def test_imports(self, reader, scheduler):
+        clock = FakeClock(market_time(2023, 7, 7, 15, 40))
+        scheduler.clock, scheduler.sleep = clock, clock.sleep
+
+        scheduler.run(nb_imports=3)
+
+        assert clock.now == market_time(2023, 7, 10, 9, 46)
+        assert reader.import_stock_values.call_count == 2
+        reader.import_stock_values.assert_called_with(
+            ["AAPL", "MSFT"], StockValueKind.OHLC, StockValueSerieGranularity.FINE
+        )
+        reader.run.assert_called_once_with(["AAPL", "MSFT"])
+
+    def test_failed_import(self, reader, scheduler):
+        """An import error does not stop the scheduler"""
+        clock = FakeClock(market_time(2023, 7, 7, 15, 40))
+        scheduler.clock, scheduler.sleep = clock, clock.sleep
+        reader.import_stock_values.side_effect = RuntimeError
+
+        scheduler.run(nb_imports=2)
+
+        assert reader.import_stock_values.call_count == 1
+        reader.run.assert_called_once()